@@ -0,0 +1,685 @@
+import math
+import time
+import numpy as np
+import fsm
+import gobjs
+import sim
+
+YELLOW = 0
+BLUE = 1
+RED = 2
+
+DRAW = 0
+PLAYER = 1
+AI = 2
+WINNERS = ("Draw", "Player", "AI")
+
+# Red's last_bounce strings as small integer codes.
+NO_BOUNCE = 0
+LEFT = 1
+RIGHT = 2
+TOP = 3
+BOTTOM = 4
+
+TAU = 2 * math.pi
+
+
+def wrap_angle(angle):
+    # (angle + pi) % tau - pi without np.remainder, which is several times
+    # slower than floor on arrays.
+    return angle - TAU * np.floor((angle + math.pi) / TAU)
+
+
+# Vectorized versions of the GObj/Enemy math. Every argument may be a scalar
+# or an array; the shapes broadcast the same way numpy does.
+def move(x, y, heading, speed, dt, direction, cos_h=None, sin_h=None):
+    # cos_h and sin_h are the heading's, when the caller already has them.
+    if cos_h is None:
+        cos_h = np.cos(heading)
+        sin_h = np.sin(heading)
+    step = direction * speed * dt
+    return x + step * cos_h, y + step * sin_h
+
+
+def turn(heading, turn_rate, dt, direction):
+    return heading + direction * turn_rate * dt
+
+
+def check_collision(x0, y0, r0, x1, y1, r1):
+    dx = x1 - x0
+    dy = y1 - y0
+    rr = r0 + r1
+    return dx * dx + dy * dy < rr * rr
+
+
+def swept_collision(x0, y0, x1, y1, r0, cx, cy, r1):
+    # check_collision anywhere along a move from (x0, y0) to (x1, y1).
+    # Works in place on its temporaries; with no move t stays 0.
+    dx = np.subtract(x1, x0)
+    dy = np.subtract(y1, y0)
+    fx = np.subtract(cx, x0)
+    fy = np.subtract(cy, y0)
+    d2 = dx * dx
+    d2 += dy * dy
+    t = fx * dx
+    t += fy * dy
+    np.divide(t, d2, out=t, where=d2 > 0)
+    np.clip(t, 0.0, 1.0, out=t)
+    fx -= t * dx
+    fy -= t * dy
+    fx *= fx
+    fy *= fy
+    fx += fy
+    rr = r0 + r1
+    return fx < rr * rr
+
+
+def swept_contact(x0, y0, x1, y1, r0, cx, cy, r1):
+    # GObj.swept_contact: the fraction of the move at which it first
+    # touches (cx, cy), inf where swept_collision is False.
+    dx = x1 - x0
+    dy = y1 - y0
+    fx = cx - x0
+    fy = cy - y0
+    rr = r0 + r1
+    c = fx * fx + fy * fy - rr * rr
+    b = fx * dx + fy * dy
+    d2 = dx * dx + dy * dy
+    disc = b * b - d2 * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (b - np.sqrt(disc)) / d2
+    t = np.where((b > 0) & (disc > 0) & (t < 1.0), t, np.inf)
+    return np.where(c < 0, 0.0, t)
+
+
+def reflect(x, y, heading, speed, dt, direction, radius, win_w, win_h):
+    # GObj.reflect: move() that bounces off the sides of the arena.
+    step = direction * speed * dt
+    vx = step * np.cos(heading)
+    vy = step * np.sin(heading)
+    rest = np.ones_like(vx)
+    lo = radius
+    hi_x = win_w - radius
+    hi_y = win_h - radius
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for _ in range(3):
+            tx = np.where(
+                (vx < 0) & (x + vx * rest < lo),
+                (lo - x) / vx,
+                np.where((vx > 0) & (x + vx * rest > hi_x), (hi_x - x) / vx, np.inf),
+            )
+            ty = np.where(
+                (vy < 0) & (y + vy * rest < lo),
+                (lo - y) / vy,
+                np.where((vy > 0) & (y + vy * rest > hi_y), (hi_y - y) / vy, np.inf),
+            )
+            hit = np.minimum(tx, ty)
+            bounced = np.isfinite(hit)
+            if not bounced.any():
+                break
+            hit = np.where(bounced, np.maximum(hit, 0.0), 0.0)
+            x = x + vx * hit
+            y = y + vy * hit
+            rest = rest - hit
+            fx = bounced & (tx <= ty)
+            fy = bounced & (ty <= tx)
+            vx = np.where(fx, -vx, vx)
+            heading = np.where(fx, math.pi - heading, heading)
+            vy = np.where(fy, -vy, vy)
+            heading = np.where(fy, -heading, heading)
+    return x + vx * rest, y + vy * rest, heading
+
+
+def onscreen(x, y, radius, rect):
+    return (
+        (x + radius >= rect[0])
+        & (x - radius <= rect[2])
+        & (y + radius >= rect[1])
+        & (y - radius <= rect[3])
+    )
+
+
+def leave_time(x0, y0, x1, y1, radius, rect):
+    # GObj.leave_time: the fraction of the move at which it was all the way
+    # off rect, inf where it is still on it.
+    dx = x1 - x0
+    dy = y1 - y0
+    r = radius
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.minimum.reduce(
+            [
+                np.where(x1 + r < rect[0], (rect[0] - r - x0) / dx, 1.0),
+                np.where(x1 - r > rect[2], (rect[2] + r - x0) / dx, 1.0),
+                np.where(y1 + r < rect[1], (rect[1] - r - y0) / dy, 1.0),
+                np.where(y1 - r > rect[3], (rect[3] + r - y0) / dy, 1.0),
+            ]
+        )
+    # No move along the axis it is past means it started off.
+    t = np.where(np.isnan(t) | np.isinf(t), 0.0, t)
+    t = np.clip(t, 0.0, 1.0)
+    return np.where(onscreen(x1, y1, radius, rect), np.inf, t)
+
+
+def cone_visible(
+    x, y, heading, radius, sight_distance, sight_angle, ox, oy, cos_h=None, sin_h=None
+):
+    # Same half-plane test as Enemy.update: the target has to be strictly
+    # left of all three edges of the sight triangle.
+    reach = radius + sight_distance
+    c = np.cos(heading) if cos_h is None else cos_h
+    s = np.sin(heading) if sin_h is None else sin_h
+    ca = math.cos(sight_angle)
+    sa = math.sin(sight_angle)
+    x1 = x + (c * ca + s * sa) * reach
+    y1 = y + (s * ca - c * sa) * reach
+    x2 = x + (c * ca - s * sa) * reach
+    y2 = y + (s * ca + c * sa) * reach
+    seen = (x1 - x) * (oy - y) - (y1 - y) * (ox - x) > 0
+    seen &= (x2 - x1) * (oy - y1) - (y2 - y1) * (ox - x1) > 0
+    seen &= (x - x2) * (oy - y2) - (y - y2) * (ox - x2) > 0
+    return seen
+
+
+def seek(x, y, heading, tx, ty, wander_rate):
+    angle = wrap_angle(np.arctan2(ty - y, tx - x) - heading)
+    return np.clip(angle, -wander_rate, wander_rate)
+
+
+class BatchGame:
+    # N independent copies of sim.Game advanced in lockstep. Entity state
+    # lives in arrays shaped (N,) for the player and (K, N) for the K
+    # enemies so that each enemy row is contiguous.
+    #
+    # There is no per-episode Python work; a step is a few hundred array
+    # operations, dominated by trig and the swept tests. Over 10k episodes
+    # a step (with goal_seeker) takes about 11 ms, roughly 1.1 us per game
+    # against 80-130 us for a scalar sim.Game tick: around 100 times the
+    # throughput, but one batched step still costs about as much as 100
+    # scalar ticks, not a handful.
+    def __init__(self, n, win_w=800, win_h=800, start=None, seed=None):
+        self.n = n
+        self.win_w = win_w
+        self.win_h = win_h
+        self.d_rect = (0, 0, win_w, win_h)
+        self.rng = np.random.default_rng(seed)
+        self.clock = sim.VirtualClock()
+
+        start_locs = np.array(sim.start_locations(win_w, win_h), dtype=float)
+        if start is None:
+            start = self.rng.integers(len(start_locs), size=n)
+        loc = start_locs[np.broadcast_to(start, (n,))]
+        self.px = loc[:, 0].copy()
+        self.py = loc[:, 1].copy()
+        # Where the player's last move started.
+        self.pfx = self.px.copy()
+        self.pfy = self.py.copy()
+        self.ph = loc[:, 2].copy()
+        player = gobjs.Player(0, 0)
+        self.p_radius = player.radius
+        self.p_speed = player.speed
+        self.p_turn_rate = player.turn_rate
+
+        goals = [
+            gobjs.Goal(200, 200),
+            gobjs.Goal(win_w - 200, 200),
+            gobjs.Goal(200, win_h - 200),
+            gobjs.Goal(win_w - 200, win_h - 200),
+            gobjs.Goal(win_w // 2, win_h // 2),
+        ]
+        self.gx = np.array([g.x for g in goals], dtype=float)[:, None]
+        self.gy = np.array([g.y for g in goals], dtype=float)[:, None]
+        self.g_radius = np.array([g.radius for g in goals], dtype=float)[:, None]
+        self.touched = np.zeros((len(goals), n), dtype=bool)
+
+        enemies = [
+            gobjs.EnemyYellow(win_w // 2 + 50, win_h // 2, heading=0),
+            gobjs.EnemyBlue(win_w // 2 - 50, win_h // 2, heading=math.pi),
+            gobjs.EnemyRed(win_w // 2, win_h // 2 - 50, heading=math.pi / 2),
+        ]
+        self.kinds = [YELLOW, BLUE, RED]
+        k = len(enemies)
+        self.ex = np.array([[e.x] * n for e in enemies], dtype=float)
+        self.ey = np.array([[e.y] * n for e in enemies], dtype=float)
+        self.eh = np.array([[e.heading] * n for e in enemies], dtype=float)
+        # cos and sin of eh, kept from the last move for the next sight test.
+        self.ec = np.cos(self.eh)
+        self.es = np.sin(self.eh)
+        self.e_radius = [e.radius for e in enemies]
+        self.e_speed = [e.speed for e in enemies]
+        self.e_turn_rate = [e.turn_rate for e in enemies]
+        self.e_sight_angle = [e.sight_angle for e in enemies]
+        self.e_wander_rate = [e.wander_rate for e in enemies]
+        self.sight_distance = np.array(
+            [[e.sight_distance] * n for e in enemies], dtype=float
+        )
+        self.sight_distance_original = [
+            getattr(e, "sight_distance_original", e.sight_distance) for e in enemies
+        ]
+        self.tick_set = [getattr(e, "tick_set", 0) for e in enemies]
+        self.sight_dec = np.zeros((k, n))
+        # Timers and cooldowns in ticks of game time, as in fsm.
+        self.ticks = np.zeros((k, n))
+        self.message_active = np.zeros((k, n), dtype=bool)
+        self.message_cooldown = np.zeros((k, n))
+        # The current step's length in ticks.
+        self.steps = 1.0
+        self.tx = self.rng.integers(25, self.win_w, size=(k, n), endpoint=True)
+        self.ty = self.rng.integers(25, self.win_h, size=(k, n), endpoint=True)
+        self.tx = self.tx.astype(float)
+        self.ty = self.ty.astype(float)
+        self.last_target = np.zeros((k, n))
+        self.last_bounce = np.zeros((k, n), dtype=np.int8)
+
+        # comms: a value per color and a flag saying whether it is set.
+        self.comms_y = np.zeros((2, n))
+        self.comms_y_set = np.zeros(n, dtype=bool)
+        self.comms_r = np.zeros((2, n))
+        self.comms_r_set = np.zeros(n, dtype=bool)
+        self.comms_b = np.zeros(n, dtype=bool)
+
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.run = np.ones(n, dtype=bool)
+        self.winner = np.full(n, DRAW, dtype=np.int8)
+
+    def speed_factor(self):
+        return 1 + 0.1 * self.touched.sum(axis=0)
+
+    def ai_yellow(self, k, act, seen):
+        if not gobjs.YELLOW_ENABLED:
+            return np.zeros(self.n), np.zeros(self.n)
+        ticks = self.ticks[k]
+        active = self.message_active[k]
+        cooldown = self.message_cooldown[k]
+
+        # update_message_state
+        m = act & active
+        cooldown[m] -= self.steps
+        active[m & (cooldown <= 0)] = False
+
+        nyoom = act & ~active & self.comms_b
+        active[nyoom] = True
+        cooldown[nyoom] = 120
+
+        live = act & ~nyoom
+        chase = live & (ticks > 0)
+        spot = live & (ticks == 0) & seen
+        wander = live & ~chase & ~spot
+
+        ticks[chase] = np.maximum(ticks[chase] - self.steps, 0.0)
+        self.comms_y_set[chase & (ticks == 0)] = False
+
+        self.ticks[k][spot] = 5
+        self.tx[k][spot] = self.px[spot]
+        self.ty[k][spot] = self.py[spot]
+        self.comms_y[0][spot] = self.px[spot]
+        self.comms_y[1][spot] = self.py[spot]
+        self.comms_y_set[spot] = True
+        talk = spot & ~active
+        active[talk] = True
+        cooldown[talk] = 120
+
+        now = self.clock.get_ticks()
+        retarget = wander & (now - self.last_target[k] > 300)
+        count = int(retarget.sum())
+        if count:
+            self.tx[k][retarget] = self.rng.integers(
+                25, self.win_w - 25, size=count, endpoint=True
+            )
+            self.ty[k][retarget] = self.rng.integers(
+                25, self.win_h - 25, size=count, endpoint=True
+            )
+            self.last_target[k][retarget] = now
+        self.comms_y_set[wander] = False
+
+        direction = seek(
+            self.ex[k],
+            self.ey[k],
+            self.eh[k],
+            self.tx[k],
+            self.ty[k],
+            self.e_wander_rate[k],
+        )
+        direction = np.where(nyoom, 0.0, direction)
+        speed = np.where(nyoom, 0.0, self.speed_factor())
+        return direction, speed
+
+    def ai_blue(self, k, act, seen):
+        if not gobjs.BLUE_ENABLED:
+            return np.zeros(self.n), np.zeros(self.n)
+        ticks = self.ticks[k]
+        active = self.message_active[k]
+        cooldown = self.message_cooldown[k]
+        sd = self.sight_distance[k]
+        sd_orig = self.sight_distance_original[k]
+        tick_set = self.tick_set[k]
+
+        m = act & active
+        cooldown[m] -= self.steps
+        active[m & (cooldown <= 0)] = False
+        self.comms_b[act] = False
+
+        chase = act & (ticks > 0)
+        idle = act & (ticks == 0)
+        spot = idle & seen
+        boss = idle & ~seen & self.comms_y_set
+        scout = idle & ~seen & ~self.comms_y_set & self.comms_r_set
+        spin = idle & ~spot & ~boss & ~scout
+
+        ticks[chase] = np.maximum(ticks[chase] - self.steps, 0.0)
+        shrink = chase & (sd > sd_orig)
+        sd[shrink] = np.maximum(
+            sd[shrink] - self.sight_dec[k][shrink] * self.steps, sd_orig
+        )
+        sd[chase & ~shrink] = sd_orig
+
+        lunge = spot | boss | scout
+        self.sight_dec[k][lunge] = (sd[lunge] - sd_orig) / tick_set
+        ticks[lunge] = tick_set
+        self.tx[k] = np.where(
+            spot,
+            self.px,
+            np.where(
+                boss, self.comms_y[0], np.where(scout, self.comms_r[0], self.tx[k])
+            ),
+        )
+        self.ty[k] = np.where(
+            spot,
+            self.py,
+            np.where(
+                boss, self.comms_y[1], np.where(scout, self.comms_r[1], self.ty[k])
+            ),
+        )
+        self.comms_b[spot] = True
+        talk = lunge & ~active
+        active[talk] = True
+        cooldown[talk] = 120
+
+        sd[spin] += self.touched[:, spin].sum(axis=0) * self.steps
+
+        direction = seek(
+            self.ex[k],
+            self.ey[k],
+            self.eh[k],
+            self.tx[k],
+            self.ty[k],
+            self.e_wander_rate[k],
+        )
+        direction = np.where(spin, 0.5, direction)
+        speed = self.speed_factor() * 4.5 * (ticks / tick_set)
+        speed = np.where(spin, 0.0, speed)
+        return direction, speed
+
+    def ai_red(self, k, act, seen):
+        if not gobjs.RED_ENABLED:
+            self.comms_r_set[act] = False
+            return np.zeros(self.n), np.zeros(self.n)
+        ticks = self.ticks[k]
+        x = self.ex[k]
+        y = self.ey[k]
+        heading = self.eh[k]
+        radius = self.e_radius[k]
+
+        chase = act & (ticks > 0)
+        spot = act & (ticks == 0) & seen
+        bounce = act & (ticks == 0) & ~seen
+
+        ticks[chase] = np.maximum(ticks[chase] - self.steps, 0.0)
+        self.comms_r_set[chase & (ticks == 0)] = False
+        direction = seek(x, y, heading, self.tx[k], self.ty[k], self.e_wander_rate[k])
+        direction = np.where(chase, direction, 0.0)
+
+        ticks[spot] = 30
+        self.tx[k][spot] = self.px[spot]
+        self.ty[k][spot] = self.py[spot]
+        self.comms_r[0][spot] = self.px[spot]
+        self.comms_r[1][spot] = self.py[spot]
+        self.comms_r_set[spot] = True
+
+        speed = np.where(bounce, self.speed_factor(), 0.0)
+        if gobjs.SWEPT:
+            # step() reflects Red off the edges instead.
+            return direction, speed
+
+        # The quadrant cases from EnemyRed.ai, applied edge by edge in the
+        # same order so a later edge overrides an earlier one.
+        hc = heading % math.pi
+        noise = self.rng.uniform(-0.1, 0.1, size=self.n)
+        low = (hc >= 0) & (hc <= math.pi / 2)
+        high = (hc >= math.pi / 2) & (hc <= math.pi)
+        bounce_dir = np.zeros(self.n)
+        last = self.last_bounce[k]
+        edges = (
+            (LEFT, x <= radius, high, math.pi + heading, math.pi / 2 - heading),
+            (
+                RIGHT,
+                x >= self.win_w - radius,
+                low,
+                math.pi / 2 - heading,
+                math.pi + heading,
+            ),
+            (TOP, y <= radius, low, math.pi / 2 + heading, math.pi - heading),
+            (
+                BOTTOM,
+                y >= self.win_h - radius,
+                low,
+                math.pi / 2 + heading,
+                math.pi - heading,
+            ),
+        )
+        for code, hit, first, first_dir, second_dir in edges:
+            hit = bounce & hit & (last != code)
+            second = high if first is low else low
+            new = np.where(first, first_dir, np.where(second, second_dir, bounce_dir))
+            bounce_dir = np.where(hit, new + noise, bounce_dir)
+            last[hit] = code
+        direction = np.where(bounce, bounce_dir % math.pi, direction)
+        return direction, speed
+
+    def step(self, dt, turn_dir, move_dir):
+        self.clock.advance(dt)
+        self.steps = dt * fsm.RATE
+        act = self.run.copy()
+
+        swept = gobjs.SWEPT
+        if swept:
+            hit = swept_collision(
+                self.pfx,
+                self.pfy,
+                self.px,
+                self.py,
+                self.p_radius,
+                self.gx,
+                self.gy,
+                self.g_radius,
+            )
+        else:
+            hit = check_collision(
+                self.gx, self.gy, self.g_radius, self.px, self.py, self.p_radius
+            )
+        self.touched |= hit & act
+        done = act & self.touched.all(axis=0)
+        self.run[done] = False
+        self.winner[done] = PLAYER
+
+        first_caught = np.full(self.n, np.inf)
+        first_left = np.full(self.n, np.inf)
+        for k, kind in enumerate(self.kinds):
+            seen = cone_visible(
+                self.ex[k],
+                self.ey[k],
+                self.eh[k],
+                self.e_radius[k],
+                self.sight_distance[k],
+                self.e_sight_angle[k],
+                self.px,
+                self.py,
+                self.ec[k],
+                self.es[k],
+            )
+            if kind == YELLOW:
+                direction, speed = self.ai_yellow(k, act, seen)
+            elif kind == BLUE:
+                direction, speed = self.ai_blue(k, act, seen)
+            else:
+                direction, speed = self.ai_red(k, act, seen)
+            direction = np.where(act, direction, 0.0)
+            speed = np.where(act, speed, 0.0)
+            self.eh[k] = turn(self.eh[k], self.e_turn_rate[k], dt, direction)
+            # Copies: the rows are overwritten in place below.
+            x0 = self.ex[k].copy()
+            y0 = self.ey[k].copy()
+            if swept and kind == RED:
+                self.ex[k], self.ey[k], self.eh[k] = reflect(
+                    x0,
+                    y0,
+                    self.eh[k],
+                    self.e_speed[k],
+                    dt,
+                    speed,
+                    self.e_radius[k],
+                    self.win_w,
+                    self.win_h,
+                )
+                self.ec[k] = np.cos(self.eh[k])
+                self.es[k] = np.sin(self.eh[k])
+            else:
+                self.ec[k] = np.cos(self.eh[k])
+                self.es[k] = np.sin(self.eh[k])
+                self.ex[k], self.ey[k] = move(
+                    x0,
+                    y0,
+                    self.eh[k],
+                    self.e_speed[k],
+                    dt,
+                    speed,
+                    self.ec[k],
+                    self.es[k],
+                )
+
+            if swept:
+                # When in the step each game was first caught and first lost
+                # an enemy; the earlier decides, as in sim.Game.step.
+                contact = swept_contact(
+                    x0,
+                    y0,
+                    self.ex[k],
+                    self.ey[k],
+                    self.e_radius[k],
+                    self.px,
+                    self.py,
+                    self.p_radius,
+                )
+                first_caught = np.minimum(first_caught, contact)
+                gone = leave_time(
+                    x0, y0, self.ex[k], self.ey[k], self.e_radius[k], self.d_rect
+                )
+                first_left = np.minimum(first_left, gone)
+                continue
+            caught = act & check_collision(
+                self.ex[k],
+                self.ey[k],
+                self.e_radius[k],
+                self.px,
+                self.py,
+                self.p_radius,
+            )
+            self.run[caught] = False
+            self.winner[caught] = AI
+            lost = act & ~onscreen(
+                self.ex[k], self.ey[k], self.e_radius[k], self.d_rect
+            )
+            self.run[lost] = False
+            self.winner[lost] = PLAYER
+        if swept:
+            lost = act & (first_left < np.inf)
+            self.run[lost] = False
+            self.winner[lost] = PLAYER
+            caught = act & (first_caught < np.inf) & (first_caught <= first_left)
+            self.run[caught] = False
+            self.winner[caught] = AI
+
+        turn_dir = np.where(act, turn_dir, 0.0)
+        move_dir = np.where(act, move_dir, 0.0)
+        self.ph = turn(self.ph, self.p_turn_rate, dt, turn_dir)
+        self.pfx = self.px
+        self.pfy = self.py
+        self.px, self.py = move(self.px, self.py, self.ph, self.p_speed, dt, move_dir)
+        if swept:
+            # Enemies the player walked through.
+            for k in range(len(self.kinds)):
+                caught = act & swept_collision(
+                    self.pfx,
+                    self.pfy,
+                    self.px,
+                    self.py,
+                    self.p_radius,
+                    self.ex[k],
+                    self.ey[k],
+                    self.e_radius[k],
+                )
+                self.run[caught] = False
+                self.winner[caught] = AI
+        out = act & ~onscreen(self.px, self.py, self.p_radius, self.d_rect)
+        self.run[out] = False
+        self.winner[out] = AI
+
+        self.tick[act] += 1
+
+
+# Vectorized player controllers, called as controller(batch, dt) and
+# returning (turn, move) arrays.
+def idle_controller(batch, dt):
+    return np.zeros(batch.n), np.zeros(batch.n)
+
+
+def goal_seeker(batch, dt):
+    d2 = (batch.gx - batch.px) ** 2 + (batch.gy - batch.py) ** 2
+    d2 = np.where(batch.touched, np.inf, d2)
+    nearest = np.argmin(d2, axis=0)
+    gx = batch.gx[nearest, 0]
+    gy = batch.gy[nearest, 0]
+    angle = wrap_angle(np.arctan2(gy - batch.py, gx - batch.px) - batch.ph)
+    step = batch.p_turn_rate * dt
+    turn_dir = np.clip(angle / step, -1.0, 1.0)
+    return turn_dir, np.ones(batch.n)
+
+
+def run_batch(
+    n,
+    controller=idle_controller,
+    dt=1 / 60,
+    max_ticks=60 * 60 * 5,
+    start=None,
+    seed=None,
+):
+    batch = BatchGame(n, start=start, seed=seed)
+    steps = 0
+    while batch.run.any() and steps < max_ticks:
+        batch.step(dt, *controller(batch, dt))
+        steps += 1
+    return batch
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run games in lockstep batches.")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--dt", type=float, default=1 / 60)
+    parser.add_argument("--max-ticks", type=int, default=60 * 60 * 5)
+    parser.add_argument("--controller", choices=("idle", "goals"), default="goals")
+    args = parser.parse_args()
+
+    controller = goal_seeker if args.controller == "goals" else idle_controller
+    t0 = time.perf_counter()
+    batch = run_batch(args.games, controller, args.dt, args.max_ticks, seed=args.seed)
+    wall = time.perf_counter() - t0
+    counts = np.bincount(batch.winner, minlength=len(WINNERS))
+    for name, count in zip(WINNERS, counts):
+        print(f"{name}: {count}")
+    print(f"Ran {args.games} games ({int(batch.tick.sum())} ticks) in {wall:.3f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import fsm
+import gobjs
+import hw1_main
+import sim
+
+AGENT_COUNTS = (3, 100, 1000, 10000)
+ENEMY_TYPES = (gobjs.EnemyYellow, gobjs.EnemyBlue, gobjs.EnemyRed)
+LINES = ("Nyoom!", "Get em' Blue!", "On it Boss!", "On my way!", "I see them!")
+
+
+def populate(game, n, rng):
+    # Swap the standard three guards for n of them, cycling through the
+    # three colors and scattered over the arena.
+    for e in game.enemies:
+        game.index.remove(e)
+    game.enemies = []
+    game.comms = gobjs.CommsBus(game.index)
+    game.mailboxes = []
+    for i in range(n):
+        cls = ENEMY_TYPES[i % len(ENEMY_TYPES)]
+        e = cls(
+            rng.uniform(50, game.win_w - 50),
+            rng.uniform(50, game.win_h - 50),
+            heading=rng.uniform(-3.14, 3.14),
+            rng=rng,
+        )
+        e.clock = game.clock.get_ticks
+        game.enemies.append(e)
+        game.index.insert(e)
+        game.mailboxes.append(game.comms.mailbox(e))
+
+
+def make_game(n, seed=0):
+    game = sim.Game(seed=seed, start=0)
+    populate(game, n, game.rng)
+    return game
+
+
+def timed(fn, min_time):
+    # Calls fn until at least min_time has gone by, then reports the best
+    # of three such runs as seconds per call.
+    best = None
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time / 3:
+            break
+        loops *= 2
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        per_call = (time.perf_counter() - t0) / loops
+        best = per_call if best is None else min(best, per_call)
+    return best, loops
+
+
+def bench_perception(game, display):
+    player = game.player
+    enemies = game.enemies
+
+    def run():
+        for e in enemies:
+            e.update(player)
+
+    return run
+
+
+def bench_ai(cls):
+    def setup(game, display):
+        boxes = dict(zip(game.enemies, game.mailboxes))
+        enemies = [e for e in game.enemies if type(e) is cls]
+        percepts = [e.update(game.player) for e in enemies]
+        mailboxes = [boxes[e] for e in enemies]
+        goals = game.goals
+        comms = game.comms
+
+        def run():
+            fsm.evaluate(enemies, percepts, goals, mailboxes)
+            comms.deliver()
+
+        return run
+
+    return setup
+
+
+def bench_ai_batch(game, display):
+    player = game.player
+    enemies = game.enemies
+
+    def run():
+        percepts = [e.update(player) for e in enemies]
+        fsm.evaluate(enemies, percepts, game.goals, game.mailboxes)
+        game.comms.deliver()
+
+    return run
+
+
+def bench_ai_lod(game, display):
+    player = game.player
+    enemies = game.enemies
+    scheduler = fsm.Scheduler(game.win_w, game.win_h)
+
+    def run():
+        percepts = [e.update(player) for e in enemies]
+        scheduler.evaluate(enemies, percepts, game.goals, game.mailboxes, player)
+        game.comms.deliver()
+
+    return run
+
+
+def bench_move(game, display):
+    enemies = game.enemies
+
+    def run():
+        for e in enemies:
+            e.move(1 / 60)
+            e.move(1 / 60, -1.0)
+
+    return run
+
+
+def bench_turn(game, display):
+    enemies = game.enemies
+
+    def run():
+        for e in enemies:
+            e.turn(1 / 60, 1.0)
+
+    return run
+
+
+def bench_collision(game, display):
+    player = game.player
+    enemies = game.enemies
+
+    def run():
+        for e in enemies:
+            e.check_collision(player)
+
+    return run
+
+
+def bench_draw_text(game, display):
+    enemies = game.enemies
+
+    def run():
+        for i, e in enumerate(enemies):
+            display.draw_text(LINES[i % len(LINES)], e.x, e.y - 13, e.color)
+
+    return run
+
+
+def bench_tick(game, display):
+    dt = 1 / 60
+
+    def run():
+        game.clock.advance(dt)
+        game.step(dt, sim.goal_seeker(game, dt))
+        hw1_main.draw_frame(display, game)
+
+    return run
+
+
+def bench_draw_frame(game, display):
+    def run():
+        hw1_main.draw_frame(display, game)
+
+    return run
+
+
+def bench_draw_sprites(game, display):
+    renderer = hw1_main.SpriteRenderer(display, game.goals, game.walls)
+
+    def run():
+        renderer.draw(game)
+
+    return run
+
+
+BENCHMARKS = {
+    "enemy.update": bench_perception,
+    "ai.yellow": bench_ai(gobjs.EnemyYellow),
+    "ai.blue": bench_ai(gobjs.EnemyBlue),
+    "ai.red": bench_ai(gobjs.EnemyRed),
+    "ai.batch": bench_ai_batch,
+    "ai.lod": bench_ai_lod,
+    "gobj.move": bench_move,
+    "gobj.turn": bench_turn,
+    "gobj.check_collision": bench_collision,
+    "display.draw_text": bench_draw_text,
+    "draw.frame": bench_draw_frame,
+    "draw.sprites": bench_draw_sprites,
+    "game_loop.tick": bench_tick,
+}
+
+
+# Cold start costs, each timed in a fresh interpreter.
+STARTUP = {
+    "python": "pass",
+    "import.sim": "import sim",
+    "import.tournament": "import tournament",
+    "import.hw1_main": "import hw1_main",
+    "first_frame": "import hw1_main, sim; "
+    "d = hw1_main.init_display(800, 800); "
+    "hw1_main.draw_frame(d, sim.Game(seed=0), ['tick 0'])",
+}
+
+
+def run_startup(repeat):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for name, code in STARTUP.items():
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(
+            {
+                "name": "startup." + name,
+                "agents": 0,
+                "seconds_per_call": best,
+                "loops": repeat,
+            }
+        )
+        print(f"{'startup.' + name:<22} {best * 1e3:10.3f} ms", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(names, counts, min_time):
+    display = hw1_main.init_display(gobjs.WIDTH, gobjs.HEIGHT)
+    results = []
+    for name in names:
+        for n in counts:
+            random.seed(0)
+            game = make_game(n)
+            fn = BENCHMARKS[name](game, display)
+            per_call, loops = timed(fn, min_time)
+            results.append(
+                {
+                    "name": name,
+                    "agents": n,
+                    "seconds_per_call": per_call,
+                    "ns_per_agent": per_call / n * 1e9,
+                    "loops": loops,
+                }
+            )
+            print(
+                f"{name:<22} {n:>6} agents  {per_call * 1e3:10.3f} ms"
+                f"  {per_call / n * 1e9:10.1f} ns/agent",
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    # Prints each benchmark next to the baseline and returns how many got
+    # slower by more than threshold.
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["name"], r["agents"]): r for r in baseline["results"]}
+    regressions = 0
+    for r in results:
+        prev = old.get((r["name"], r["agents"]))
+        if prev is None:
+            continue
+        ratio = r["seconds_per_call"] / prev["seconds_per_call"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['name']:<22} {r['agents']:>6}  x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot paths.")
+    parser.add_argument("--only", nargs="*", choices=BENCHMARKS, default=None)
+    parser.add_argument("--agents", nargs="*", type=int, default=AGENT_COUNTS)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--out", default=None, help="write results as JSON")
+    parser.add_argument("--compare", default=None, help="baseline JSON to diff")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument(
+        "--startup",
+        type=int,
+        default=None,
+        help="cold start repeats (default 5, or 0 with --only)",
+    )
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    startup = args.startup
+    if startup is None:
+        startup = 0 if args.only else 5
+    results = run_startup(startup) if startup else []
+    results += run_suite(names, args.agents, args.min_time)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    if args.compare:
+        if compare(results, args.compare, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
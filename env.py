@@ -0,0 +1,330 @@
+import argparse
+import math
+import multiprocessing as mp
+import os
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import sim
+
+# Rewards for the events of one step.
+GOAL_REWARD = 1.0
+WIN_REWARD = 5.0
+LOSS_REWARD = -5.0
+
+# Discrete actions number the (turn, move) pairs the keyboard can make, the
+# same way replay packs them: turn = a // 3 - 1, move = a % 3 - 1.
+N_ACTIONS = 9
+
+# Commands from VecEnv to its workers.
+STEP = 0
+RESET = 1
+CLOSE = 2
+
+
+class Env:
+    # reset()/step() wrapper around sim.Game for driving the player from a
+    # policy instead of handle_input.
+    #
+    # Observations are float32 vectors:
+    #   player x, y (scaled to the arena), cos and sin of heading,
+    #   per goal: offset from the player (scaled) and whether it is touched,
+    #   per enemy, nearest first: offset, cos and sin of heading and whether
+    #   it can see the player,
+    #   and the fraction of max_ticks used.
+    # enemies limits the observation to the nearest few enemies, padding
+    # with zeros when there are fewer.
+    def __init__(
+        self,
+        scenario=None,
+        dt=1 / 60,
+        max_ticks=60 * 60 * 5,
+        continuous=False,
+        enemies=None,
+        seed=None,
+    ):
+        self.scenario = scenario
+        self.dt = dt
+        self.max_ticks = max_ticks
+        self.continuous = continuous
+        self.rng = random.Random(seed)
+        self.new_game()
+        if enemies is None:
+            enemies = len(self.game.enemies)
+        self.enemies = enemies
+        self.observation_size = 4 + 3 * len(self.game.goals) + 5 * enemies + 1
+        self.action_size = 2 if continuous else 1
+
+    def new_game(self, seed=None):
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+        self.clock = sim.VirtualClock()
+        self.game = sim.Game(clock=self.clock, seed=seed, scenario=self.scenario)
+        return seed
+
+    def reset(self, seed=None):
+        seed = self.new_game(seed)
+        return self.observe(), {"seed": seed}
+
+    def action(self, action):
+        if self.continuous:
+            turn, move = action
+            return (max(-1.0, min(1.0, turn)), max(-1.0, min(1.0, move)))
+        code = int(action)
+        return (code // 3 - 1, code % 3 - 1)
+
+    def advance(self, action):
+        # Steps the game and returns (reward, terminated, truncated).
+        game = self.game
+        goals = game.goal_count
+        self.clock.advance(self.dt)
+        game.step(self.dt, self.action(action))
+        reward = (game.goal_count - goals) * GOAL_REWARD
+        terminated = not game.run
+        if terminated:
+            if game.winner == "Player":
+                reward += WIN_REWARD
+            elif game.winner == "AI":
+                reward += LOSS_REWARD
+        truncated = not terminated and game.tick >= self.max_ticks
+        return reward, terminated, truncated
+
+    def step(self, action):
+        reward, terminated, truncated = self.advance(action)
+        info = {"winner": self.game.winner, "tick": self.game.tick}
+        return self.observe(), reward, terminated, truncated, info
+
+    def observe(self, out=None):
+        game = self.game
+        p = game.player
+        w = game.win_w
+        h = game.win_h
+        obs = [p.x / w, p.y / h, math.cos(p.heading), math.sin(p.heading)]
+        for g in game.goals:
+            obs += ((g.x - p.x) / w, (g.y - p.y) / h, float(g.touched))
+        enemies = game.enemies
+        if self.enemies < len(enemies):
+            enemies = sorted(
+                enemies, key=lambda e: (e.x - p.x) ** 2 + (e.y - p.y) ** 2
+            )[: self.enemies]
+        for e in enemies:
+            obs += (
+                (e.x - p.x) / w,
+                (e.y - p.y) / h,
+                math.cos(e.heading),
+                math.sin(e.heading),
+                float(e.sight_cone_color == e.sight_cone_color_obj),
+            )
+        obs += (0.0,) * (5 * (self.enemies - len(enemies)))
+        obs.append(game.tick / self.max_ticks)
+        if out is None:
+            return np.array(obs, dtype=np.float32)
+        out[:] = obs
+        return out
+
+
+def layout(k, obs_size, action_size):
+    return (
+        ("obs", (k, obs_size), np.float32),
+        ("final_obs", (k, obs_size), np.float32),
+        ("actions", (k, action_size), np.float32),
+        ("rewards", (k,), np.float32),
+        ("terminated", (k,), np.bool_),
+        ("truncated", (k,), np.bool_),
+        ("seeds", (k,), np.int64),
+        ("cmd", (1,), np.int32),
+    )
+
+
+def attach(names, specs):
+    blocks = []
+    arrays = {}
+    for (name, shape, dtype), block_name in zip(specs, names):
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def run_envs(cmd, envs, lo, arrays):
+    obs = arrays["obs"]
+    final_obs = arrays["final_obs"]
+    if cmd == RESET:
+        for j, env in enumerate(envs):
+            env.new_game(int(arrays["seeds"][lo + j]))
+            env.observe(obs[lo + j])
+        return
+    actions = arrays["actions"]
+    rewards = arrays["rewards"]
+    terminated = arrays["terminated"]
+    truncated = arrays["truncated"]
+    for j, env in enumerate(envs):
+        i = lo + j
+        action = actions[i] if env.continuous else actions[i, 0]
+        rewards[i], terminated[i], truncated[i] = env.advance(action)
+        # Finished games start over straight away, as vectorized envs do,
+        # once their last observation is kept.
+        if terminated[i] or truncated[i]:
+            env.observe(final_obs[i])
+            env.new_game()
+        env.observe(obs[i])
+
+
+def worker(names, specs, lo, hi, env_kwargs, seed, barrier):
+    blocks, arrays = attach(names, specs)
+    try:
+        envs = [Env(seed=seed + i, **env_kwargs) for i in range(lo, hi)]
+        while True:
+            barrier.wait()
+            cmd = int(arrays["cmd"][0])
+            if cmd == CLOSE:
+                break
+            run_envs(cmd, envs, lo, arrays)
+            barrier.wait()
+    except Exception:
+        # Wakes the other processes instead of leaving them waiting.
+        barrier.abort()
+        raise
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+
+class VecEnv:
+    # k Envs split over worker processes. Observations, rewards, done flags
+    # and actions all live in shared memory, so a step costs the workers two
+    # barrier waits and nothing gets pickled. The arrays step() and reset()
+    # return are views of that memory and are overwritten by the next call.
+    # Envs that finish are reset within step(); info["final_obs"] holds
+    # their last observation in the rows where terminated or truncated.
+    def __init__(self, k, workers=None, seed=None, **env_kwargs):
+        if seed is None:
+            seed = random.getrandbits(62)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, k)
+        probe = Env(**env_kwargs)
+        self.k = k
+        self.continuous = probe.continuous
+        self.observation_size = probe.observation_size
+        self.action_size = probe.action_size
+        self.seed = seed
+
+        specs = layout(k, self.observation_size, self.action_size)
+        self.blocks = []
+        self.arrays = {}
+        for name, shape, dtype in specs:
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            self.arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+        self.obs = self.arrays["obs"]
+        self.final_obs = self.arrays["final_obs"]
+        self.info = {"final_obs": self.final_obs}
+        self.actions = self.arrays["actions"]
+        self.rewards = self.arrays["rewards"]
+        self.terminated = self.arrays["terminated"]
+        self.truncated = self.arrays["truncated"]
+        self.cmd = self.arrays["cmd"]
+
+        # workers=0 steps the envs in this process over the same arrays.
+        self.envs = None
+        self.procs = []
+        if workers == 0:
+            self.envs = [Env(seed=seed + i, **env_kwargs) for i in range(k)]
+            return
+        self.barrier = mp.Barrier(workers + 1)
+        names = [block.name for block in self.blocks]
+        bounds = [k * w // workers for w in range(workers + 1)]
+        for lo, hi in zip(bounds, bounds[1:]):
+            proc = mp.Process(
+                target=worker,
+                args=(names, specs, lo, hi, env_kwargs, seed, self.barrier),
+                daemon=True,
+            )
+            proc.start()
+            self.procs.append(proc)
+
+    def command(self, cmd):
+        if self.envs is not None:
+            run_envs(cmd, self.envs, 0, self.arrays)
+            return
+        self.cmd[0] = cmd
+        self.barrier.wait()
+        if cmd != CLOSE:
+            self.barrier.wait()
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(62)
+        self.arrays["seeds"][:] = np.arange(seed, seed + self.k)
+        self.command(RESET)
+        return self.obs
+
+    def step(self, actions):
+        if self.continuous:
+            self.actions[:] = actions
+        else:
+            self.actions[:, 0] = actions
+        self.command(STEP)
+        return self.obs, self.rewards, self.terminated, self.truncated, self.info
+
+    def close(self):
+        if self.blocks is None:
+            return
+        if self.procs:
+            try:
+                self.command(CLOSE)
+            except threading.BrokenBarrierError:
+                # A worker failed and has already gone.
+                pass
+            for proc in self.procs:
+                proc.join()
+        self.obs = self.final_obs = self.actions = self.rewards = None
+        self.info = None
+        self.terminated = self.truncated = self.cmd = None
+        self.arrays = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time random play in VecEnv.")
+    parser.add_argument("--envs", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--continuous", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with VecEnv(args.envs, args.workers, args.seed, continuous=args.continuous) as venv:
+        venv.reset(args.seed)
+        episodes = 0
+        t0 = time.perf_counter()
+        for _ in range(args.steps):
+            if args.continuous:
+                actions = rng.uniform(-1, 1, (args.envs, 2))
+            else:
+                actions = rng.integers(0, N_ACTIONS, args.envs)
+            _, _, terminated, truncated, _ = venv.step(actions)
+            episodes += int(terminated.sum() + truncated.sum())
+        wall = time.perf_counter() - t0
+    samples = args.steps * args.envs
+    print(f"{samples} samples in {wall:.3f}s, {samples / wall:.0f} per second.")
+    print(f"{episodes} episodes finished.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,619 @@
+import math
+import time
+
+# Table-driven enemy behavior.
+#
+# A Machine is a set of named States. Each tick an agent's machine runs:
+#
+#   always:     effects applied to every agent first,
+#   interrupts: rules tried before the state's own rules (they do not have
+#               to change state),
+#   tick:       the current state's per-tick effects,
+#   rules:      the current state's rules, in order.
+#
+# The first rule whose guards all hold fires: its effects run, then its
+# steer, speed and message give the agent's (turn, move, message) action,
+# and the agent moves to the rule's next state, if it has one. The last rule
+# of a state normally has no guards so that something always fires.
+#
+# Guards, effects, steering and speeds are named in the tables and looked
+# up in the dicts below, so a new kind is one function here and no changes
+# to the machines that don't use it. Each one takes a Batch of agents that
+# are all in the same state and works on the whole batch at once.
+
+# Timers, the message cooldown and the other per-tick amounts in the tables
+# are in ticks of game time at RATE a second. Effects use them up by
+# dt * RATE each step, so a step of any length takes off the game time it
+# covers rather than one tick.
+RATE = 60
+TICK = 1 / RATE
+
+# Message cooldown, in ticks, after an agent says something.
+COOLDOWN = 120
+
+
+class Batch:
+    # Agents in one state together with what they need this tick. index is
+    # where each agent's action goes in the output list; steps is the
+    # step's length in ticks.
+    __slots__ = ("agents", "percepts", "comms", "goals", "index", "steps")
+
+    def __init__(self, agents, percepts, comms, goals, index, steps=1.0):
+        self.agents = agents
+        self.percepts = percepts
+        self.comms = comms
+        self.goals = goals
+        self.index = index
+        self.steps = steps
+
+    def split(self, mask):
+        # Returns (the agents where mask holds, the rest).
+        hit = [j for j, m in enumerate(mask) if m]
+        if len(hit) == len(mask):
+            return self, EMPTY
+        if not hit:
+            return EMPTY, self
+        miss = [j for j, m in enumerate(mask) if not m]
+        return self.subset(hit), self.subset(miss)
+
+    def subset(self, js):
+        agents = self.agents
+        percepts = self.percepts
+        comms = self.comms
+        index = self.index
+        return Batch(
+            [agents[j] for j in js],
+            [percepts[j] for j in js],
+            [comms[j] for j in js],
+            self.goals,
+            [index[j] for j in js],
+            self.steps,
+        )
+
+
+EMPTY = Batch((), (), (), (), ())
+
+
+# Guards. Each returns one bool per agent.
+def guard_seen(batch):
+    return [p[0] for p in batch.percepts]
+
+
+def guard_heard(batch, topic, value=None):
+    # Something is being said on topic, or value is, when given.
+    if value is None:
+        return [c[topic] is not None for c in batch.comms]
+    return [c[topic] == value for c in batch.comms]
+
+
+def guard_quiet(batch):
+    return [not a.message_active for a in batch.agents]
+
+
+def guard_timer_done(batch):
+    return [a.ticks == 0 for a in batch.agents]
+
+
+GUARDS = {
+    "seen": guard_seen,
+    "heard": guard_heard,
+    "quiet": guard_quiet,
+    "timer_done": guard_timer_done,
+}
+
+
+# Effects change agent or comms state.
+def effect_messages(batch):
+    steps = batch.steps
+    for a in batch.agents:
+        a.update_message_state(steps)
+
+
+def effect_retract(batch, topic, value):
+    # Takes back the agent's own value on topic if it is value.
+    for c in batch.comms:
+        if c[topic] == value:
+            c.update(**{topic: None})
+
+
+def effect_publish(batch, topic, what=None):
+    # Publishes the agent's target (what="target") or, with no what,
+    # retracts whatever the agent had on topic.
+    for a, c in zip(batch.agents, batch.comms):
+        c.update(**{topic: a.target if what == "target" else what})
+
+
+def effect_timer(batch, ticks):
+    # ticks is a count or the name of an agent attribute holding one.
+    for a in batch.agents:
+        a.ticks = getattr(a, ticks) if isinstance(ticks, str) else ticks
+
+
+def effect_countdown(batch):
+    # Stops at 0 when the last step overshoots it.
+    steps = batch.steps
+    for a in batch.agents:
+        a.ticks = max(0.0, a.ticks - steps)
+
+
+def effect_target_seen(batch):
+    for a, p in zip(batch.agents, batch.percepts):
+        a.target = a.locate(p)
+
+
+def effect_target_heard(batch, topic):
+    for a, c in zip(batch.agents, batch.comms):
+        a.target = c[topic]
+
+
+def effect_sight_charge(batch):
+    # Spread the extra sight distance gained while idle over the dash.
+    for a in batch.agents:
+        a.sight_dec = (a.sight_distance - a.sight_distance_original) / a.tick_set
+
+
+def effect_sight_decay(batch):
+    for a in batch.agents:
+        if a.sight_distance > a.sight_distance_original:
+            # A long step stops at the original rather than going past it.
+            a.sight_distance = max(
+                a.sight_distance - a.sight_dec * batch.steps,
+                a.sight_distance_original,
+            )
+        else:
+            a.sight_distance = a.sight_distance_original
+
+
+def effect_sight_grow(batch):
+    touched = sum([g.touched for g in batch.goals]) * batch.steps
+    for a in batch.agents:
+        a.sight_distance += touched
+
+
+EFFECTS = {
+    "messages": effect_messages,
+    "retract": effect_retract,
+    "publish": effect_publish,
+    "timer": effect_timer,
+    "countdown": effect_countdown,
+    "target_seen": effect_target_seen,
+    "target_heard": effect_target_heard,
+    "sight_charge": effect_sight_charge,
+    "sight_decay": effect_sight_decay,
+    "sight_grow": effect_sight_grow,
+}
+
+
+# Steering. Each returns one turn direction per agent.
+def steer_const(batch, value):
+    return [value] * len(batch.agents)
+
+
+def steer_seek(batch):
+    return [a.seek(a.target) for a in batch.agents]
+
+
+def steer_chase(batch):
+    return [a.chase(a.target) for a in batch.agents]
+
+
+def steer_wander(batch):
+    return [a.wander() for a in batch.agents]
+
+
+def steer_bounce(batch):
+    return [a.bounce() for a in batch.agents]
+
+
+STEER = {
+    "const": steer_const,
+    "seek": steer_seek,
+    "chase": steer_chase,
+    "wander": steer_wander,
+    "bounce": steer_bounce,
+}
+
+
+# Speeds. Each returns one move direction per agent.
+def speed_const(batch, value):
+    return [value] * len(batch.agents)
+
+
+def speed_normal(batch):
+    # Enemy.current_speed for the whole batch: orientation_vector() times
+    # the boost from touched goals, which is the same for everyone.
+    boost = 1 + 0.1 * sum(g.touched for g in batch.goals)
+    cos = math.cos
+    sin = math.sin
+    sqrt = math.sqrt
+    return [
+        sqrt(cos(a.heading) ** 2 + sin(a.heading) ** 2) * boost for a in batch.agents
+    ]
+
+
+def speed_dash(batch, scale):
+    # Fast off the mark and slowing as the timer runs down. scale is a
+    # number or the name of an agent attribute holding one.
+    if isinstance(scale, str):
+        return [
+            speed * getattr(a, scale) * (a.ticks / a.tick_set)
+            for a, speed in zip(batch.agents, speed_normal(batch))
+        ]
+    return [
+        speed * scale * (a.ticks / a.tick_set)
+        for a, speed in zip(batch.agents, speed_normal(batch))
+    ]
+
+
+SPEEDS = {
+    "const": speed_const,
+    "normal": speed_normal,
+    "dash": speed_dash,
+}
+
+
+def resolve(table, kinds):
+    # [(name, *args), ...] from a machine table as [(function, args), ...],
+    # looked up once when the machine is built.
+    return [(kinds[name], tuple(args)) for name, *args in table]
+
+
+def apply(effects, batch):
+    for fn, args in effects:
+        fn(batch, *args)
+
+
+class Rule:
+    __slots__ = ("guards", "effects", "steer", "speed", "message", "gated", "next")
+
+    # message is said when the rule fires; gated messages are skipped while
+    # the agent is still in its cooldown from the last one.
+    def __init__(
+        self,
+        guards=(),
+        effects=(),
+        steer=("const", 0.0),
+        speed=("const", 0.0),
+        message=None,
+        gated=True,
+        next=None,
+    ):
+        self.guards = resolve(guards, GUARDS)
+        self.effects = resolve(effects, EFFECTS)
+        self.steer = resolve([steer], STEER)[0]
+        self.speed = resolve([speed], SPEEDS)[0]
+        self.message = message
+        self.gated = gated
+        self.next = next
+
+    def match(self, batch):
+        mask = None
+        for fn, args in self.guards:
+            hits = fn(batch, *args)
+            mask = hits if mask is None else [m and h for m, h in zip(mask, hits)]
+        return mask
+
+    def fire(self, batch, out):
+        for fn, args in self.effects:
+            fn(batch, *args)
+        fn, args = self.steer
+        turns = fn(batch, *args)
+        fn, args = self.speed
+        moves = fn(batch, *args)
+        message = self.message
+        if message is None:
+            for i, turn, move in zip(batch.index, turns, moves):
+                out[i] = (turn, move, None)
+        else:
+            for a, i, turn, move in zip(batch.agents, batch.index, turns, moves):
+                said = None
+                if not self.gated:
+                    said = message
+                elif not a.message_active:
+                    a.message_active = True
+                    a.message_cooldown = COOLDOWN
+                    said = message
+                out[i] = (turn, move, said)
+        if self.next is not None:
+            for a in batch.agents:
+                a.state = self.next
+
+
+class State:
+    # resting effects are what an agent left alone in the state does each
+    # tick; the Scheduler replays them for the ticks an agent sat out.
+    __slots__ = ("tick", "rules", "resting")
+
+    def __init__(self, rules, tick=(), resting=()):
+        self.tick = resolve(tick, EFFECTS)
+        self.rules = rules
+        self.resting = resolve(resting, EFFECTS)
+
+
+class Machine:
+    # enabled is called once per batch; while it returns False agents get
+    # the disabled effects and stand still.
+    def __init__(
+        self,
+        start,
+        states,
+        always=(),
+        interrupts=(),
+        enabled=None,
+        disabled=(),
+    ):
+        self.start = start
+        self.states = states
+        self.always = resolve(always, EFFECTS)
+        self.interrupts = interrupts
+        self.enabled = enabled
+        self.disabled = resolve(disabled, EFFECTS)
+
+    def fire(self, rules, batch, out):
+        # Fires the first matching rule for each agent; returns the agents
+        # no rule matched.
+        for rule in rules:
+            if not batch.agents:
+                break
+            mask = rule.match(batch)
+            if mask is None:
+                rule.fire(batch, out)
+                return EMPTY
+            if len(mask) == 1:
+                # Single agent batches are common; skip the split.
+                if mask[0]:
+                    rule.fire(batch, out)
+                    return EMPTY
+                continue
+            hit, batch = batch.split(mask)
+            if hit.agents:
+                rule.fire(hit, out)
+        return batch
+
+    def run(self, state, batch, out):
+        if self.enabled is not None and not self.enabled():
+            apply(self.disabled, batch)
+            for i in batch.index:
+                out[i] = (0.0, 0.0, None)
+            return
+        apply(self.always, batch)
+        batch = self.fire(self.interrupts, batch, out)
+        if not batch.agents:
+            return
+        state = self.states[state]
+        apply(state.tick, batch)
+        self.fire(state.rules, batch, out)
+
+    def rest(self, state, batch):
+        # Catches up agents that sat out the batch's steps in state: the
+        # always effects and the state's resting ones, over all of them at
+        # once.
+        if self.enabled is not None and not self.enabled():
+            return
+        apply(self.always, batch)
+        apply(self.states[state].resting, batch)
+
+    def step(self, agent, percept, goals, comms, dt=TICK):
+        # One agent on its own, for Enemy.ai.
+        out = [None]
+        batch = Batch([agent], [percept], [comms], goals, [0], dt * RATE)
+        self.run(agent.state, batch, out)
+        return out[0]
+
+
+IDLE = (0.0, 0.0, None)
+
+
+def evaluate(agents, percepts, goals, comms, dt=TICK, times=None):
+    # Actions for every agent over a step of dt seconds, stepping all the
+    # agents that share a machine and state as one batch. Batches run in the
+    # order their first agent appears in agents. times, if given, is a dict
+    # that each batch's nanoseconds are added to under "ai.<agent class>".
+    out = [None] * len(agents)
+    steps = dt * RATE
+    groups = {}
+    for i, a in enumerate(agents):
+        key = (a.machine, a.state)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = []
+        group.append(i)
+    for (machine, state), index in groups.items():
+        if machine is None:
+            for i in index:
+                out[i] = IDLE
+            continue
+        batch = Batch(
+            [agents[i] for i in index],
+            [percepts[i] for i in index],
+            [comms[i] for i in index],
+            goals,
+            index,
+            steps,
+        )
+        if times is None:
+            machine.run(state, batch, out)
+            continue
+        t = time.perf_counter_ns()
+        machine.run(state, batch, out)
+        name = "ai." + type(agents[index[0]]).__name__
+        times[name] = times.get(name, 0) + time.perf_counter_ns() - t
+    return out
+
+
+class Scheduler:
+    # Level of detail for evaluate(). Agents that matter run their machine
+    # every tick; the rest run every few ticks and repeat their last turn
+    # and move in between. An agent matters when it sees the player, is
+    # within near of it, is counting down a chase or dash (ticks > 0), has
+    # something on the comms bus, or is within edge of the arena sides,
+    # where a bounce can't wait. Any other agent runs every period ticks for
+    # the first (distance, period) in periods it is within, else every far
+    # ticks, on the ticks where (tick + its index) % period is 0 so that
+    # agents with the same period take turns. Between runs only sight is
+    # checked, so a far agent notices comms at its next run. The per-tick
+    # effects it missed (message cooldown, its state's resting effects) are
+    # caught up just before that run, so they lag by at most far ticks.
+    #
+    # budget caps the seconds spent each tick on agents that don't matter.
+    # Those left over wait for the next tick, most overdue first. Agents
+    # that matter always run, so close pursuit is the same as without the
+    # scheduler; with a budget, runs are no longer reproducible.
+    def __init__(
+        self,
+        width,
+        height,
+        near=150.0,
+        periods=((300.0, 2), (600.0, 4)),
+        far=8,
+        edge=60.0,
+        budget=None,
+        chunk=64,
+    ):
+        self.width = width
+        self.height = height
+        self.near = near
+        self.periods = periods
+        self.far = far
+        self.edge = edge
+        self.budget = budget
+        self.chunk = chunk
+        self.tick = 0
+        # Per agent: last action, tick it last ran and tick it is next due.
+        self.outputs = []
+        self.last = []
+        self.wake = []
+        # Agents run and deferred on the last tick, for stats.
+        self.ran = 0
+        self.deferred = 0
+
+    def talking(self, comms):
+        # Has a value of its own out or is hearing one. Retracted values
+        # stay in own as None; the bus drops them from inboxes.
+        for value in comms.own.values():
+            if value is not None:
+                return True
+        for senders in comms.inbox.values():
+            if senders:
+                return True
+        return False
+
+    def period(self, d2):
+        for distance, period in self.periods:
+            if d2 <= distance * distance:
+                return period
+        return self.far
+
+    def catch_up(self, index, agents, percepts, goals, comms, dt):
+        tick = self.tick
+        outputs = self.outputs
+        last = self.last
+        groups = {}
+        for i in index:
+            skipped = tick - last[i] - 1
+            if skipped > 0 and outputs[i] is not None:
+                a = agents[i]
+                key = (a.machine, a.state, skipped)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = []
+                group.append(i)
+        for (machine, state, skipped), js in groups.items():
+            if machine is None:
+                continue
+            batch = Batch(
+                [agents[i] for i in js],
+                [percepts[i] for i in js],
+                [comms[i] for i in js],
+                goals,
+                js,
+                skipped * dt * RATE,
+            )
+            machine.rest(state, batch)
+
+    def run(self, index, agents, percepts, goals, comms, dt, out, times):
+        self.catch_up(index, agents, percepts, goals, comms, dt)
+        actions = evaluate(
+            [agents[i] for i in index],
+            [percepts[i] for i in index],
+            goals,
+            [comms[i] for i in index],
+            dt,
+            times,
+        )
+        tick = self.tick
+        outputs = self.outputs
+        last = self.last
+        for i, action in zip(index, actions):
+            out[i] = action
+            # Messages are said once, not repeated with the reused action.
+            outputs[i] = (action[0], action[1], None)
+            last[i] = tick
+
+    def evaluate(self, agents, percepts, goals, comms, player, dt=TICK, times=None):
+        n = len(agents)
+        if len(self.outputs) != n:
+            self.outputs = [None] * n
+            self.last = [0] * n
+            self.wake = [0] * n
+        tick = self.tick
+        outputs = self.outputs
+        last = self.last
+        wake = self.wake
+        px = player.x
+        py = player.y
+        near2 = self.near * self.near
+        edge = self.edge
+        right = self.width - edge
+        bottom = self.height - edge
+        now = []
+        due = []
+        for i, a in enumerate(agents):
+            if wake[i] > tick and not percepts[i][0]:
+                continue
+            x = a.x
+            y = a.y
+            d2 = (x - px) ** 2 + (y - py) ** 2
+            c = comms[i]
+            if (
+                outputs[i] is None
+                or d2 <= near2
+                or percepts[i][0]
+                or x < edge
+                or y < edge
+                or x > right
+                or y > bottom
+                or getattr(a, "ticks", 0) > 0
+                or ((c.own or c.inbox) and self.talking(c))
+            ):
+                now.append(i)
+                wake[i] = tick + 1
+                continue
+            period = self.period(d2)
+            wake[i] = tick + period - (tick + i) % period
+            if wake[i] == tick + period or tick - last[i] > period:
+                due.append(i)
+
+        out = list(outputs)
+        if now:
+            self.run(now, agents, percepts, goals, comms, dt, out, times)
+        ran = len(now)
+        if due:
+            if self.budget is None:
+                self.run(due, agents, percepts, goals, comms, dt, out, times)
+                ran += len(due)
+            else:
+                due.sort(key=last.__getitem__)
+                end = time.perf_counter() + self.budget
+                for lo in range(0, len(due), self.chunk):
+                    if time.perf_counter() >= end:
+                        for i in due[lo:]:
+                            wake[i] = tick + 1
+                        break
+                    part = due[lo : lo + self.chunk]
+                    self.run(part, agents, percepts, goals, comms, dt, out, times)
+                    ran += len(part)
+        self.ran = ran
+        self.deferred = len(now) + len(due) - ran
+        self.tick = tick + 1
+        return out
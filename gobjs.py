@@ -1,8 +1,13 @@
+import heapq
 import math
 import random
-import pygame
+from array import array
+from collections import OrderedDict
+import fsm
+import lazy
 
-vec = pygame.math.Vector2
+# Only drawing needs pygame, so it is not imported until something is drawn.
+pygame = lazy.LazyModule("pygame")
 WIDTH = 800
 HEIGHT = 800
 
@@ -10,8 +15,498 @@ RED_ENABLED = True
 BLUE_ENABLED = True
 YELLOW_ENABLED = True
 
+# Continuous collision. Movers that bounce reflect off the arena sides at
+# the moment they touch them, long moves cross walls in radius sized steps
+# and touches are tested along the whole move, so large timesteps neither
+# tunnel nor miss a catch. Off gives the old end of step tests, which
+# replays recorded before this existed need.
+SWEPT = True
+
+
+class Vec2:
+    # The part of pygame.math.Vector2 the AI uses, so the simulation runs
+    # without pygame.
+    __slots__ = ("x", "y")
+
+    def __init__(self, x=0.0, y=None):
+        if y is None:
+            x, y = x
+        self.x = float(x)
+        self.y = float(y)
+
+    def __sub__(self, other):
+        ox, oy = other
+        return Vec2(self.x - ox, self.y - oy)
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __eq__(self, other):
+        if not isinstance(other, Vec2):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Vec2({self.x}, {self.y})"
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y)
+
+    def normalize(self):
+        length = self.length()
+        if length == 0:
+            raise ValueError("Can't normalize Vector of length Zero")
+        return Vec2(self.x / length, self.y / length)
+
+
+vec = Vec2
+
+
+def pygame_ticks():
+    # Default Enemy clock for games driven by pygame's own timer.
+    return pygame.time.get_ticks()
+
+
+# Walls every mover is kept out of; set with set_layout.
+WALLS = []
+
+
+def set_layout(width, height, walls):
+    # The arena and walls movers are kept to. Games own theirs and put them
+    # back here before every step, so games with different layouts can take
+    # turns in one process.
+    global WIDTH, HEIGHT, WALLS
+    WIDTH = width
+    HEIGHT = height
+    WALLS = walls
+
+
+def blocked(x, y, r):
+    for w in WALLS:
+        if w.overlaps(x, y, r):
+            return True
+    return False
+
+
+def sweep_walls(x0, y0, x1, y1, r):
+    # slide() in steps no longer than r, so a long move can't jump a wall.
+    dx = x1 - x0
+    dy = y1 - y0
+    n = math.ceil(math.sqrt(dx * dx + dy * dy) / r) if r > 0 else 1
+    if n <= 1:
+        return slide(x0, y0, x1, y1, r)
+    dx /= n
+    dy /= n
+    x = x0
+    y = y0
+    for _ in range(n):
+        x, y = slide(x, y, x + dx, y + dy, r)
+    return x, y
+
+
+def slide(x0, y0, x1, y1, r):
+    # Where a circle of radius r moving from (x0, y0) to (x1, y1) ends up:
+    # the full move if it is clear, else whichever axis of it is clear, else
+    # nowhere.
+    if not blocked(x1, y1, r):
+        return x1, y1
+    if not blocked(x1, y0, r):
+        return x1, y0
+    if not blocked(x0, y1, r):
+        return x0, y1
+    return x0, y0
+
+
+class SpatialHash:
+    # Uniform grid of buckets keyed on (col, row). Objects added here are
+    # moved between buckets by GObj.move, so queries only ever look at the
+    # few cells around the query point.
+    def __init__(self, cell_size=100):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.max_radius = 0
+
+    def key(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def insert(self, obj):
+        obj.cell = self.key(obj.x, obj.y)
+        obj.index = self
+        self.cells.setdefault(obj.cell, []).append(obj)
+        self.max_radius = max(self.max_radius, obj.radius)
+
+    def remove(self, obj):
+        bucket = self.cells[obj.cell]
+        bucket.remove(obj)
+        if not bucket:
+            del self.cells[obj.cell]
+        obj.index = None
+        obj.cell = None
+
+    def update(self, obj):
+        cell = self.key(obj.x, obj.y)
+        if cell != obj.cell:
+            bucket = self.cells[obj.cell]
+            bucket.remove(obj)
+            if not bucket:
+                del self.cells[obj.cell]
+            obj.cell = cell
+            self.cells.setdefault(cell, []).append(obj)
+
+    def query_radius(self, x, y, r):
+        # Everything whose circle overlaps the circle of radius r at (x, y),
+        # the same rule check_collision uses.
+        reach = r + self.max_radius
+        cx0, cy0 = self.key(x - reach, y - reach)
+        cx1, cy1 = self.key(x + reach, y + reach)
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for obj in self.cells.get((cx, cy), ()):
+                    dx = obj.x - x
+                    dy = obj.y - y
+                    rr = r + obj.radius
+                    if dx * dx + dy * dy < rr * rr:
+                        found.append(obj)
+        return found
+
+
+class Mailbox:
+    # One agent's view of the CommsBus. It reads and writes like the old
+    # shared comms dict: comms["Y"] is the latest value delivered on topic
+    # Y (or the agent's own value if it publishes Y itself), and
+    # comms.update(Y=value) publishes.
+    def __init__(self, bus, owner, topics):
+        self.bus = bus
+        self.owner = owner
+        self.topics = set(topics)
+        self.own = {}
+        self.inbox = {}
+
+    def __getitem__(self, topic):
+        if topic in self.own:
+            return self.own[topic]
+        senders = self.inbox.get(topic)
+        if not senders:
+            return None
+        if len(senders) == 1:
+            for value in senders.values():
+                return value
+        # Several senders on one topic: listen to the closest.
+        owner = self.owner
+        best = None
+        for sender, value in senders.items():
+            d = (sender.x - owner.x) ** 2 + (sender.y - owner.y) ** 2
+            if best is None or d < best[0]:
+                best = (d, value)
+        return best[1]
+
+    def update(self, **topics):
+        for topic, value in topics.items():
+            self.own[topic] = value
+            self.bus.publish(self.owner, topic, value)
+
+
+class CommsBus:
+    # Topic based publish/subscribe between agents. A published value stays
+    # current until its sender replaces it or sets it back to None.
+    # Publishes are collected during a tick and fanned out by deliver() once
+    # per tick, only to subscribers of that topic, or only to those within
+    # the sender's comms_radius when it has one. Radius limited values are
+    # re-fanned every deliver(), so they reach whoever is in range now.
+    def __init__(self, index=None):
+        self.index = index
+        self.subscribers = {}
+        self.boxes = {}
+        self.pending = {}
+        self.current = {}
+        self.reached = {}
+
+    def mailbox(self, owner, topics=None):
+        if topics is None:
+            topics = owner.listens
+        box = Mailbox(self, owner, topics)
+        self.boxes[owner] = box
+        for topic in box.topics:
+            self.subscribers.setdefault(topic, []).append(box)
+        return box
+
+    def publish(self, sender, topic, value):
+        self.pending[(topic, sender)] = value
+
+    def remove(self, owner):
+        # Unsubscribes owner. Anything it published stays current; retract
+        # it or hand it over first.
+        box = self.boxes.pop(owner)
+        for topic in box.topics:
+            self.subscribers[topic].remove(box)
+
+    def handover(self, old, new):
+        # Makes new the sender of everything old has published, keeping
+        # whoever it already reached, for when another object starts
+        # speaking for the same agent.
+        for key in [k for k in self.current if k[1] is old]:
+            topic = key[0]
+            value = self.current.pop(key)
+            self.current[(topic, new)] = value
+            boxes = self.reached.pop(key, [])
+            for box in boxes:
+                senders = box.inbox[topic]
+                del senders[old]
+                senders[new] = value
+            self.reached[(topic, new)] = boxes
+        for key in [k for k in self.pending if k[1] is old]:
+            self.pending[(key[0], new)] = self.pending.pop(key)
+
+    def recipients(self, topic, sender):
+        radius = getattr(sender, "comms_radius", None)
+        if radius is None or self.index is None:
+            return [b for b in self.subscribers.get(topic, ()) if b.owner is not sender]
+        found = []
+        for obj in self.index.query_radius(sender.x, sender.y, radius):
+            box = self.boxes.get(obj)
+            if box is not None and obj is not sender and topic in box.topics:
+                found.append(box)
+        return found
+
+    def deliver(self):
+        pending = self.pending
+        self.pending = {}
+        for key, value in pending.items():
+            old = self.current.get(key)
+            if value is old or (value is not None and old is not None and value == old):
+                continue
+            topic, sender = key
+            for box in self.reached.pop(key, ()):
+                del box.inbox[topic][sender]
+            if value is None:
+                del self.current[key]
+                continue
+            self.current[key] = value
+            boxes = self.recipients(topic, sender)
+            for box in boxes:
+                box.inbox.setdefault(topic, {})[sender] = value
+            self.reached[key] = boxes
+        if self.index is None:
+            return
+        for key, value in self.current.items():
+            topic, sender = key
+            if getattr(sender, "comms_radius", None) is None:
+                continue
+            boxes = self.recipients(topic, sender)
+            old = self.reached.get(key, [])
+            if boxes == old:
+                continue
+            now = set(boxes)
+            for box in old:
+                if box not in now:
+                    del box.inbox[topic][sender]
+            was = set(old)
+            for box in boxes:
+                if box not in was:
+                    box.inbox.setdefault(topic, {})[sender] = value
+            self.reached[key] = boxes
+
+
+class Wall:
+    # Axis aligned rectangle with its top left corner at (x, y).
+    __slots__ = ("x", "y", "w", "h", "color")
+
+    def __init__(self, x, y, w, h, color="gray40"):
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.color = color
+
+    def overlaps(self, x, y, r):
+        x0 = self.x
+        y0 = self.y
+        x1 = x0 + self.w
+        y1 = y0 + self.h
+        if x + r <= x0 or x - r >= x1 or y + r <= y0 or y - r >= y1:
+            return False
+        cx = x0 if x < x0 else x1 if x > x1 else x
+        cy = y0 if y < y0 else y1 if y > y1 else y
+        return (x - cx) ** 2 + (y - cy) ** 2 < r * r
+
+    def draw(self, screen):
+        return pygame.draw.rect(screen, self.color, (self.x, self.y, self.w, self.h))
+
+
+SQRT2 = math.sqrt(2)
+
+
+class FlowField:
+    # Shortest paths to one goal cell over a Navigator's grid. Dijkstra runs
+    # backwards from the goal and only as far as it has to: settle(cell)
+    # carries on from where the last call stopped until that cell is done,
+    # so the field grows out to the farthest chaser and no further. next[c]
+    # is the neighbor to step to from cell c.
+    def __init__(self, nav, goal):
+        n = nav.cols * nav.rows
+        self.nav = nav
+        self.goal = goal
+        self.dist = array("d", [math.inf]) * n
+        self.next = array("l", [-1]) * n
+        self.done = bytearray(n)
+        self.dist[goal] = 0.0
+        self.heap = [(0.0, goal)]
+
+    def settle(self, cell):
+        done = self.done
+        if done[cell]:
+            return True
+        dist = self.dist
+        nxt = self.next
+        heap = self.heap
+        free = self.nav.free
+        cols = self.nav.cols
+        rows = self.nav.rows
+        steps = self.nav.STEPS
+        while heap:
+            d, i = heapq.heappop(heap)
+            if done[i]:
+                continue
+            done[i] = 1
+            row, col = divmod(i, cols)
+            for dc, dr, cost in steps:
+                c = col + dc
+                r = row + dr
+                if c < 0 or r < 0 or c >= cols or r >= rows:
+                    continue
+                j = r * cols + c
+                if not free[j] or done[j]:
+                    continue
+                # No cutting corners past a blocked cell.
+                if dc and dr and not (free[row * cols + c] and free[r * cols + col]):
+                    continue
+                nd = d + cost
+                if nd < dist[j]:
+                    dist[j] = nd
+                    nxt[j] = i
+                    heapq.heappush(heap, (nd, j))
+            if i == cell:
+                return True
+        return False
+
+
+class Navigator:
+    # Grid over the arena for steering around walls. Cells whose centers
+    # are within clearance of a wall are blocked. Chasers going to the same
+    # goal cell share one FlowField; the most recent keep of them are
+    # kept, since walls never move.
+    STEPS = (
+        (1, 0, 1.0),
+        (-1, 0, 1.0),
+        (0, 1, 1.0),
+        (0, -1, 1.0),
+        (1, 1, SQRT2),
+        (1, -1, SQRT2),
+        (-1, 1, SQRT2),
+        (-1, -1, SQRT2),
+    )
+
+    def __init__(self, width, height, walls, cell=20, clearance=10, keep=16):
+        self.cell = cell
+        self.cols = max(1, math.ceil(width / cell))
+        self.rows = max(1, math.ceil(height / cell))
+        self.free = bytearray(b"\x01") * (self.cols * self.rows)
+        for i in range(self.cols * self.rows):
+            cx, cy = self.center(i)
+            for w in walls:
+                if w.overlaps(cx, cy, clearance):
+                    self.free[i] = 0
+                    break
+        self.fields = OrderedDict()
+        self.keep = keep
+
+    def cell_of(self, x, y):
+        col = min(self.cols - 1, max(0, int(x // self.cell)))
+        row = min(self.rows - 1, max(0, int(y // self.cell)))
+        return row * self.cols + col
+
+    def center(self, i):
+        row, col = divmod(i, self.cols)
+        return (col + 0.5) * self.cell, (row + 0.5) * self.cell
+
+    def field(self, goal):
+        field = self.fields.get(goal)
+        if field is None:
+            field = self.fields[goal] = FlowField(self, goal)
+            if len(self.fields) > self.keep:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(goal)
+        return field
+
+    def waypoint(self, x, y, tx, ty):
+        # Where to head next from (x, y) to get to (tx, ty): the target
+        # itself when it is in the same cell or there is no path, else the
+        # center of the next cell along the path.
+        goal = self.cell_of(tx, ty)
+        start = self.cell_of(x, y)
+        if start == goal or not self.free[start]:
+            return tx, ty
+        field = self.field(goal)
+        if not field.settle(start):
+            return tx, ty
+        step = field.next[start]
+        if step == goal:
+            return tx, ty
+        return self.center(step)
+
+
+def perceive(enemies, targets, index=None):
+    # Percepts for every enemy against every target in one pass. Each enemy
+    # gets the (seen, unit_dir, dist) tuple for the closest target it sees.
+    # With index, a SpatialHash holding the enemies, only those it finds
+    # within the longest sight distance of a target are tested; a cone never
+    # reaches further than that, so the rest see nothing.
+    near = None
+    if index is not None and enemies:
+        reach = max([e.sight_distance for e in enemies])
+        near = set()
+        for t in targets:
+            near.update(map(id, index.query_radius(t.x, t.y, reach)))
+    percepts = []
+    for e in enemies:
+        best = (False, None)
+        if near is None or id(e) in near:
+            for t in targets:
+                percept = e.sense(t.x, t.y)
+                if percept[0] and (not best[0] or percept[2] < best[2]):
+                    best = percept
+        if best[0]:
+            e.sight_cone_color = e.sight_cone_color_obj
+        else:
+            e.sight_cone_color = e.sight_cone_color_clear
+        percepts.append(best)
+    return percepts
+
 
 class GObj:
+    __slots__ = (
+        "x",
+        "y",
+        "radius",
+        "speed",
+        "turn_rate",
+        "heading",
+        "sight_distance",
+        "color",
+        "fill",
+        "message_active",
+        "message_cooldown",
+        "index",
+        "cell",
+    )
+
+    # Whether move() bounces off the arena sides when SWEPT is on.
+    bounces = False
 
     def __init__(
         self,
@@ -36,23 +531,138 @@ class GObj:
         self.fill = fill
         self.message_active = False
         self.message_cooldown = 0
+        self.index = None
+        self.cell = None
 
     def pos(self):
         return (self.x, self.y)
 
     def move(self, dt, direction=1.0):
-        self.x += direction * self.speed * dt * math.cos(self.heading)
-        self.y += direction * self.speed * dt * math.sin(self.heading)
+        step = direction * self.speed * dt
+        if SWEPT and self.bounces:
+            x, y = self.reflect(step)
+        else:
+            x = self.x + step * math.cos(self.heading)
+            y = self.y + step * math.sin(self.heading)
+        if WALLS:
+            if SWEPT:
+                x, y = sweep_walls(self.x, self.y, x, y, self.radius)
+            else:
+                x, y = slide(self.x, self.y, x, y, self.radius)
+        self.x = x
+        self.y = y
+        if self.index is not None:
+            self.index.update(self)
 
     def turn(self, dt, direction):
         self.heading += direction * self.turn_rate * dt
 
     def check_collision(self, gameobj):
-        distance = math.sqrt((gameobj.x - self.x) ** 2 + (gameobj.y - self.y) ** 2)
-        if distance < self.radius + gameobj.radius:
-            return True
-        else:
-            return False
+        dx = gameobj.x - self.x
+        dy = gameobj.y - self.y
+        reach = self.radius + gameobj.radius
+        return dx * dx + dy * dy < reach * reach
+
+    def swept_collision(self, gameobj, x0, y0):
+        # check_collision anywhere along a move from (x0, y0) to here, with
+        # gameobj standing still.
+        dx = self.x - x0
+        dy = self.y - y0
+        fx = gameobj.x - x0
+        fy = gameobj.y - y0
+        d2 = dx * dx + dy * dy
+        t = 0.0
+        if d2 > 0:
+            t = min(1.0, max(0.0, (fx * dx + fy * dy) / d2))
+        ex = fx - t * dx
+        ey = fy - t * dy
+        reach = self.radius + gameobj.radius
+        return ex * ex + ey * ey < reach * reach
+
+    def swept_contact(self, gameobj, x0, y0):
+        # The fraction of a move from (x0, y0) to here at which it first
+        # touches gameobj standing still, or None where swept_collision is
+        # False.
+        dx = self.x - x0
+        dy = self.y - y0
+        fx = gameobj.x - x0
+        fy = gameobj.y - y0
+        reach = self.radius + gameobj.radius
+        c = fx * fx + fy * fy - reach * reach
+        if c < 0:
+            return 0.0
+        b = fx * dx + fy * dy
+        if b <= 0:
+            return None
+        d2 = dx * dx + dy * dy
+        disc = b * b - d2 * c
+        if disc <= 0:
+            return None
+        t = (b - math.sqrt(disc)) / d2
+        return t if t < 1.0 else None
+
+    def leave_time(self, x0, y0, rect):
+        # The fraction of a move from (x0, y0) to here at which it was all
+        # the way off rect, or None if it is still on it.
+        if self.onscreen(rect):
+            return None
+        r = self.radius
+        dx = self.x - x0
+        dy = self.y - y0
+        # Past a side along an axis it didn't move on means it started off.
+        t = 1.0
+        if self.x + r < rect[0]:
+            t = min(t, (rect[0] - r - x0) / dx if dx else 0.0)
+        elif self.x - r > rect[2]:
+            t = min(t, (rect[2] + r - x0) / dx if dx else 0.0)
+        if self.y + r < rect[1]:
+            t = min(t, (rect[1] - r - y0) / dy if dy else 0.0)
+        elif self.y - r > rect[3]:
+            t = min(t, (rect[3] + r - y0) / dy if dy else 0.0)
+        return max(t, 0.0)
+
+    def reflect(self, step):
+        # The end of a step along the heading that bounces off the arena
+        # sides, turning the heading the way a reflection does at the
+        # moment the circle touches each side.
+        r = self.radius
+        left = r
+        right = WIDTH - r
+        top = r
+        bottom = HEIGHT - r
+        x = self.x
+        y = self.y
+        heading = self.heading
+        vx = step * math.cos(heading)
+        vy = step * math.sin(heading)
+        # Fraction of the step still to go. Two sides can be hit at once in
+        # a corner, and at most one more after that.
+        rest = 1.0
+        for _ in range(3):
+            tx = ty = math.inf
+            if vx < 0 and x + vx * rest < left:
+                tx = (left - x) / vx
+            elif vx > 0 and x + vx * rest > right:
+                tx = (right - x) / vx
+            if vy < 0 and y + vy * rest < top:
+                ty = (top - y) / vy
+            elif vy > 0 and y + vy * rest > bottom:
+                ty = (bottom - y) / vy
+            hit = min(tx, ty)
+            if hit == math.inf:
+                break
+            hit = max(hit, 0.0)
+            x += vx * hit
+            y += vy * hit
+            rest -= hit
+            if tx <= ty:
+                vx = -vx
+                heading = math.pi - heading
+            if ty <= tx:
+                vy = -vy
+                heading = -heading
+        self.heading = heading
+        return x + vx * rest, y + vy * rest
 
     def onscreen(self, rect):
         if (
@@ -65,11 +675,16 @@ class GObj:
         else:
             return False
 
+    # draw() returns the bounding rect of everything it touched.
     def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (self.x, self.y), self.radius, self.fill)
+        return pygame.draw.circle(
+            screen, self.color, (self.x, self.y), self.radius, self.fill
+        )
 
 
 class Player(GObj):
+    __slots__ = ()
+
     def __init__(
         self,
         x,
@@ -87,8 +702,8 @@ class Player(GObj):
         )
 
     def draw(self, screen):
-        GObj.draw(self, screen)
-        pygame.draw.line(
+        rect = GObj.draw(self, screen)
+        tick = pygame.draw.line(
             screen,
             "black",
             (self.x, self.y),
@@ -98,9 +713,12 @@ class Player(GObj):
             ),
             2,
         )
+        return rect.union(tick)
 
 
 class Goal(GObj):
+    __slots__ = ("touched",)
+
     def __init__(
         self,
         x,
@@ -127,6 +745,34 @@ class Goal(GObj):
 
 
 class Enemy(GObj):
+    __slots__ = (
+        "goals",
+        "rng",
+        "sight_cone_color_clear",
+        "sight_cone_color_obj",
+        "sight_cone_color",
+        "last_target",
+        "wander_rate",
+        "sight_angle",
+        "clock",
+        "nav",
+        "target",
+        "sight_cone",
+        "trig_heading",
+        "trig_angle",
+        "cos_h",
+        "sin_h",
+        "cos_a",
+        "sin_a",
+        "comms_radius",
+        "state",
+    )
+
+    # Comms topics this kind of enemy subscribes to.
+    listens = ()
+    # The fsm.Machine that drives ai(); see the subclasses.
+    machine = None
+
     def __init__(
         self,
         x,
@@ -139,35 +785,33 @@ class Enemy(GObj):
         color,
         fill,
         goals,
+        rng=random,
     ):
         GObj.__init__(
             self, x, y, radius, speed, turn_rate, heading, sight_distance, color, fill
         )
         self.goals = goals
+        self.rng = rng
         self.sight_cone_color_clear = "white"
         self.sight_cone_color_obj = "fuchsia"
         self.sight_cone_color = self.sight_cone_color_clear
         self.last_target = 0
         self.wander_rate = 0.3
         self.sight_angle = math.pi / 6
-        self.target = vec(random.randint(25, WIDTH), random.randint(25, HEIGHT))
-
-        x0 = self.x
-        y0 = self.y
-        x1 = self.x + math.cos(self.heading - self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        y1 = self.y + math.sin(self.heading - self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        x2 = self.x + math.cos(self.heading + self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        y2 = self.y + math.sin(self.heading + self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
+        self.comms_radius = None
+        self.state = self.machine.start if self.machine is not None else None
+        self.clock = pygame_ticks
+        # Navigator for chasing around walls; None in an open arena.
+        self.nav = None
+        self.target = vec(rng.randint(25, WIDTH), rng.randint(25, HEIGHT))
 
-        self.sight_cone = [(x0, y0), (x1, y1), (x2, y2)]
+        # Flat (x0, y0, x1, y1, x2, y2) buffer, refilled in place by draw.
+        self.sight_cone = array("d", (0.0,) * 6)
+        # Heading and sight angle trig, recomputed only when they change.
+        self.trig_heading = None
+        self.trig_angle = None
+        self.cone_trig()
+        self.build_cone()
 
     def orientation(self):
         ox = math.cos(self.heading)
@@ -179,69 +823,103 @@ class Enemy(GObj):
         return math.sqrt(ox**2 + oy**2)
 
     def draw(self, screen):
-        xy0 = self.sight_cone[0]
-        xy1 = self.sight_cone[1]
-        xy2 = self.sight_cone[2]
+        self.build_cone()
+        x0, y0, x1, y1, x2, y2 = self.sight_cone
 
-        pygame.draw.line(
-            screen, self.sight_cone_color, (xy0[0], xy0[1]), (xy1[0], xy1[1]), 1
+        rect = pygame.draw.line(screen, self.sight_cone_color, (x0, y0), (x1, y1), 1)
+        rect.union_ip(
+            pygame.draw.line(screen, self.sight_cone_color, (x1, y1), (x2, y2), 1)
         )
-        pygame.draw.line(
-            screen, self.sight_cone_color, (xy1[0], xy1[1]), (xy2[0], xy2[1]), 1
-        )
-        pygame.draw.line(
-            screen, self.sight_cone_color, (xy2[0], xy2[1]), (xy0[0], xy0[1]), 1
+        rect.union_ip(
+            pygame.draw.line(screen, self.sight_cone_color, (x2, y2), (x0, y0), 1)
         )
 
-        GObj.draw(self, screen)
+        return rect.union(GObj.draw(self, screen))
 
     def update(self, gameobj):
-        ox = gameobj.x
-        oy = gameobj.y
+        percept = self.sense(gameobj.x, gameobj.y)
+        if percept[0]:
+            self.sight_cone_color = self.sight_cone_color_obj
+        else:
+            self.sight_cone_color = self.sight_cone_color_clear
+        return percept
 
-        x0 = self.x
-        y0 = self.y
-        x1 = self.x + math.cos(self.heading - self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        y1 = self.y + math.sin(self.heading - self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        x2 = self.x + math.cos(self.heading + self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
-        y2 = self.y + math.sin(self.heading + self.sight_angle) * (
-            self.radius + self.sight_distance
-        )
+    def cone_trig(self):
+        if self.heading != self.trig_heading:
+            self.trig_heading = self.heading
+            self.cos_h = math.cos(self.heading)
+            self.sin_h = math.sin(self.heading)
+        if self.sight_angle != self.trig_angle:
+            self.trig_angle = self.sight_angle
+            self.cos_a = math.cos(self.sight_angle)
+            self.sin_a = math.sin(self.sight_angle)
 
-        self.sight_cone[0] = (x0, y0)
-        self.sight_cone[1] = (x1, y1)
-        self.sight_cone[2] = (x2, y2)
-
-        for i in range(len(self.sight_cone)):
-            x1 = self.sight_cone[i][0]
-            y1 = self.sight_cone[i][1]
-            x2 = self.sight_cone[(i + 1) % len(self.sight_cone)][0]
-            y2 = self.sight_cone[(i + 1) % len(self.sight_cone)][1]
-            if (x2 - x1) * (oy - y1) - (y2 - y1) * (ox - x1) <= 0:
-                self.sight_cone_color = self.sight_cone_color_clear
-                return (False, None)
-        self.sight_cone_color = self.sight_cone_color_obj
+    def sense(self, ox, oy):
+        # The sight cone is the triangle between the enemy and the two points
+        # reach away at heading -/+ sight_angle. A point is inside it when
+        # it is within sight_angle of the heading and short of the far edge,
+        # which sits reach * cos(sight_angle) ahead.
+        self.cone_trig()
         dx = ox - self.x
         dy = oy - self.y
-        dist = math.sqrt(dx * dx + dy * dy)
-        dx /= dist
-        dy /= dist
-        return (True, (dx, dy), dist)
+        ahead = dx * self.cos_h + dy * self.sin_h
+        if ahead <= 0 or ahead >= (self.radius + self.sight_distance) * self.cos_a:
+            return (False, None)
+        d2 = dx * dx + dy * dy
+        if ahead * ahead <= d2 * self.cos_a * self.cos_a:
+            return (False, None)
+        dist = math.sqrt(d2)
+        return (True, (dx / dist, dy / dist), dist)
 
-    # Base class AI routine
-    def ai(self, percept, goals, comms):
+    def build_cone(self):
+        self.cone_trig()
+        reach = self.radius + self.sight_distance
+        c = self.cos_h
+        s = self.sin_h
+        ca = self.cos_a
+        sa = self.sin_a
+        cone = self.sight_cone
+        cone[0] = self.x
+        cone[1] = self.y
+        cone[2] = self.x + (c * ca + s * sa) * reach
+        cone[3] = self.y + (s * ca - c * sa) * reach
+        cone[4] = self.x + (c * ca - s * sa) * reach
+        cone[5] = self.y + (s * ca + c * sa) * reach
 
-        return (0.0, 0.0, None)
+    def in_cone(self, ox, oy):
+        return self.sense(ox, oy)[0]
 
-    def seek(self, target: pygame.math.Vector2) -> float:
-        desired = (target - vec(self.pos())).normalize()
-        target_angle = math.atan2(desired.y, desired.x)
+    # Base class AI routine. sim.Game runs the machines for all enemies at
+    # once with fsm.evaluate; this is the same thing for one enemy.
+    def ai(self, percept, goals, comms, dt=fsm.TICK):
+        if self.machine is None:
+            return (0.0, 0.0, None)
+        return self.machine.step(self, percept, goals, comms, dt)
+
+    def locate(self, percept):
+        # Where a (seen, unit_dir, dist) percept puts the target.
+        return vec(
+            self.x + percept[1][0] * percept[2], self.y + percept[1][1] * percept[2]
+        )
+
+    def seek(self, target: Vec2) -> float:
+        return self.seek_xy(target.x, target.y)
+
+    def chase(self, target: Vec2) -> float:
+        # seek() that follows the shared flow field around walls.
+        if self.nav is None:
+            return self.seek_xy(target.x, target.y)
+        return self.seek_xy(*self.nav.waypoint(self.x, self.y, target.x, target.y))
+
+    def seek_xy(self, tx, ty):
+        # Same arithmetic as (target - vec(self.pos())).normalize(), without
+        # the temporary vectors.
+        dx = tx - self.x
+        dy = ty - self.y
+        length = math.sqrt(dx * dx + dy * dy)
+        if length == 0:
+            raise ValueError("Can't normalize Vector of length Zero")
+        target_angle = math.atan2(dy / length, dx / length)
         angle = target_angle - self.heading
         angle = (angle + math.pi) % (2 * math.pi) - math.pi
         if abs(angle) > self.wander_rate:
@@ -249,9 +927,9 @@ class Enemy(GObj):
 
         return angle
 
-    def update_message_state(self) -> None:
+    def update_message_state(self, steps=1.0) -> None:
         if self.message_active:
-            self.message_cooldown -= 1
+            self.message_cooldown -= steps
             if self.message_cooldown <= 0:
                 self.message_active = False
 
@@ -260,6 +938,60 @@ class Enemy(GObj):
 
 
 class EnemyYellow(Enemy):
+    __slots__ = ("ticks", "dt")
+    listens = ("B",)
+    # Wanders until it sees the player, then chases for a few ticks and
+    # calls it in on Y. Heckles Blue when Blue dashes off.
+    machine = fsm.Machine(
+        start="wander",
+        enabled=lambda: YELLOW_ENABLED,
+        always=[("messages",)],
+        interrupts=[
+            fsm.Rule(
+                guards=[("quiet",), ("heard", "B", "Nyoom!")],
+                steer=("const", 0),
+                speed=("const", 0),
+                message=("How is that desk chair so fast?", 2000, None),
+            ),
+        ],
+        states={
+            "wander": fsm.State(
+                [
+                    fsm.Rule(
+                        guards=[("seen",)],
+                        effects=[
+                            ("timer", 5),
+                            ("target_seen",),
+                            ("publish", "Y", "target"),
+                        ],
+                        steer=("chase",),
+                        speed=("normal",),
+                        message=("Get em' Blue!", 2000, None),
+                        next="chase",
+                    ),
+                    fsm.Rule(
+                        effects=[("publish", "Y")],
+                        steer=("wander",),
+                        speed=("normal",),
+                    ),
+                ]
+            ),
+            "chase": fsm.State(
+                [
+                    fsm.Rule(
+                        guards=[("timer_done",)],
+                        effects=[("publish", "Y")],
+                        steer=("chase",),
+                        speed=("normal",),
+                        next="wander",
+                    ),
+                    fsm.Rule(steer=("chase",), speed=("normal",)),
+                ],
+                tick=[("countdown",)],
+            ),
+        },
+    )
+
     def __init__(
         self,
         x,
@@ -272,6 +1004,7 @@ class EnemyYellow(Enemy):
         color="yellow",
         fill=0,
         goals=[],
+        rng=random,
     ):
         Enemy.__init__(
             self,
@@ -285,70 +1018,79 @@ class EnemyYellow(Enemy):
             color,
             fill,
             goals,
+            rng,
         )
         self.ticks = 0
 
     def wander(self) -> float:
-        tick_count = pygame.time.get_ticks()
+        tick_count = self.clock()
         self.dt = (tick_count - self.last_target) / 1000
         if tick_count - self.last_target > 300:
             self.target = vec(
-                random.randint(25, WIDTH - 25),
-                random.randint(25, HEIGHT - 25),
+                self.rng.randint(25, WIDTH - 25),
+                self.rng.randint(25, HEIGHT - 25),
             )
             self.last_target = tick_count
         return self.seek(self.target)
 
-    def ai(self, percept, goals, comms):
-        if YELLOW_ENABLED:
-            self.update_message_state()
-            if not self.message_active:
-                if comms["B"] == "Nyoom!":
-                    self.message_active = True
-                    self.message_cooldown = 120
-                    return (
-                        0,
-                        0,
-                        ("How is that desk chair so fast?", 2000, None),
-                    )
-
-            speed = self.current_speed(goals)
-            if self.ticks > 0:
-                self.ticks -= 1
-                direction = self.seek(self.target)
-                if self.ticks == 0:
-                    comms.update(Y=None)
-                return (direction, speed, None)
-            elif self.ticks == 0 and percept[0]:
-                self.ticks = 5
-                player_x = self.x + percept[1][0] * percept[2]
-                player_y = self.y + percept[1][1] * percept[2]
-                self.target = vec(player_x, player_y)
-                direction = self.seek(self.target)
-                comms.update(Y=self.target)
-                if not self.message_active:
-                    self.message_active = True
-                    self.message_cooldown = 120
-                    return (
-                        direction,
-                        speed,
-                        ("Get em' Blue!", 2000, None),
-                    )
-                else:
-                    return (
-                        direction,
-                        speed,
-                        None,
-                    )
-
-            direction = self.wander()
-            comms.update(Y=None)
-            return (direction, speed, None)
-        else:
-            return (0.0, 0.0, None)
+
+# Outputs and effects shared by Blue's ways into and through a dash.
+BLUE_DASH = {"steer": ("chase",), "speed": ("dash", "lunge")}
+BLUE_LUNGE = [("sight_charge",), ("timer", "tick_set")]
 
 
 class EnemyBlue(Enemy):
+    __slots__ = ("ticks", "tick_set", "lunge", "sight_distance_original", "sight_dec")
+    listens = ("Y", "R")
+    # Spins in place, seeing further as goals are touched, until it sees the
+    # player or hears about it on Y or R; then dashes at the spot.
+    machine = fsm.Machine(
+        start="idle",
+        enabled=lambda: BLUE_ENABLED,
+        always=[("messages",), ("retract", "B", "Nyoom!")],
+        states={
+            "idle": fsm.State(
+                [
+                    fsm.Rule(
+                        guards=[("seen",)],
+                        effects=BLUE_LUNGE
+                        + [("target_seen",), ("publish", "B", "Nyoom!")],
+                        message=("Nyoom!", 2000),
+                        next="dash",
+                        **BLUE_DASH,
+                    ),
+                    fsm.Rule(
+                        guards=[("heard", "Y")],
+                        effects=BLUE_LUNGE + [("target_heard", "Y")],
+                        message=("On it Boss!", 2000),
+                        next="dash",
+                        **BLUE_DASH,
+                    ),
+                    fsm.Rule(
+                        guards=[("heard", "R")],
+                        effects=BLUE_LUNGE + [("target_heard", "R")],
+                        message=("On my way!", 2000),
+                        next="dash",
+                        **BLUE_DASH,
+                    ),
+                    fsm.Rule(
+                        effects=[("sight_grow",), ("publish", "B")],
+                        steer=("const", 0.5),
+                        speed=("const", 0.0),
+                    ),
+                ],
+                resting=[("sight_grow",)],
+            ),
+            "dash": fsm.State(
+                [
+                    fsm.Rule(guards=[("timer_done",)], next="idle", **BLUE_DASH),
+                    fsm.Rule(**BLUE_DASH),
+                ],
+                tick=[("countdown",), ("sight_decay",)],
+            ),
+        },
+    )
+
     def __init__(
         self,
         x,
@@ -361,6 +1103,7 @@ class EnemyBlue(Enemy):
         color="dodgerblue",
         fill=0,
         goals=[],
+        rng=random,
     ):
         Enemy.__init__(
             self,
@@ -374,115 +1117,62 @@ class EnemyBlue(Enemy):
             color,
             fill,
             goals,
+            rng,
         )
 
         self.ticks = 0
         self.sight_angle = math.pi / 32
         self.tick_set = 60
+        # Dash speed as a multiple of the normal speed.
+        self.lunge = 4.5
         self.wander_rate = 0.4
-        self.sight_distance_original = 180
-
-    # This is the ai routing for the type B enemy.
-    def ai(self, percept, goals, comms):
-        if BLUE_ENABLED:
-            self.update_message_state()
-            if comms["B"] == "Nyoom!":
-                comms.update(B=None)
-            speed = self.current_speed(goals)
-            if self.ticks > 0:
-                self.ticks -= 1
-                if self.sight_distance > self.sight_distance_original:
-                    self.sight_distance -= self.sight_dec
-                else:
-                    self.sight_distance = self.sight_distance_original
-                direction = self.seek(self.target)
-                return (
-                    direction,
-                    speed * 4.5 * (self.ticks / self.tick_set),
-                    None,
-                )
-            elif (self.ticks == 0) and (percept[0]):
-                self.sight_dec = (
-                    self.sight_distance - self.sight_distance_original
-                ) / self.tick_set
-                self.ticks = self.tick_set
-                player_x = self.x + percept[1][0] * percept[2]
-                player_y = self.y + percept[1][1] * percept[2]
-                self.target = vec(player_x, player_y)
-                direction = self.seek(self.target)
-                comms.update(B="Nyoom!")
-                if not self.message_active:
-                    self.message_active = True
-                    self.message_cooldown = 120
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        ("Nyoom!", 2000),
-                    )
-                else:
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        None,
-                    )
-            elif (self.ticks == 0) and comms["Y"] != None:
-                self.sight_dec = (
-                    self.sight_distance - self.sight_distance_original
-                ) / self.tick_set
-
-                self.ticks = self.tick_set
-                self.target = comms["Y"]
-                direction = self.seek(self.target)
-                if not self.message_active:
-                    self.message_active = True
-                    self.message_cooldown = 120
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        ("On it Boss!", 2000),
-                    )
-                else:
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        None,
-                    )
-            elif (self.ticks == 0) and comms["R"] != None:
-                self.sight_dec = (
-                    self.sight_distance - self.sight_distance_original
-                ) / self.tick_set
-
-                self.ticks = self.tick_set
-                self.target = comms["R"]
-                direction = self.seek(self.target)
-                if not self.message_active:
-                    self.message_active = True
-                    self.message_cooldown = 120
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        ("On my way!", 2000),
-                    )
-                else:
-                    return (
-                        direction,
-                        speed * 4.5 * (self.ticks / self.tick_set),
-                        None,
-                    )
-
-            self.sight_distance += sum([x.touched for x in goals])
-
-            comms.update(B=None)
-            return (
-                0.5,
-                0.0,
-                None,
-            )
-        else:
-            return (0.0, 0.0, None)
+        self.sight_distance_original = sight_distance
 
 
 class EnemyRed(Enemy):
+    __slots__ = ("ticks", "last_bounce")
+    # Bounces around the arena until it sees the player, then stops and
+    # holds the sighting on R while it turns toward it.
+    bounces = True
+    machine = fsm.Machine(
+        start="patrol",
+        enabled=lambda: RED_ENABLED,
+        disabled=[("publish", "R")],
+        states={
+            "patrol": fsm.State(
+                [
+                    fsm.Rule(
+                        guards=[("seen",)],
+                        effects=[
+                            ("timer", 30),
+                            ("target_seen",),
+                            ("publish", "R", "target"),
+                        ],
+                        steer=("const", 0.0),
+                        speed=("const", 0),
+                        message=("I see them!", 2000, None),
+                        gated=False,
+                        next="lock",
+                    ),
+                    fsm.Rule(steer=("bounce",), speed=("normal",)),
+                ]
+            ),
+            "lock": fsm.State(
+                [
+                    fsm.Rule(
+                        guards=[("timer_done",)],
+                        effects=[("publish", "R")],
+                        steer=("seek",),
+                        speed=("const", 0),
+                        next="patrol",
+                    ),
+                    fsm.Rule(steer=("seek",), speed=("const", 0)),
+                ],
+                tick=[("countdown",)],
+            ),
+        },
+    )
+
     def __init__(
         self,
         x,
@@ -495,6 +1185,7 @@ class EnemyRed(Enemy):
         color="red",
         fill=0,
         goals=[],
+        rng=random,
     ):
         Enemy.__init__(
             self,
@@ -508,6 +1199,7 @@ class EnemyRed(Enemy):
             color,
             fill,
             goals,
+            rng,
         )
 
         self.ticks = 0
@@ -521,58 +1213,41 @@ class EnemyRed(Enemy):
             "bottom": self.y >= HEIGHT - self.radius,
         }
 
-    def ai(self, percept, goals, comms):
-        speed = self.current_speed(goals)
-        if RED_ENABLED:
-            direction = 0.0
-            if self.ticks > 0:
-                self.ticks -= 1
-                direction = self.seek(self.target)
-                if self.ticks == 0:
-                    comms.update(R=None)
-                return (direction, 0, None)
-            elif self.ticks == 0 and percept[0]:
-                self.ticks = 30
-                player_x = self.x + percept[1][0] * percept[2]
-                player_y = self.y + percept[1][1] * percept[2]
-                self.target = vec(player_x, player_y)
-                comms.update(R=self.target)
-                return (direction, 0, ("I see them!", 2000, None))
-            elif self.ticks == 0 and not percept[0]:
-                screen_edge = self.check_screen_edges()
-                heading_checker = self.heading % math.pi
-                noise = random.uniform(-0.1, 0.1)
-                if screen_edge["left"] and self.last_bounce != "left":
-                    self.last_bounce = "left"
-                    if heading_checker >= math.pi / 2 and heading_checker <= math.pi:
-                        direction = math.pi + self.heading
-                    elif heading_checker >= 0 and heading_checker <= math.pi / 2:
-                        direction = math.pi / 2 - self.heading
-                    direction += noise
-                if screen_edge["right"] and self.last_bounce != "right":  #
-                    self.last_bounce = "right"
-                    if heading_checker <= math.pi / 2 and heading_checker >= 0:
-                        direction = math.pi / 2 - self.heading
-                    elif heading_checker >= math.pi / 2 and heading_checker <= math.pi:
-                        direction = math.pi + self.heading
-                    direction += noise
-                if screen_edge["top"] and self.last_bounce != "top":
-                    self.last_bounce = "top"
-                    if heading_checker <= math.pi / 2 and heading_checker >= 0:
-                        direction = math.pi / 2 + self.heading
-                    elif heading_checker >= math.pi / 2 and heading_checker <= math.pi:
-                        direction = math.pi - self.heading
-                    direction += noise
-                if screen_edge["bottom"] and self.last_bounce != "bottom":
-                    self.last_bounce = "bottom"
-                    if heading_checker <= math.pi / 2 and heading_checker >= 0:
-                        direction = math.pi / 2 + self.heading
-                    elif heading_checker <= math.pi and heading_checker >= math.pi / 2:
-                        direction = math.pi - self.heading
-                    direction += noise
-                return (direction % math.pi, speed, None)
-            comms.update(R=None)
-            return (0.0, speed, None)
-        else:
-            comms.update(R=None)
-            return (0.0, 0.0, None)
+    def bounce(self):
+        # With SWEPT, move() reflects off the edges itself.
+        if SWEPT:
+            return 0.0
+        # Reflect off whichever screen edge was hit, other than the last one.
+        screen_edge = self.check_screen_edges()
+        heading_checker = self.heading % math.pi
+        noise = self.rng.uniform(-0.1, 0.1)
+        direction = 0.0
+        if screen_edge["left"] and self.last_bounce != "left":
+            self.last_bounce = "left"
+            if heading_checker >= math.pi / 2 and heading_checker <= math.pi:
+                direction = math.pi + self.heading
+            elif heading_checker >= 0 and heading_checker <= math.pi / 2:
+                direction = math.pi / 2 - self.heading
+            direction += noise
+        if screen_edge["right"] and self.last_bounce != "right":  #
+            self.last_bounce = "right"
+            if heading_checker <= math.pi / 2 and heading_checker >= 0:
+                direction = math.pi / 2 - self.heading
+            elif heading_checker >= math.pi / 2 and heading_checker <= math.pi:
+                direction = math.pi + self.heading
+            direction += noise
+        if screen_edge["top"] and self.last_bounce != "top":
+            self.last_bounce = "top"
+            if heading_checker <= math.pi / 2 and heading_checker >= 0:
+                direction = math.pi / 2 + self.heading
+            elif heading_checker >= math.pi / 2 and heading_checker <= math.pi:
+                direction = math.pi - self.heading
+            direction += noise
+        if screen_edge["bottom"] and self.last_bounce != "bottom":
+            self.last_bounce = "bottom"
+            if heading_checker <= math.pi / 2 and heading_checker >= 0:
+                direction = math.pi / 2 + self.heading
+            elif heading_checker <= math.pi and heading_checker >= math.pi / 2:
+                direction = math.pi - self.heading
+            direction += noise
+        return direction % math.pi
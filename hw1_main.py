@@ -1,8 +1,21 @@
-import pygame
-import pygame.freetype
+import argparse
 import math
 import random
-import gobjs
+import time
+from collections import OrderedDict
+import fsm
+import instrument
+import lazy
+import replay
+import scenarios
+import sim
+
+# pygame and the font load on first use, so importing this module (or
+# anything that imports it) stays cheap.
+pygame = lazy.LazyModule("pygame")
+freetype = lazy.LazyModule("pygame.freetype")
+FONT_PATH = "JuliaMono-Bold.ttf"
+FONT_SIZE = 18
 
 
 class Display:
@@ -12,150 +25,472 @@ class Display:
         self.run = True
         self.delta = 0
         self.font = None
+        self.font_path = FONT_PATH
+        self.font_size = FONT_SIZE
+        # Rendered text surfaces keyed on (text, color, size), least
+        # recently used first.
+        self.text_cache = OrderedDict()
+        self.text_cache_size = 64
 
     def draw_gobj(self, gobj):
         pygame.draw.circle(self.screen, gobj.color, gobj.pos(), gobj.radius)
 
+    def load_font(self):
+        if not freetype.get_init():
+            freetype.init()
+        self.font = freetype.Font(self.font_path, self.font_size)
+        return self.font
+
+    def render_text(self, msg, color, size=None):
+        if self.font is None:
+            self.load_font()
+        size = size or self.font.size
+        key = (msg, color, size)
+        cached = self.text_cache.get(key)
+        if cached is None:
+            cached = self.font.render(msg, color, size=size)
+            self.text_cache[key] = cached
+            if len(self.text_cache) > self.text_cache_size:
+                self.text_cache.popitem(last=False)
+        else:
+            self.text_cache.move_to_end(key)
+        return cached
+
     def draw_text(self, msg, x, y, color):
-        surface, rect = self.font.render(msg, color)
-        self.screen.blit(surface, (x - rect.w // 2, y - rect.h))
+        surface, rect = self.render_text(msg, color)
+        return self.screen.blit(surface, (x - rect.w // 2, y - rect.h))
+
+    def draw_hud(self, lines, x=4, y=4, color="gray70", size=12):
+        # Left aligned block of lines; returns the rects it covered.
+        rects = []
+        for line in lines:
+            surface, rect = self.render_text(line, color, size)
+            rects.append(self.screen.blit(surface, (x, y)))
+            y += rect.h + 3
+        return rects
+
+
+class DirtyRenderer:
+    # Keeps the background and goals on an offscreen surface and only
+    # pushes the parts of the window that moving things touched.
+    def __init__(self, display, goals, walls=()):
+        self.display = display
+        self.goals = goals
+        self.static = pygame.Surface(display.screen.get_size())
+        self.static.fill("black")
+        for w in walls:
+            w.draw(self.static)
+        for g in goals:
+            g.draw(self.static)
+        self.touched = [g.is_touched() for g in goals]
+        self.dirty = []
+        self.full = True
+
+    def draw(self, game, hud=None, stats=None):
+        if stats is not None:
+            t = time.perf_counter_ns()
+        screen = self.display.screen
+        # Goals only change when they are touched.
+        for i, g in enumerate(self.goals):
+            if g.is_touched() != self.touched[i]:
+                self.touched[i] = g.is_touched()
+                self.dirty.append(g.draw(self.static))
+
+        # Erase last frame's moving things by restoring the static layer.
+        if self.full:
+            screen.blit(self.static, (0, 0))
+        else:
+            for rect in self.dirty:
+                screen.blit(self.static, rect, rect)
+        rects = self.dirty
+        self.dirty = []
+
+        for msg in game.msgs:
+            self.dirty.append(
+                self.display.draw_text(
+                    msg[0][0], msg[1].x, msg[1].y - (msg[1].radius + 3), msg[1].color
+                )
+            )
+        for e in game.enemies:
+            self.dirty.append(e.draw(screen))
+        self.dirty.append(game.player.draw(screen))
+        if hud:
+            self.dirty.extend(self.display.draw_hud(hud))
+        if stats is not None:
+            t = stats.lap("draw.dirty", t)
+
+        if self.full:
+            self.full = False
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects + self.dirty)
+        if stats is not None:
+            stats.lap("flip", t)
+
+
+class SpriteRenderer:
+    # Draws each frame as one Surface.blits call. Circles are rasterized
+    # once per (radius, color, fill); sight cones and the player's heading
+    # tick are rasterized per heading bucket, so headings snap to one of
+    # buckets directions and cone reach to steps of reach_step pixels.
+    # Cones are kept least recently used first, at most cone_cache_size.
+    KEY = (255, 0, 255)
+
+    def __init__(
+        self, display, goals, walls=(), buckets=64, reach_step=4, cone_cache_size=1024
+    ):
+        self.display = display
+        self.goals = goals
+        self.buckets = buckets
+        self.reach_step = reach_step
+        self.static = pygame.Surface(display.screen.get_size())
+        self.static.fill("black")
+        for w in walls:
+            w.draw(self.static)
+        for g in goals:
+            g.draw(self.static)
+        self.touched = [g.is_touched() for g in goals]
+        self.circles = {}
+        self.players = {}
+        self.cones = OrderedDict()
+        self.cone_cache_size = cone_cache_size
+
+    def bucket(self, heading):
+        return round(heading / math.tau * self.buckets) % self.buckets
+
+    def sprite(self, w, h):
+        surface = pygame.Surface((w, h))
+        surface.fill(self.KEY)
+        surface.set_colorkey(self.KEY, pygame.RLEACCEL)
+        return surface
+
+    def circle(self, radius, color, fill):
+        key = (radius, color, fill)
+        cached = self.circles.get(key)
+        if cached is None:
+            r = math.ceil(radius)
+            surface = self.sprite(2 * r + 2, 2 * r + 2)
+            pygame.draw.circle(surface, color, (r + 1, r + 1), radius, fill)
+            cached = self.circles[key] = (surface, -r - 1, -r - 1)
+        return cached
+
+    def player(self, p):
+        b = self.bucket(p.heading)
+        key = (p.radius, p.color, p.fill, b)
+        cached = self.players.get(key)
+        if cached is None:
+            surface, dx, dy = self.circle(p.radius, p.color, p.fill)
+            surface = surface.copy()
+            a = b * math.tau / self.buckets
+            c = -dx
+            end = (c + math.cos(a) * p.radius, c + math.sin(a) * p.radius)
+            pygame.draw.line(surface, "black", (c, c), end, 2)
+            surface.set_colorkey(self.KEY, pygame.RLEACCEL)
+            cached = self.players[key] = (surface, dx, dy)
+        return cached
+
+    def cone(self, e):
+        step = self.reach_step
+        reach = round((e.radius + e.sight_distance) / step) * step
+        b = self.bucket(e.heading)
+        key = (reach, e.sight_angle, e.sight_cone_color, b)
+        cones = self.cones
+        cached = cones.get(key)
+        if cached is not None:
+            cones.move_to_end(key)
+            return cached
+        a = b * math.tau / self.buckets
+        points = [
+            (0.0, 0.0),
+            (math.cos(a - e.sight_angle) * reach, math.sin(a - e.sight_angle) * reach),
+            (math.cos(a + e.sight_angle) * reach, math.sin(a + e.sight_angle) * reach),
+        ]
+        x0 = math.floor(min(x for x, _ in points)) - 1
+        y0 = math.floor(min(y for _, y in points)) - 1
+        x1 = math.ceil(max(x for x, _ in points)) + 1
+        y1 = math.ceil(max(y for _, y in points)) + 1
+        surface = self.sprite(x1 - x0 + 1, y1 - y0 + 1)
+        pygame.draw.polygon(
+            surface, e.sight_cone_color, [(x - x0, y - y0) for x, y in points], 1
+        )
+        cached = cones[key] = (surface, x0, y0)
+        if len(cones) > self.cone_cache_size:
+            cones.popitem(last=False)
+        return cached
+
+    def compose(self, game, hud=None):
+        # The (surface, position) list for one frame, back to front.
+        for i, g in enumerate(self.goals):
+            if g.is_touched() != self.touched[i]:
+                self.touched[i] = g.is_touched()
+                g.draw(self.static)
+        batch = [(self.static, (0, 0))]
+        render_text = self.display.render_text
+        for msg in game.msgs:
+            e = msg[1]
+            surface, rect = render_text(msg[0][0], e.color)
+            batch.append((surface, (e.x - rect.w // 2, e.y - (e.radius + 3) - rect.h)))
+        circle = self.circle
+        cone = self.cone
+        for e in game.enemies:
+            x = int(e.x)
+            y = int(e.y)
+            surface, dx, dy = cone(e)
+            batch.append((surface, (x + dx, y + dy)))
+            surface, dx, dy = circle(e.radius, e.color, e.fill)
+            batch.append((surface, (x + dx, y + dy)))
+        p = game.player
+        surface, dx, dy = self.player(p)
+        batch.append((surface, (int(p.x) + dx, int(p.y) + dy)))
+        if hud:
+            y = 4
+            for line in hud:
+                surface, rect = render_text(line, "gray70", 12)
+                batch.append((surface, (4, y)))
+                y += rect.h + 3
+        return batch
+
+    def draw(self, game, hud=None, stats=None):
+        if stats is not None:
+            t = time.perf_counter_ns()
+        batch = self.compose(game, hud)
+        if stats is not None:
+            t = stats.lap("draw.compose", t)
+        self.display.screen.blits(batch, False)
+        if stats is not None:
+            t = stats.lap("draw.blits", t)
+        pygame.display.flip()
+        if stats is not None:
+            stats.lap("flip", t)
 
 
 def init_display(sw, sh):
-    pygame.init()
+    # Only the display is started here; the font waits for the first text.
+    pygame.display.init()
     screen = pygame.display.set_mode((sw, sh))
     clock = pygame.time.Clock()
-    display = Display(screen, clock)
-    display.font = pygame.freetype.Font("JuliaMono-Bold.ttf", 18)
-    return display
+    return Display(screen, clock)
 
 
-def handle_input(keys, dt, player, win_w, win_h):
-    pos = player.pos()
-    r = player.radius
-
+def keyboard_action(keys):
+    turn = 0
+    move = 0
     if keys[pygame.K_a]:
-        player.turn(dt, -1)
+        turn = -1
     elif keys[pygame.K_d]:
-        player.turn(dt, 1)
+        turn = 1
     if keys[pygame.K_w]:
-        player.move(dt)
+        move = 1.0
     elif keys[pygame.K_s]:
-        player.move(dt, -1.0)
+        move = -1.0
+    return (turn, move)
+
+
+def handle_input(keys, dt, player, win_w, win_h):
+    turn, move = keyboard_action(keys)
+    if turn:
+        player.turn(dt, turn)
+    if move:
+        player.move(dt, move)
 
 
 def gather_perecpts(enemy, player):
     return enemy.can_see(player)
 
 
-def game_loop(display):
+def keyboard_controller(game, dt):
+    return keyboard_action(pygame.key.get_pressed())
+
+
+def draw_frame(display, game, hud=None, stats=None):
+    if stats is not None:
+        t = time.perf_counter_ns()
+
+    display.screen.fill("black")
+    for w in game.walls:
+        w.draw(display.screen)
+
+    for msg in game.msgs:
+        display.draw_text(
+            msg[0][0], msg[1].x, msg[1].y - (msg[1].radius + 3), msg[1].color
+        )
+    if stats is not None:
+        t = stats.lap("draw.text", t)
+
+    for g in game.goals:
+        g.draw(display.screen)
+    if stats is not None:
+        t = stats.lap("draw.goals", t)
+
+    for e in game.enemies:
+        e.draw(display.screen)
+    if stats is not None:
+        t = stats.lap("draw.enemies", t)
+
+    game.player.draw(display.screen)
+    if hud:
+        display.draw_hud(hud)
+
+    pygame.display.flip()
+    if stats is not None:
+        stats.lap("flip", t)
+
+
+def game_loop(
+    display,
+    controller=keyboard_controller,
+    seed=None,
+    record=None,
+    dirty=False,
+    sprites=False,
+    stats_path=None,
+    hud=False,
+    fps=60,
+    sim_hz=60,
+    max_steps=5,
+    scenario=None,
+    lod=False,
+    ai_budget=None,
+):
 
     win_w, win_h = pygame.display.get_window_size()
-    d_rect = (0, 0, win_w, win_h)
 
-    # NOTE: You are welcome to modify some aspects of the following
-    # The player and enemy classes do take additional parameters
+    # NOTE: You are welcome to modify some aspects of the scenario in
+    # sim.Game. The player and enemy classes do take additional parameters
     # which are currently set to defaults. You are welcome to
     # override them to get a different scenario.
-
-    # Possible Player start locations (x, y, heading)
-    start_locs = [
-        (50, 50, math.pi / 4),
-        (win_w // 2, 50, math.pi / 2),
-        (win_w - 50, 50, 3 * math.pi / 4),
-        (50, win_h // 2, 0),
-        (win_w - 50, win_h // 2, math.pi),
-        (50, win_h - 50, -math.pi / 4),
-        (win_w // 2, win_h - 50, -math.pi / 2),
-        (win_w - 50, win_h - 50, -3 * math.pi / 4),
-    ]
-    # Randomly choose one.
-    player_start = random.choice(start_locs)
-    player = gobjs.Player(player_start[0], player_start[1], heading=player_start[2])
-
-    # Goals. The number passed into the Goal contructor are the x,y coords.
-    goals = [
-        gobjs.Goal(200, 200),
-        gobjs.Goal(win_w - 200, 200),
-        gobjs.Goal(200, win_h - 200),
-        gobjs.Goal(win_w - 200, win_h - 200),
-        gobjs.Goal(win_w // 2, win_h // 2),
-    ]
-
-    # The enemies.
-    enemy1 = gobjs.EnemyYellow(win_w // 2 + 50, win_h // 2, heading=0)
-    enemy2 = gobjs.EnemyBlue(win_w // 2 - 50, win_h // 2, heading=math.pi)
-    enemy3 = gobjs.EnemyRed(win_w // 2, win_h // 2 - 50, heading=math.pi / 2)
-    enemies = [enemy1, enemy2, enemy3]
-    comms = {"R": None, "B": None, "Y": None}
-
-    tick = 0
-    goal_count = 0
-    winner = "Draw"
-    msgs = []
+    # Game time is the sum of the simulation steps rather than the wall
+    # clock, so a recorded game replays exactly.
+    clock = sim.VirtualClock()
+    recorder = None
+    if record is not None:
+        if seed is None:
+            seed = random.getrandbits(64)
+        rng = replay.RecordingRandom(seed)
+        game = sim.Game(win_w, win_h, clock, seed=seed, rng=rng, scenario=scenario)
+        recorder = replay.Recorder(record, game, 1 / sim_hz)
+    else:
+        game = sim.Game(win_w, win_h, clock, seed=seed, scenario=scenario)
+    if lod:
+        game.scheduler = fsm.Scheduler(win_w, win_h, budget=ai_budget)
+    renderer = None
+    if sprites:
+        renderer = SpriteRenderer(display, game.goals, game.walls)
+    elif dirty:
+        renderer = DirtyRenderer(display, game.goals, game.walls)
+
+    stats = None
+    hud_lines = None
+    if stats_path is not None or hud:
+        stats = instrument.FrameStats()
+        game.stats = stats
+
+    # The simulation advances in fixed steps of step_dt no matter how fast
+    # frames are drawn. Frame time piles up in acc and is paid out one
+    # step at a time, at most max_steps per frame; drawing then places
+    # things between the last two steps.
+    step_dt = 1 / sim_hz
+    acc = 0.0
+    prev = game.snapshot()
 
     # You probably don't need to modify anything in the main loop
     while display.run:
-        dt = display.clock.tick(60) / 1000
+        acc += display.clock.tick(fps) / 1000
+        if stats is not None:
+            frame_start = t = time.perf_counter_ns()
 
         # Check event queue for quit
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 display.run = False
-
-        display.screen.fill("black")
-
-        next_msgs = []
-        for msg in msgs:
-            if pygame.time.get_ticks() - msg[2] < msg[0][1]:
-                display.draw_text(
-                    msg[0][0], msg[1].x, msg[1].y - (msg[1].radius + 3), msg[1].color
-                )
-                next_msgs.append(msg)
-        msgs = next_msgs
-
-        for g in goals:
-            if not g.is_touched():
-                if g.check_collision(player):
-                    g.touch()
-                    goal_count += 1
-                    if goal_count == len(goals):
-                        display.run = False
-                        winner = "Player"
-            g.draw(display.screen)
-
-        # Call Enemy AI and draw
-        for e in enemies:
-            mt = e.ai(e.update(player), goals, comms)
-            e.turn(dt, mt[0])
-            e.move(dt, mt[1])
-            if mt[2] is not None:
-                msgs.append((mt[2], e, pygame.time.get_ticks()))
-            if e.check_collision(player):
-                display.run = False
-                winner = "AI"
-            if not e.onscreen(d_rect):
-                display.run = False
-                winner = "Player"
-            e.draw(display.screen)
-
-        # Move and draw the player
-        keys = pygame.key.get_pressed()
-        handle_input(keys, dt, player, win_w, win_h)
-        player.draw(display.screen)
-
-        if not player.onscreen(d_rect):
-            winner = "AI"
+        if stats is not None:
+            stats.lap("events", t)
+            # The overlay text only changes twice a second so its rendered
+            # lines stay in the text cache.
+            if hud and stats.frames % 30 == 0:
+                hud_lines = ["phase           p50 ms  p99 ms"] + stats.lines()
+
+        action = controller(game, step_dt)
+        steps = 0
+        while acc >= step_dt and steps < max_steps and game.run:
+            prev = game.snapshot()
+            clock.advance(step_dt)
+            game.step(step_dt, action)
+            if recorder is not None:
+                recorder.tick(step_dt, action)
+            acc -= step_dt
+            steps += 1
+        if steps == max_steps:
+            # Too far behind to catch up; drop the backlog.
+            acc %= step_dt
+        if not game.run:
             display.run = False
 
-        pygame.display.flip()
+        current = game.interpolate(prev, min(acc / step_dt, 1.0))
+        if renderer is not None:
+            renderer.draw(game, hud_lines, stats)
+        else:
+            draw_frame(display, game, hud_lines, stats)
+        game.restore(current)
+        if stats is not None:
+            stats.lap("frame", frame_start)
+            stats.frames += 1
 
-    print(f"The winner is the {winner}.")
+    if recorder is not None:
+        recorder.close()
+    print(f"The winner is the {game.winner}.")
+    if stats_path is not None:
+        stats.dump(stats_path)
+        print(f"Frame timings written to {stats_path}.")
 
 
 def main():
-    display = init_display(800, 800)
-    game_loop(display)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", default=None, help="write a replay file")
+    parser.add_argument(
+        "--dirty", action="store_true", help="only redraw regions that changed"
+    )
+    parser.add_argument(
+        "--sprites", action="store_true", help="draw from cached sprites in one batch"
+    )
+    parser.add_argument("--stats", default=None, help="write frame timings as JSON")
+    parser.add_argument("--hud", action="store_true", help="show frame timings")
+    parser.add_argument("--fps", type=int, default=60, help="frame rate cap")
+    parser.add_argument("--sim-hz", type=int, default=60, help="simulation rate")
+    parser.add_argument(
+        "--max-steps", type=int, default=5, help="catch-up steps per frame"
+    )
+    parser.add_argument("--scenario", default=None, help="JSON or TOML scenario")
+    parser.add_argument(
+        "--lod", action="store_true", help="update far enemies less often"
+    )
+    parser.add_argument(
+        "--ai-budget", type=float, default=None, help="AI ms per step with --lod"
+    )
+    args = parser.parse_args()
+
+    scenario = None
+    win_w, win_h = 800, 800
+    if args.scenario:
+        scenario = scenarios.load(args.scenario)
+        win_w, win_h = scenario.width, scenario.height
+    display = init_display(win_w, win_h)
+    game_loop(
+        display,
+        seed=args.seed,
+        record=args.record,
+        dirty=args.dirty,
+        sprites=args.sprites,
+        stats_path=args.stats,
+        hud=args.hud,
+        fps=args.fps,
+        sim_hz=args.sim_hz,
+        max_steps=args.max_steps,
+        scenario=scenario,
+        lod=args.lod,
+        ai_budget=None if args.ai_budget is None else args.ai_budget / 1000,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import json
+import time
+from array import array
+
+now_ns = time.perf_counter_ns
+
+
+class Histogram:
+    # Log-spaced buckets, four per power of two, covering 1 ns to about
+    # 17 s. The counts live in one preallocated array so recording a sample
+    # never grows anything.
+    SUB = 4
+
+    def __init__(self, octaves=34):
+        self.counts = array("q", bytes(8 * octaves * self.SUB))
+        self.total = 0
+        self.sum = 0
+
+    def add(self, ns):
+        if ns < 1:
+            ns = 1
+        e = ns.bit_length() - 1
+        if e >= 2:
+            sub = (ns >> (e - 2)) & 3
+        else:
+            sub = (ns << (2 - e)) & 3
+        i = e * self.SUB + sub
+        if i >= len(self.counts):
+            i = len(self.counts) - 1
+        self.counts[i] += 1
+        self.total += 1
+        self.sum += ns
+
+    def upper(self, i):
+        e, sub = divmod(i, self.SUB)
+        return (self.SUB + sub + 1) * (1 << e) / self.SUB
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th sample, in ns.
+        if not self.total:
+            return 0.0
+        target = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return self.upper(i)
+        return self.upper(len(self.counts) - 1)
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+
+class FrameStats:
+    # Named histograms for the phases of a frame. Call lap(name, t) with the
+    # start time of a phase; it records the phase and returns the current
+    # time so laps can be chained.
+    def __init__(self):
+        self.hists = {}
+        self.frames = 0
+
+    def hist(self, name):
+        h = self.hists.get(name)
+        if h is None:
+            h = self.hists[name] = Histogram()
+        return h
+
+    def record(self, name, ns):
+        self.hist(name).add(ns)
+
+    def lap(self, name, t):
+        t1 = now_ns()
+        self.hist(name).add(t1 - t)
+        return t1
+
+    def summary(self):
+        return {
+            name: {
+                "count": h.total,
+                "mean_ms": h.mean() / 1e6,
+                "p50_ms": h.percentile(0.50) / 1e6,
+                "p99_ms": h.percentile(0.99) / 1e6,
+            }
+            for name, h in self.hists.items()
+        }
+
+    def lines(self):
+        out = []
+        for name, h in self.hists.items():
+            p50 = h.percentile(0.50) / 1e6
+            p99 = h.percentile(0.99) / 1e6
+            out.append(f"{name:<14}{p50:7.3f}{p99:8.3f}")
+        return out
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump({"frames": self.frames, "phases": self.summary()}, f, indent=1)
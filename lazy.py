@@ -0,0 +1,14 @@
+import importlib
+
+
+class LazyModule:
+    # Stands in for a module until one of its attributes is used, then
+    # imports it. Attributes are copied onto the stand-in as they are looked
+    # up, so later uses cost the same as on the real module.
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        self.__dict__[attr] = value
+        return value
@@ -0,0 +1,317 @@
+import argparse
+import random
+import struct
+import time
+import zlib
+from collections import deque
+import gobjs
+import scenarios
+import sim
+
+# File layout: an uncompressed header followed by a zlib stream of tick
+# records.
+#
+# header: magic, version, seed, dt, win_w, win_h, start (-1 for random),
+#         enable bits (yellow, blue, red, swept)
+# block:  one block of setup draws, then one tick record per step:
+#         flags byte, [dt double], [turn, move doubles], draw count, draws
+#         where each draw is a tag byte and eight value bytes.
+# end:    END flag, winner index, tick count.
+#
+# Version 1 files had 16 bit draw counts, which big scenarios overflow.
+MAGIC = b"HW1R"
+VERSION = 2
+HEADER = struct.Struct("<4sBQdIIbB")
+DOUBLE = struct.Struct("<d")
+ACTION = struct.Struct("<dd")
+COUNT = struct.Struct("<I")
+COUNT_V1 = struct.Struct("<H")
+DRAW_FLOAT = struct.Struct("<Bd")
+DRAW_BITS = struct.Struct("<BQ")
+FOOTER = struct.Struct("<BI")
+SEED_MASK = (1 << 64) - 1
+
+# Tick flags. Keyboard style actions, where turn and move are each -1, 0 or
+# 1, pack into the low nibble; anything else is written out in full.
+CUSTOM_DT = 0x10
+FULL_ACTION = 0x20
+END = 0x80
+
+FLOAT = 0
+BITS = 1
+
+WINNERS = ("Draw", "Player", "AI")
+
+
+class RecordingRandom(random.Random):
+    # random.Random that remembers every value it hands out. random() and
+    # getrandbits() are the two primitives the rest of Random is built on.
+    def __init__(self, seed=None):
+        self.draws = []
+        super().__init__(seed)
+
+    def random(self):
+        value = super().random()
+        self.draws.append((FLOAT, value))
+        return value
+
+    def getrandbits(self, k):
+        value = super().getrandbits(k)
+        self.draws.append((BITS, value))
+        return value
+
+    def take(self):
+        draws = self.draws
+        self.draws = []
+        return draws
+
+
+class ReplayRandom(random.Random):
+    # Serves recorded draws back in order instead of generating new ones.
+    def __init__(self):
+        self.pending = deque()
+        super().__init__(0)
+
+    def load(self, draws):
+        if self.pending:
+            raise ValueError("replay diverged: recorded draws were not used")
+        self.pending.extend(draws)
+
+    def next_draw(self, tag):
+        if not self.pending:
+            raise ValueError("replay diverged: ran out of recorded draws")
+        kind, value = self.pending.popleft()
+        if kind != tag:
+            raise ValueError("replay diverged: draw kind mismatch")
+        return value
+
+    def random(self):
+        return self.next_draw(FLOAT)
+
+    def getrandbits(self, k):
+        return self.next_draw(BITS)
+
+
+def pack_draws(draws):
+    parts = [COUNT.pack(len(draws))]
+    for kind, value in draws:
+        if kind == FLOAT:
+            parts.append(DRAW_FLOAT.pack(kind, value))
+        else:
+            parts.append(DRAW_BITS.pack(kind, value))
+    return b"".join(parts)
+
+
+class Recorder:
+    # Call tick() after every Game.step and close() once the game is over.
+    def __init__(self, path, game, dt, start=None):
+        self.file = open(path, "wb")
+        self.game = game
+        self.dt = dt
+        self.zip = zlib.compressobj(9)
+        enabled = (
+            gobjs.YELLOW_ENABLED
+            | gobjs.BLUE_ENABLED << 1
+            | gobjs.RED_ENABLED << 2
+            | gobjs.SWEPT << 3
+        )
+        self.file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                # The draws replay the game, so the seed is only a label;
+                # negative and oversized seeds keep their low 64 bits.
+                (game.seed or 0) & SEED_MASK,
+                dt,
+                game.win_w,
+                game.win_h,
+                -1 if start is None else start,
+                enabled,
+            )
+        )
+        self.write(pack_draws(game.rng.take()))
+
+    def write(self, data):
+        self.file.write(self.zip.compress(data))
+
+    def tick(self, dt, action):
+        turn, move = action
+        flags = 0
+        parts = []
+        if dt != self.dt:
+            flags |= CUSTOM_DT
+            parts.append(DOUBLE.pack(dt))
+        if turn in (-1, 0, 1) and move in (-1, 0, 1):
+            flags |= int(turn + 1) * 3 + int(move + 1)
+        else:
+            flags |= FULL_ACTION
+            parts.append(ACTION.pack(turn, move))
+        parts.append(pack_draws(self.game.rng.take()))
+        self.write(bytes([flags]) + b"".join(parts))
+
+    def close(self):
+        winner = WINNERS.index(self.game.winner)
+        self.write(bytes([END]) + FOOTER.pack(winner, self.game.tick))
+        self.file.write(self.zip.flush())
+        self.file.close()
+
+
+class Reader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            body = zlib.decompress(f.read())
+        magic, version, seed, dt, win_w, win_h, start, enabled = HEADER.unpack(header)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f"{path} is not a replay file")
+        self.count = COUNT_V1 if version == 1 else COUNT
+        self.seed = seed
+        self.dt = dt
+        self.win_w = win_w
+        self.win_h = win_h
+        self.start = None if start < 0 else start
+        self.enabled = (bool(enabled & 1), bool(enabled & 2), bool(enabled & 4))
+        # Recordings from before swept collision have this bit clear.
+        self.swept = bool(enabled & 8)
+        self.body = body
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.body, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def draws(self):
+        (count,) = self.unpack(self.count)
+        draws = []
+        for _ in range(count):
+            kind = self.body[self.offset]
+            fmt = DRAW_FLOAT if kind == FLOAT else DRAW_BITS
+            draws.append(self.unpack(fmt))
+        return draws
+
+    def ticks(self):
+        # Yields (dt, action, draws) per tick and finally the recorded
+        # (winner, tick count) footer.
+        while True:
+            flags = self.body[self.offset]
+            self.offset += 1
+            if flags & END:
+                winner, ticks = self.unpack(FOOTER)
+                return WINNERS[winner], ticks
+            dt = self.dt
+            if flags & CUSTOM_DT:
+                (dt,) = self.unpack(DOUBLE)
+            if flags & FULL_ACTION:
+                action = self.unpack(ACTION)
+            else:
+                code = flags & 0x0F
+                action = (code // 3 - 1, code % 3 - 1)
+            yield dt, action, self.draws()
+
+
+def record_headless(
+    path,
+    controller=sim.idle_controller,
+    dt=1 / 60,
+    max_ticks=60 * 60 * 5,
+    start=None,
+    seed=None,
+    scenario=None,
+):
+    if seed is None:
+        seed = random.getrandbits(64)
+    clock = sim.VirtualClock()
+    game = sim.Game(
+        clock=clock,
+        start=start,
+        seed=seed,
+        rng=RecordingRandom(seed),
+        scenario=scenario,
+    )
+    recorder = Recorder(path, game, dt, start)
+    while game.run and game.tick < max_ticks:
+        clock.advance(dt)
+        action = controller(game, dt)
+        game.step(dt, action)
+        recorder.tick(dt, action)
+    recorder.close()
+    return game
+
+
+def play_back(path, scenario=None):
+    # Re-simulates a recording at full speed and checks that it ends the
+    # same way it did when it was recorded. Games recorded on a custom
+    # scenario need the same scenario passed back in.
+    reader = Reader(path)
+    saved = (
+        gobjs.YELLOW_ENABLED,
+        gobjs.BLUE_ENABLED,
+        gobjs.RED_ENABLED,
+        gobjs.SWEPT,
+    )
+    gobjs.YELLOW_ENABLED, gobjs.BLUE_ENABLED, gobjs.RED_ENABLED = reader.enabled
+    gobjs.SWEPT = reader.swept
+    try:
+        rng = ReplayRandom()
+        rng.load(reader.draws())
+        clock = sim.VirtualClock()
+        game = sim.Game(
+            reader.win_w, reader.win_h, clock, reader.start, reader.seed, rng, scenario
+        )
+        ticks = reader.ticks()
+        try:
+            while True:
+                dt, action, draws = next(ticks)
+                clock.advance(dt)
+                rng.load(draws)
+                game.step(dt, action)
+        except StopIteration as stop:
+            winner, tick_count = stop.value
+        rng.load([])
+    finally:
+        (
+            gobjs.YELLOW_ENABLED,
+            gobjs.BLUE_ENABLED,
+            gobjs.RED_ENABLED,
+            gobjs.SWEPT,
+        ) = saved
+    if (game.winner, game.tick) != (winner, tick_count):
+        raise ValueError(
+            f"replay diverged: recorded {winner} after {tick_count} ticks, "
+            f"got {game.winner} after {game.tick}"
+        )
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or play back games.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("path")
+    rec.add_argument("--seed", type=int, default=None)
+    rec.add_argument("--controller", choices=sim.CONTROLLERS, default="goals")
+    play = sub.add_parser("play")
+    play.add_argument("path")
+    for p in (rec, play):
+        p.add_argument("--scenario", default=None, help="JSON or TOML scenario")
+    args = parser.parse_args()
+    scenario = scenarios.load(args.scenario) if args.scenario else None
+
+    t0 = time.perf_counter()
+    if args.command == "record":
+        game = record_headless(
+            args.path,
+            sim.CONTROLLERS[args.controller],
+            seed=args.seed,
+            scenario=scenario,
+        )
+    else:
+        game = play_back(args.path, scenario)
+    wall = time.perf_counter() - t0
+    print(f"The winner is the {game.winner}.")
+    print(f"{game.tick} ticks in {wall:.3f}s.")
+
+
+if __name__ == "__main__":
+    main()
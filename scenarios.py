@@ -0,0 +1,268 @@
+import argparse
+import json
+import math
+import random
+import gobjs
+
+# A scenario is a plain dict (JSON or TOML on disk):
+#
+#   arena:   [width, height]
+#   starts:  optional list of [x, y, heading] player start locations
+#   goals:   list of [x, y] or {"x": .., "y": .., <Goal overrides>}
+#   enemies: list of {"type": "yellow"|"blue"|"red", "x": .., "y": ..,
+#            <constructor or attribute overrides>}
+#   spawn:   optional {"yellow": {"count": n, <overrides>}, ...}; these
+#            enemies are scattered over the arena using "seed"
+#   walls:   optional list of [x, y, w, h] rectangles nothing can move through
+#   offscreen_ends: optional, default true; false keeps the game going when
+#            an enemy leaves the arena, for long running workloads
+#
+# or {"generator": name, "args": {...}} to build one with a generator below.
+
+ENEMY_TYPES = {
+    "yellow": gobjs.EnemyYellow,
+    "blue": gobjs.EnemyBlue,
+    "red": gobjs.EnemyRed,
+}
+# Overrides that go to the constructor; anything else is set afterwards.
+CONSTRUCTOR_ARGS = (
+    "radius",
+    "speed",
+    "turn_rate",
+    "heading",
+    "sight_distance",
+    "color",
+    "fill",
+)
+
+
+def start_locations(win_w, win_h):
+    # Possible Player start locations (x, y, heading)
+    return [
+        (50, 50, math.pi / 4),
+        (win_w // 2, 50, math.pi / 2),
+        (win_w - 50, 50, 3 * math.pi / 4),
+        (50, win_h // 2, 0),
+        (win_w - 50, win_h // 2, math.pi),
+        (50, win_h - 50, -math.pi / 4),
+        (win_w // 2, win_h - 50, -math.pi / 2),
+        (win_w - 50, win_h - 50, -3 * math.pi / 4),
+    ]
+
+
+def make_enemy(spec, goals, rng):
+    spec = dict(spec)
+    cls = ENEMY_TYPES[spec.pop("type")]
+    x = spec.pop("x")
+    y = spec.pop("y")
+    kwargs = {k: spec.pop(k) for k in CONSTRUCTOR_ARGS if k in spec}
+    e = cls(x, y, goals=goals, rng=rng, **kwargs)
+    for name, value in spec.items():
+        setattr(e, name, value)
+    return e
+
+
+class Scenario:
+    def __init__(
+        self, width, height, starts, goals, enemies, walls=(), offscreen_ends=True
+    ):
+        self.width = width
+        self.height = height
+        self.starts = starts
+        self.goals = goals
+        self.enemies = enemies
+        self.walls = [list(w) for w in walls]
+        # Whether an enemy leaving the arena wins the game for the player.
+        self.offscreen_ends = offscreen_ends
+
+    def make_goals(self):
+        goals = []
+        for spec in self.goals:
+            spec = dict(spec)
+            goals.append(gobjs.Goal(spec.pop("x"), spec.pop("y"), **spec))
+        return goals
+
+    def make_walls(self):
+        return [gobjs.Wall(*w) for w in self.walls]
+
+    def make_enemies(self, goals, rng):
+        return [make_enemy(spec, goals, rng) for spec in self.enemies]
+
+    def to_dict(self):
+        data = {
+            "arena": [self.width, self.height],
+            "starts": [list(s) for s in self.starts],
+            "goals": self.goals,
+            "enemies": self.enemies,
+        }
+        if self.walls:
+            data["walls"] = self.walls
+        if not self.offscreen_ends:
+            data["offscreen_ends"] = False
+        return data
+
+
+def from_dict(data):
+    if "generator" in data:
+        return GENERATORS[data["generator"]](**data.get("args", {}))
+    width, height = data.get("arena", (gobjs.WIDTH, gobjs.HEIGHT))
+    starts = [tuple(s) for s in data.get("starts", start_locations(width, height))]
+    goals = []
+    for g in data.get("goals", []):
+        if isinstance(g, dict):
+            goals.append(dict(g))
+        else:
+            goals.append({"x": g[0], "y": g[1]})
+    enemies = [dict(e) for e in data.get("enemies", [])]
+    rng = random.Random(data.get("seed", 0))
+    for kind, spec in data.get("spawn", {}).items():
+        spec = dict(spec)
+        count = spec.pop("count")
+        enemies.extend(scatter(kind, count, width, height, rng, spec))
+    walls = data.get("walls", [])
+    offscreen_ends = data.get("offscreen_ends", True)
+    return Scenario(width, height, starts, goals, enemies, walls, offscreen_ends)
+
+
+def load(path):
+    if path.endswith(".toml"):
+        import tomllib
+
+        with open(path, "rb") as f:
+            return from_dict(tomllib.load(f))
+    with open(path) as f:
+        return from_dict(json.load(f))
+
+
+def save(scenario, path):
+    with open(path, "w") as f:
+        json.dump(scenario.to_dict(), f)
+
+
+def scatter(kind, count, width, height, rng, overrides=None, margin=None):
+    # Guards start at least margin from the sides (a tenth of the arena by
+    # default) and facing within 45 degrees of the centre, so they don't
+    # walk straight off the arena before they have done anything.
+    if margin is None:
+        margin = max(50, min(width, height) / 10)
+    enemies = []
+    for _ in range(count):
+        x = rng.uniform(margin, width - margin)
+        y = rng.uniform(margin, height - margin)
+        inward = math.atan2(height / 2 - y, width / 2 - x)
+        spec = {
+            "type": kind,
+            "x": x,
+            "y": y,
+            "heading": inward + rng.uniform(-math.pi / 4, math.pi / 4),
+        }
+        spec.update(overrides or {})
+        enemies.append(spec)
+    return enemies
+
+
+def classic(width=800, height=800):
+    # The hand-built homework layout: five goals and one guard of each color.
+    return Scenario(
+        width,
+        height,
+        start_locations(width, height),
+        [
+            {"x": 200, "y": 200},
+            {"x": width - 200, "y": 200},
+            {"x": 200, "y": height - 200},
+            {"x": width - 200, "y": height - 200},
+            {"x": width // 2, "y": height // 2},
+        ],
+        [
+            {"type": "yellow", "x": width // 2 + 50, "y": height // 2, "heading": 0},
+            {
+                "type": "blue",
+                "x": width // 2 - 50,
+                "y": height // 2,
+                "heading": math.pi,
+            },
+            {
+                "type": "red",
+                "x": width // 2,
+                "y": height // 2 - 50,
+                "heading": math.pi / 2,
+            },
+        ],
+    )
+
+
+def stress(
+    guards=10000,
+    width=20000,
+    height=20000,
+    goals=100,
+    mix=(1, 1, 1),
+    seed=0,
+    offscreen_ends=True,
+):
+    # guards enemies split between yellow, blue and red in the ratio mix,
+    # scattered uniformly, with goals on a jittered grid. offscreen_ends=False
+    # makes it a workload that only ends when the player wins or is caught.
+    rng = random.Random(seed)
+    side = max(1, math.isqrt(goals))
+    rows = max(1, (goals + side - 1) // side)
+    goal_specs = []
+    for i in range(goals):
+        col = i % side
+        row = i // side
+        goal_specs.append(
+            {
+                "x": (col + 0.5 + rng.uniform(-0.25, 0.25)) * width / side,
+                "y": (row + 0.5 + rng.uniform(-0.25, 0.25)) * height / rows,
+            }
+        )
+    enemies = []
+    total = sum(mix)
+    kinds = ("yellow", "blue", "red")
+    counts = [guards * m // total for m in mix]
+    counts[0] += guards - sum(counts)
+    for kind, count in zip(kinds, counts):
+        enemies.extend(scatter(kind, count, width, height, rng))
+    return Scenario(
+        width,
+        height,
+        start_locations(width, height),
+        goal_specs,
+        enemies,
+        offscreen_ends=offscreen_ends,
+    )
+
+
+GENERATORS = {"classic": classic, "stress": stress}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a generated scenario.")
+    parser.add_argument("generator", choices=GENERATORS)
+    parser.add_argument("out")
+    parser.add_argument("--guards", type=int, default=None)
+    parser.add_argument("--size", type=int, default=None, help="arena width/height")
+    parser.add_argument("--goals", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--no-offscreen-end",
+        action="store_true",
+        help="keep playing when a guard leaves the arena",
+    )
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.size is not None:
+        kwargs["width"] = kwargs["height"] = args.size
+    if args.generator == "stress":
+        for name in ("guards", "goals", "seed"):
+            if getattr(args, name) is not None:
+                kwargs[name] = getattr(args, name)
+        if args.no_offscreen_end:
+            kwargs["offscreen_ends"] = False
+    save(GENERATORS[args.generator](**kwargs), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+import argparse
+import math
+import multiprocessing as mp
+import pickle
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import batch
+import env
+import fsm
+import gobjs
+import scenarios
+import sim
+
+# Spatially sharded games for arenas too big for one process.
+#
+# The arena is cut into cols x rows tiles and each tile's enemies live in a
+# Shard, with their own spatial index and comms bus. ShardedGame keeps the
+# player and the goals and steps the shards, in worker processes or in
+# this one, over shared memory:
+#
+#   1. ShardedGame writes the player and the touched goals.
+#   2. Every shard perceives, thinks and moves its enemies, writes their
+#      positions and posts what its neighbours need to its outbox: the
+#      comms values its enemies hold and the enemies that left its tile.
+#   3. Every shard reads the other outboxes, adopts the enemies that came
+#      into its tile and delivers comms.
+#   4. ShardedGame ends the game or moves the player.
+#
+# Enemies only ever perceive the player, so the player is the one ghost
+# every shard needs for perception. For comms, a sender on another shard
+# is a Ghost that republishes its values on the local bus, so comms_radius
+# and "listen to the closest sender" work across tile borders the way they
+# do in one sim.Game. An enemy that crosses a border takes its state,
+# what it has published and what it has heard to the next shard.
+#
+# Each enemy draws from its own random Stream, so a game plays out the
+# same for every tiling. With one tile and the same streams it is the
+# game sim.Game plays.
+
+# Commands from ShardedGame to its workers.
+STEP = 0
+CLOSE = 1
+
+OUTBOX_SIZE = 1 << 20
+
+# Enemy slots that tie it to the process it lives in; the shard that
+# adopts it sets its own.
+LOCAL = {"goals", "clock", "nav", "index", "cell"}
+
+MASK = (1 << 64) - 1
+GAMMA = 0x9E3779B97F4A7C15
+
+
+def mix(z):
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+class Stream:
+    # A splitmix64 stream with the part of random.Random the enemies use.
+    # It is one int, so it travels with an enemy that changes shards.
+    __slots__ = ("state",)
+
+    def __init__(self, seed, n):
+        self.state = mix((seed + mix(n + 1)) & MASK)
+
+    def next(self):
+        self.state = (self.state + GAMMA) & MASK
+        return mix(self.state)
+
+    def random(self):
+        return (self.next() >> 11) * (1.0 / (1 << 53))
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def randint(self, a, b):
+        return a + self.next() % (b - a + 1)
+
+
+class Ghost:
+    # Stands in for something another process owns: the player, for
+    # perception, or a comms sender on another shard.
+    __slots__ = ("gid", "x", "y", "radius", "comms_radius")
+
+    def __init__(self, gid=-1):
+        self.gid = gid
+        self.x = 0.0
+        self.y = 0.0
+        self.radius = 0.0
+        self.comms_radius = None
+
+
+class Tiles:
+    # cols x rows equal tiles over the arena, numbered row by row. Points
+    # off the arena belong to the nearest tile.
+    def __init__(self, cols, rows, width, height):
+        self.cols = cols
+        self.rows = rows
+        self.tile_w = width / cols
+        self.tile_h = height / rows
+
+    def __len__(self):
+        return self.cols * self.rows
+
+    def tile(self, x, y):
+        col = min(self.cols - 1, max(0, int(x // self.tile_w)))
+        row = min(self.rows - 1, max(0, int(y // self.tile_h)))
+        return row * self.cols + col
+
+
+def slots(cls):
+    for klass in cls.__mro__:
+        yield from getattr(klass, "__slots__", ())
+
+
+def pack(e):
+    cls = type(e)
+    return cls, {s: getattr(e, s) for s in slots(cls) if s not in LOCAL}
+
+
+def unpack(cls, state):
+    e = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(e, name, value)
+    return e
+
+
+def layout(n, goals, shards, outbox):
+    return (
+        # x, y, radius of the player and dt.
+        ("player", (4,), np.float64),
+        ("touched", (max(1, goals),), np.bool_),
+        ("x", (n,), np.float64),
+        ("y", (n,), np.float64),
+        ("heading", (n,), np.float64),
+        ("radius", (n,), np.float64),
+        ("owner", (n,), np.int32),
+        # Per shard: the fractions of the step at which an enemy first caught
+        # the player and first left the arena (inf for never), messages said
+        # and enemies sent to other shards.
+        ("status", (shards, 4), np.float64),
+        ("sizes", (shards,), np.int64),
+        ("outbox", (shards, outbox), np.uint8),
+        ("cmd", (1,), np.int32),
+    )
+
+
+def post(arrays, n, message):
+    blob = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    box = arrays["outbox"][n]
+    if len(blob) > len(box):
+        raise RuntimeError(
+            f"shard {n} posted {len(blob)} bytes, more than its {len(box)} byte outbox"
+        )
+    box[: len(blob)] = np.frombuffer(blob, np.uint8)
+    arrays["sizes"][n] = len(blob)
+
+
+def fetch(arrays, n):
+    return pickle.loads(arrays["outbox"][n, : arrays["sizes"][n]])
+
+
+class Shard:
+    def __init__(self, n, scenario, tiles, seed, arrays):
+        self.n = n
+        self.tiles = tiles
+        self.arrays = arrays
+        self.rect = (0, 0, scenario.width, scenario.height)
+        self.offscreen_ends = scenario.offscreen_ends
+        self.walls = scenario.make_walls()
+        gobjs.set_layout(scenario.width, scenario.height, self.walls)
+        self.nav = None
+        if self.walls:
+            self.nav = gobjs.Navigator(scenario.width, scenario.height, self.walls)
+        self.clock = sim.VirtualClock()
+        self.goals = scenario.make_goals()
+        self.index = gobjs.SpatialHash()
+        self.comms = gobjs.CommsBus(self.index)
+        self.player = Ghost()
+        self.enemies = []
+        self.mailboxes = []
+        self.ids = []
+        self.gids = {}
+        self.leaving = []
+        # Remote comms senders by id, and the (id, topic) values they hold.
+        self.ghosts = {}
+        self.remote = set()
+        for gid, spec in enumerate(scenario.enemies):
+            if tiles.tile(spec["x"], spec["y"]) == n:
+                e = scenarios.make_enemy(spec, self.goals, Stream(seed, gid))
+                self.adopt(gid, e)
+                arrays["radius"][gid] = e.radius
+
+    def adopt(self, gid, e):
+        e.goals = self.goals
+        e.clock = self.clock.get_ticks
+        e.nav = self.nav
+        self.index.insert(e)
+        ghost = self.ghosts.pop(gid, None)
+        if ghost is not None:
+            # Keep whoever heard it while it was on another shard.
+            self.comms.handover(ghost, e)
+            self.remote = {k for k in self.remote if k[0] != gid}
+        box = self.comms.mailbox(e)
+        self.enemies.append(e)
+        self.mailboxes.append(box)
+        self.ids.append(gid)
+        self.gids[e] = gid
+        a = self.arrays
+        a["x"][gid] = e.x
+        a["y"][gid] = e.y
+        a["heading"][gid] = e.heading
+        a["owner"][gid] = self.n
+        return box
+
+    def sender_id(self, sender):
+        gid = self.gids.get(sender)
+        return sender.gid if gid is None else gid
+
+    def think(self):
+        a = self.arrays
+        gobjs.set_layout(self.rect[2], self.rect[3], self.walls)
+        px, py, pr, dt = a["player"].tolist()
+        self.clock.advance(dt)
+        for g, touched in zip(self.goals, a["touched"]):
+            g.touched = bool(touched)
+        player = self.player
+        player.x = px
+        player.y = py
+        player.radius = pr
+
+        percepts = gobjs.perceive(self.enemies, [player], self.index)
+        actions = fsm.evaluate(self.enemies, percepts, self.goals, self.mailboxes, dt)
+        xs = a["x"]
+        ys = a["y"]
+        headings = a["heading"]
+        swept = gobjs.SWEPT
+        tile = self.tiles.tile
+        # As in sim.Game.step; without SWEPT both count as the step's end.
+        caught = math.inf
+        lost = math.inf
+        said = []
+        comms = []
+        leaving = []
+        for gid, e, box, mt in zip(self.ids, self.enemies, self.mailboxes, actions):
+            x0 = e.x
+            y0 = e.y
+            e.turn(dt, mt[0])
+            e.move(dt, mt[1])
+            if swept:
+                contact = e.swept_contact(player, x0, y0)
+                if contact is not None and contact < caught:
+                    caught = contact
+            if mt[2] is not None:
+                said.append((gid, mt[2]))
+            if self.offscreen_ends and not e.onscreen(self.rect):
+                lost = min(lost, e.leave_time(x0, y0, self.rect) if swept else 1.0)
+            xs[gid] = e.x
+            ys[gid] = e.y
+            headings[gid] = e.heading
+            for topic, value in box.own.items():
+                if value is not None:
+                    comms.append((gid, topic, e.x, e.y, e.comms_radius, value))
+            if tile(e.x, e.y) != self.n:
+                leaving.append((gid, e, box))
+        if not swept and self.index.query_radius(px, py, pr):
+            caught = 1.0
+
+        migrants = {}
+        for gid, e, box in leaving:
+            inbox = [
+                (topic, self.sender_id(sender), value)
+                for topic, senders in box.inbox.items()
+                for sender, value in senders.items()
+            ]
+            cls, state = pack(e)
+            migrants.setdefault(tile(e.x, e.y), []).append(
+                (gid, cls, state, dict(box.own), inbox)
+            )
+            self.index.remove(e)
+        if leaving:
+            gone = {gid for gid, _, _ in leaving}
+            kept = [k for k, gid in enumerate(self.ids) if gid not in gone]
+            self.enemies = [self.enemies[k] for k in kept]
+            self.mailboxes = [self.mailboxes[k] for k in kept]
+            self.ids = [self.ids[k] for k in kept]
+        self.leaving = leaving
+
+        a["status"][self.n] = (caught, lost, len(said), len(leaving))
+        post(a, self.n, (said, comms, migrants))
+
+    def exchange(self):
+        a = self.arrays
+        owner = a["owner"]
+        comms = self.comms
+        messages = [fetch(a, k) for k in range(len(self.tiles)) if k != self.n]
+
+        arrived = []
+        for _, _, migrants in messages:
+            for gid, cls, state, own, inbox in migrants.get(self.n, ()):
+                e = unpack(cls, state)
+                box = self.adopt(gid, e)
+                box.update(**own)
+                arrived.append((box, inbox))
+
+        ghosts = self.ghosts
+        remote = set()
+        for _, values, _ in messages:
+            for gid, topic, x, y, radius, value in values:
+                if owner[gid] == self.n:
+                    continue
+                ghost = ghosts.get(gid)
+                if ghost is None:
+                    ghost = ghosts[gid] = Ghost(gid)
+                ghost.x = x
+                ghost.y = y
+                ghost.comms_radius = radius
+                comms.publish(ghost, topic, value)
+                remote.add((gid, topic))
+        for gid, topic in self.remote - remote:
+            comms.publish(ghosts[gid], topic, None)
+        self.remote = remote
+
+        comms.deliver()
+
+        # Enemies that left go on speaking here through ghosts.
+        for gid, e, box in self.leaving:
+            ghost = ghosts.get(gid)
+            if ghost is None:
+                ghost = ghosts[gid] = Ghost(gid)
+            ghost.x = e.x
+            ghost.y = e.y
+            ghost.comms_radius = e.comms_radius
+            comms.handover(e, ghost)
+            comms.remove(e)
+            del self.gids[e]
+            for topic, value in box.own.items():
+                if value is not None:
+                    self.remote.add((gid, topic))
+        self.leaving = []
+
+        # And the ones that came in still hear what they heard, if it is
+        # still being said.
+        local = {gid: e for e, gid in self.gids.items()}
+        for box, inbox in arrived:
+            for topic, gid, value in inbox:
+                sender = local.get(gid, ghosts.get(gid))
+                if sender is None or sender is box.owner:
+                    continue
+                key = (topic, sender)
+                current = comms.current.get(key)
+                if current is None or not current == value:
+                    continue
+                senders = box.inbox.setdefault(topic, {})
+                if sender not in senders:
+                    senders[sender] = value
+                    comms.reached.setdefault(key, []).append(box)
+
+
+def run_shards(cmd, shards):
+    if cmd == STEP:
+        for shard in shards:
+            shard.think()
+        for shard in shards:
+            shard.exchange()
+
+
+def worker(names, specs, lo, hi, scenario, tiles, seed, swept, barrier):
+    blocks, arrays = env.attach(names, specs)
+    gobjs.SWEPT = swept
+    shards = []
+    try:
+        shards = [Shard(n, scenario, tiles, seed, arrays) for n in range(lo, hi)]
+        barrier.wait()
+        while True:
+            barrier.wait()
+            if int(arrays["cmd"][0]) == CLOSE:
+                break
+            for shard in shards:
+                shard.think()
+            barrier.wait()
+            for shard in shards:
+                shard.exchange()
+            barrier.wait()
+    except Exception:
+        # Wakes the other processes instead of leaving them waiting.
+        barrier.abort()
+        raise
+    finally:
+        del shards, arrays
+        for block in blocks:
+            block.close()
+
+
+class ShardedGame:
+    # Plays like sim.Game with the enemies split over cols x rows tiles.
+    # workers processes share the tiles, one each by default; workers=0
+    # steps the shards in this process over the same arrays.
+    def __init__(
+        self,
+        scenario=None,
+        tiles=(2, 2),
+        workers=None,
+        seed=None,
+        start=None,
+        outbox=OUTBOX_SIZE,
+    ):
+        if scenario is None:
+            scenario = scenarios.classic()
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        win_w = scenario.width
+        win_h = scenario.height
+        self.walls = scenario.make_walls()
+        gobjs.set_layout(win_w, win_h, self.walls)
+        self.win_w = win_w
+        self.win_h = win_h
+        self.d_rect = (0, 0, win_w, win_h)
+        self.tiles = Tiles(tiles[0], tiles[1], win_w, win_h)
+        shards = len(self.tiles)
+
+        if start is None:
+            player_start = self.rng.choice(scenario.starts)
+        else:
+            player_start = scenario.starts[start]
+        self.player = gobjs.Player(
+            player_start[0], player_start[1], heading=player_start[2]
+        )
+        self.goals = scenario.make_goals()
+        self.index = gobjs.SpatialHash()
+        for g in self.goals:
+            self.index.insert(g)
+        self.n = len(scenario.enemies)
+
+        specs = layout(self.n, len(self.goals), shards, outbox)
+        self.blocks = []
+        self.arrays = {}
+        for name, shape, dtype in specs:
+            size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            self.arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+
+        self.tick = 0
+        self.goal_count = 0
+        self.player_from = (self.player.x, self.player.y)
+        self.winner = "Draw"
+        self.run = True
+        # What enemies said on the last step, as (enemy id, message).
+        self.said = []
+        # Enemies that changed shards so far.
+        self.migrations = 0
+
+        self.shards = None
+        self.procs = []
+        if workers == 0:
+            self.shards = [
+                Shard(n, scenario, self.tiles, seed, self.arrays) for n in range(shards)
+            ]
+        else:
+            self.start_workers(scenario, specs, workers)
+        # Widest enemy, for walked_into().
+        self.widest = float(self.arrays["radius"].max(initial=0.0))
+
+    def start_workers(self, scenario, specs, workers):
+        shards = len(self.tiles)
+        if workers is None:
+            workers = shards
+        workers = min(workers, shards)
+        self.barrier = mp.Barrier(workers + 1)
+        names = [block.name for block in self.blocks]
+        bounds = [shards * w // workers for w in range(workers + 1)]
+        for lo, hi in zip(bounds, bounds[1:]):
+            proc = mp.Process(
+                target=worker,
+                args=(
+                    names,
+                    specs,
+                    lo,
+                    hi,
+                    scenario,
+                    self.tiles,
+                    self.seed,
+                    gobjs.SWEPT,
+                    self.barrier,
+                ),
+                daemon=True,
+            )
+            proc.start()
+            self.procs.append(proc)
+        self.barrier.wait()
+
+    def command(self, cmd):
+        if self.shards is not None:
+            run_shards(cmd, self.shards)
+            return
+        self.arrays["cmd"][0] = cmd
+        self.barrier.wait()
+        if cmd != CLOSE:
+            self.barrier.wait()
+            self.barrier.wait()
+
+    def positions(self):
+        # Every enemy's x, y and heading, by its place in the scenario.
+        a = self.arrays
+        return a["x"], a["y"], a["heading"]
+
+    def step(self, dt, action):
+        a = self.arrays
+        gobjs.set_layout(self.win_w, self.win_h, self.walls)
+        player = self.player
+        swept = gobjs.SWEPT
+        x0, y0 = self.player_from
+        reach = player.radius
+        if swept:
+            reach += math.hypot(player.x - x0, player.y - y0)
+        for g in self.index.query_radius(player.x, player.y, reach):
+            if g.is_touched():
+                continue
+            if not swept or player.swept_collision(g, x0, y0):
+                g.touch()
+                self.goal_count += 1
+                if self.goal_count == len(self.goals):
+                    self.run = False
+                    self.winner = "Player"
+                a["touched"][: len(self.goals)] = [g.touched for g in self.goals]
+
+        a["player"][:] = (player.x, player.y, player.radius, dt)
+        self.command(STEP)
+
+        status = a["status"]
+        self.said = []
+        for n in np.flatnonzero(status[:, 2]):
+            self.said.extend(fetch(a, n)[0])
+        self.migrations += int(status[:, 3].sum())
+        caught = status[:, 0].min()
+        left = status[:, 1].min()
+        if left < math.inf:
+            self.run = False
+            self.winner = "Player"
+        if caught < math.inf and caught <= left:
+            self.run = False
+            self.winner = "AI"
+
+        turn, move = action
+        x0 = player.x
+        y0 = player.y
+        self.player_from = (x0, y0)
+        if turn:
+            player.turn(dt, turn)
+        if move:
+            player.move(dt, move)
+            if swept and self.walked_into(x0, y0):
+                self.run = False
+                self.winner = "AI"
+
+        if not player.onscreen(self.d_rect):
+            self.winner = "AI"
+            self.run = False
+
+        self.tick += 1
+
+    def walked_into(self, x0, y0):
+        # Whether the player's move from (x0, y0) passed through an enemy.
+        a = self.arrays
+        player = self.player
+        reach = player.radius + math.hypot(player.x - x0, player.y - y0)
+        reach += self.widest
+        xs = a["x"]
+        ys = a["y"]
+        near = np.flatnonzero(
+            (np.abs(xs - player.x) <= reach) & (np.abs(ys - player.y) <= reach)
+        )
+        if not near.size:
+            return False
+        hit = batch.swept_collision(
+            x0,
+            y0,
+            player.x,
+            player.y,
+            player.radius,
+            xs[near],
+            ys[near],
+            a["radius"][near],
+        )
+        return bool(hit.any())
+
+    def close(self):
+        if self.blocks is None:
+            return
+        if self.procs:
+            try:
+                self.command(CLOSE)
+            except threading.BrokenBarrierError:
+                # A worker failed and has already gone.
+                pass
+            for proc in self.procs:
+                proc.join()
+        self.shards = None
+        self.arrays = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_headless(
+    controller=sim.goal_seeker,
+    dt=1 / 60,
+    max_ticks=60 * 60 * 5,
+    **kwargs,
+):
+    # kwargs go to ShardedGame. Returns the closed game.
+    with ShardedGame(**kwargs) as game:
+        while game.run and game.tick < max_ticks:
+            action = controller(game, dt)
+            game.step(dt, action)
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a sharded stress game.")
+    parser.add_argument("--guards", type=int, default=10000)
+    parser.add_argument("--size", type=int, default=20000, help="arena width/height")
+    parser.add_argument("--goals", type=int, default=100)
+    parser.add_argument("--tiles", default="2x2", help="cols x rows, e.g. 4x2")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--controller", choices=sim.CONTROLLERS, default="goals")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cols, _, rows = args.tiles.partition("x")
+    tiles = (int(cols), int(rows or cols))
+    scenario = scenarios.stress(
+        args.guards, args.size, args.size, args.goals, offscreen_ends=False
+    )
+    t0 = time.perf_counter()
+    game = run_headless(
+        sim.CONTROLLERS[args.controller],
+        max_ticks=args.ticks,
+        scenario=scenario,
+        tiles=tiles,
+        workers=args.workers,
+        seed=args.seed,
+    )
+    wall = time.perf_counter() - t0
+    print(
+        f"{game.tick} ticks of {args.guards} guards on {tiles[0]}x{tiles[1]} tiles "
+        f"in {wall:.3f}s, {game.tick / wall:.1f} ticks per second."
+    )
+    print(f"Winner {game.winner}, {game.migrations} enemies changed tiles.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+import argparse
+import heapq
+import math
+import os
+import random
+import time
+import fsm
+import gobjs
+import scenarios
+
+
+class VirtualClock:
+    # Stands in for pygame.time when there is no window; time only moves
+    # when the loop advances it.
+    def __init__(self, start=0):
+        self.ms = start
+
+    def get_ticks(self):
+        return int(self.ms)
+
+    def advance(self, dt):
+        self.ms += dt * 1000
+
+
+start_locations = scenarios.start_locations
+
+
+class MessageQueue:
+    # Active speech bubbles as a heap ordered by expiry time. Iterating
+    # yields the same (msg, obj, start) tuples game_loop used to keep in a
+    # list.
+    def __init__(self):
+        self.heap = []
+        self.count = 0
+
+    def push(self, msg, obj, now):
+        self.count += 1
+        heapq.heappush(self.heap, (now + msg[1], self.count, (msg, obj, now)))
+
+    def expire(self, now):
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            heapq.heappop(heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class Game:
+    def __init__(
+        self,
+        win_w=800,
+        win_h=800,
+        clock=None,
+        start=None,
+        seed=None,
+        rng=None,
+        scenario=None,
+    ):
+        # NOTE: The default scenario is the homework layout; pass a
+        # scenarios.Scenario (or load one from a file) to change it.
+        if scenario is None:
+            scenario = scenarios.classic(win_w, win_h)
+        win_w = scenario.width
+        win_h = scenario.height
+        self.walls = scenario.make_walls()
+        gobjs.set_layout(win_w, win_h, self.walls)
+        # Chasers share flow fields around the walls; open arenas skip it.
+        self.nav = None
+        if self.walls:
+            self.nav = gobjs.Navigator(win_w, win_h, self.walls)
+        self.win_w = win_w
+        self.win_h = win_h
+        self.d_rect = (0, 0, win_w, win_h)
+        self.offscreen_ends = scenario.offscreen_ends
+        self.clock = clock if clock is not None else VirtualClock()
+
+        # Every random draw in a game comes from this one stream, so a game
+        # is reproduced by its seed and its player inputs.
+        if rng is None:
+            if seed is None:
+                seed = random.getrandbits(64)
+            rng = random.Random(seed)
+        self.seed = seed
+        self.rng = rng
+
+        start_locs = scenario.starts
+        if start is None:
+            player_start = rng.choice(start_locs)
+        else:
+            player_start = start_locs[start]
+        self.player = gobjs.Player(
+            player_start[0], player_start[1], heading=player_start[2]
+        )
+
+        self.goals = scenario.make_goals()
+        self.enemies = scenario.make_enemies(self.goals, rng)
+        for e in self.enemies:
+            e.clock = self.clock.get_ticks
+            e.nav = self.nav
+
+        self.index = gobjs.SpatialHash()
+        for obj in [self.player] + self.goals + self.enemies:
+            self.index.insert(obj)
+        # Each enemy talks through its own mailbox on the shared bus.
+        self.comms = gobjs.CommsBus(self.index)
+        self.mailboxes = [self.comms.mailbox(e) for e in self.enemies]
+
+        self.tick = 0
+        self.goal_count = 0
+        # Where the player's last move started.
+        self.player_from = (self.player.x, self.player.y)
+        self.winner = "Draw"
+        self.msgs = MessageQueue()
+        self.run = True
+        # Optional instrument.FrameStats that step() reports its phases to.
+        self.stats = None
+        # Optional fsm.Scheduler that decides which enemies think each step.
+        self.scheduler = None
+        # What the enemies saw and did on the last step, for trajectory.
+        self.percepts = []
+        self.actions = []
+
+    def movers(self):
+        return [self.player] + self.enemies
+
+    def snapshot(self):
+        return [(o.x, o.y, o.heading) for o in self.movers()]
+
+    def interpolate(self, prev, alpha):
+        # Places every moving object alpha of the way from the prev snapshot
+        # to where it is now, for drawing between two fixed steps. Returns
+        # the real state for restore().
+        # Headings turn the short way round, so a reflection or a heading
+        # that has grown past 2*pi doesn't spin the cone in between.
+        current = self.snapshot()
+        for o, (x0, y0, h0), (x1, y1, h1) in zip(self.movers(), prev, current):
+            o.x = x0 + (x1 - x0) * alpha
+            o.y = y0 + (y1 - y0) * alpha
+            d = h1 - h0
+            o.heading = h0 + math.atan2(math.sin(d), math.cos(d)) * alpha
+        return current
+
+    def restore(self, state):
+        for o, (x, y, heading) in zip(self.movers(), state):
+            o.x = x
+            o.y = y
+            o.heading = heading
+
+    def step(self, dt, action):
+        stats = self.stats
+        if stats is not None:
+            t = time.perf_counter_ns()
+        gobjs.set_layout(self.win_w, self.win_h, self.walls)
+
+        now = self.clock.get_ticks()
+        self.msgs.expire(now)
+
+        player = self.player
+        swept = gobjs.SWEPT
+        # With SWEPT, goals touched anywhere along the player's last move.
+        x0, y0 = self.player_from
+        reach = player.radius
+        if swept:
+            reach += math.hypot(player.x - x0, player.y - y0)
+        for g in self.index.query_radius(player.x, player.y, reach):
+            if not isinstance(g, gobjs.Goal) or g.is_touched():
+                continue
+            if not swept or player.swept_collision(g, x0, y0):
+                g.touch()
+                self.goal_count += 1
+                if self.goal_count == len(self.goals):
+                    self.run = False
+                    self.winner = "Player"
+        if stats is not None:
+            t = stats.lap("goals", t)
+
+        percepts = gobjs.perceive(self.enemies, [player], self.index)
+        if stats is not None:
+            t = stats.lap("perception", t)
+        # With stats, each enemy class's share of the AI gets its own
+        # histogram as well as the "ai" total.
+        times = None if stats is None else {}
+        if self.scheduler is None:
+            actions = fsm.evaluate(
+                self.enemies, percepts, self.goals, self.mailboxes, dt, times
+            )
+        else:
+            actions = self.scheduler.evaluate(
+                self.enemies, percepts, self.goals, self.mailboxes, player, dt, times
+            )
+        self.percepts = percepts
+        self.actions = actions
+        if stats is not None:
+            for name, ns in times.items():
+                stats.record(name, ns)
+            t = stats.lap("ai", t)
+        # With SWEPT, the fractions of the step at which an enemy first
+        # touched the player and first left the arena; the earlier decides.
+        caught = math.inf
+        left = math.inf
+        for e, mt in zip(self.enemies, actions):
+            x0 = e.x
+            y0 = e.y
+            e.turn(dt, mt[0])
+            e.move(dt, mt[1])
+            if swept:
+                contact = e.swept_contact(player, x0, y0)
+                if contact is not None and contact < caught:
+                    caught = contact
+            elif e.check_collision(player):
+                # Without SWEPT, each enemy's catch and then its leaving
+                # apply in game order, so the last one decides.
+                self.run = False
+                self.winner = "AI"
+            if mt[2] is not None:
+                self.msgs.push(mt[2], e, now)
+            if self.offscreen_ends and not e.onscreen(self.d_rect):
+                self.run = False
+                self.winner = "Player"
+                if swept:
+                    left = min(left, e.leave_time(x0, y0, self.d_rect))
+        if stats is not None:
+            t = stats.lap("movement", t)
+        self.comms.deliver()
+        if stats is not None:
+            t = stats.lap("comms", t)
+
+        # Enemies that passed through the player before any left.
+        if caught < math.inf and caught <= left:
+            self.run = False
+            self.winner = "AI"
+
+        # action is (turn, move), the same directions handle_input feeds
+        # into Player.turn and Player.move.
+        turn, move = action
+        x0 = player.x
+        y0 = player.y
+        self.player_from = (x0, y0)
+        if turn:
+            player.turn(dt, turn)
+        if move:
+            player.move(dt, move)
+            if swept:
+                # Enemies the player walked through.
+                reach = player.radius + math.hypot(player.x - x0, player.y - y0)
+                for e in self.index.query_radius(player.x, player.y, reach):
+                    if isinstance(e, gobjs.Enemy) and player.swept_collision(e, x0, y0):
+                        self.run = False
+                        self.winner = "AI"
+
+        if not player.onscreen(self.d_rect):
+            self.winner = "AI"
+            self.run = False
+        if stats is not None:
+            stats.lap("player", t)
+
+        self.tick += 1
+
+
+# Scripted player controllers. Each one is called as controller(game, dt)
+# and returns a (turn, move) action.
+def idle_controller(game, dt):
+    return (0, 0)
+
+
+class ScriptedController:
+    def __init__(self, actions, default=(0, 0)):
+        self.actions = list(actions)
+        self.default = default
+
+    def __call__(self, game, dt):
+        if game.tick < len(self.actions):
+            return self.actions[game.tick]
+        return self.default
+
+
+def goal_seeker(game, dt):
+    # Steer toward the nearest untouched goal.
+    player = game.player
+    best = None
+    for g in game.goals:
+        if not g.is_touched():
+            d = (g.x - player.x) ** 2 + (g.y - player.y) ** 2
+            if best is None or d < best[0]:
+                best = (d, g)
+    if best is None:
+        return (0, 0)
+    g = best[1]
+    angle = math.atan2(g.y - player.y, g.x - player.x) - player.heading
+    angle = (angle + math.pi) % (2 * math.pi) - math.pi
+    step = player.turn_rate * dt
+    if abs(angle) <= step:
+        return (angle / step, 1)
+    return (math.copysign(1, angle), 1)
+
+
+def run_headless(
+    controller=idle_controller,
+    dt=1 / 60,
+    max_ticks=60 * 60 * 5,
+    start=None,
+    win_w=800,
+    win_h=800,
+    seed=None,
+    rng=None,
+    scenario=None,
+    trace=None,
+    lod=False,
+    ai_budget=None,
+):
+    # trace is a directory to record the game's trajectory in. lod runs
+    # the enemies through an fsm.Scheduler with ai_budget seconds a tick.
+    clock = VirtualClock()
+    game = Game(win_w, win_h, clock, start, seed, rng, scenario)
+    if lod:
+        game.scheduler = fsm.Scheduler(game.win_w, game.win_h, budget=ai_budget)
+    writer = None
+    if trace is not None:
+        import trajectory
+
+        writer = trajectory.Writer(trace, game)
+    while game.run and game.tick < max_ticks:
+        clock.advance(dt)
+        action = controller(game, dt)
+        game.step(dt, action)
+        if writer is not None:
+            writer.tick(action)
+    if writer is not None:
+        writer.close()
+    return game
+
+
+CONTROLLERS = {"idle": idle_controller, "goals": goal_seeker}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run games without a window.")
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--dt", type=float, default=1 / 60)
+    parser.add_argument("--max-ticks", type=int, default=60 * 60 * 5)
+    parser.add_argument("--controller", choices=CONTROLLERS, default="goals")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--scenario", default=None, help="JSON or TOML scenario")
+    parser.add_argument(
+        "--trace", default=None, help="record trajectories under this directory"
+    )
+    parser.add_argument(
+        "--lod", action="store_true", help="update far enemies less often"
+    )
+    parser.add_argument(
+        "--ai-budget", type=float, default=None, help="AI ms per tick with --lod"
+    )
+    args = parser.parse_args()
+    scenario = scenarios.load(args.scenario) if args.scenario else None
+    ai_budget = None if args.ai_budget is None else args.ai_budget / 1000
+
+    t0 = time.perf_counter()
+    sim_seconds = 0.0
+    for i in range(args.games):
+        seed = None if args.seed is None else args.seed + i
+        game = run_headless(
+            CONTROLLERS[args.controller],
+            args.dt,
+            args.max_ticks,
+            seed=seed,
+            scenario=scenario,
+            trace=args.trace and os.path.join(args.trace, f"game_{i:05d}"),
+            lod=args.lod,
+            ai_budget=ai_budget,
+        )
+        sim_seconds += game.tick * args.dt
+        print(f"The winner is the {game.winner}.")
+    wall = time.perf_counter() - t0
+    print(f"Simulated {sim_seconds:.1f}s of game time in {wall:.3f}s.")
+
+
+if __name__ == "__main__":
+    main()
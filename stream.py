@@ -0,0 +1,458 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import threading
+import gobjs
+import hw1_main
+import lazy
+import replay
+import scenarios
+import sim
+
+pygame = lazy.LazyModule("pygame")
+
+# Every packet on the wire is a length prefix followed by a type byte.
+#
+# HELLO: JSON description of a new game: format version, arena, goals and
+#        movers (the player first, then the enemies). The viewer builds its
+#        objects from it.
+# DELTA: tick, counts and flags, then
+#        one record (index, seen, x, y, heading, sight) per mover that changed
+#        since the last delta that viewer got,
+#        the index of every goal touched since then,
+#        and, when the speech bubbles changed, all of them as (index, text).
+#
+# Deltas are worked out per viewer against what it was last sent, so a
+# viewer that falls behind gets one delta covering every tick it missed
+# instead of a queue of stale frames.
+#
+# Version 1 streams had no version in HELLO and 16 bit message counts, which
+# big swarms overflow.
+VERSION = 2
+LENGTH = struct.Struct("<I")
+HEAD = struct.Struct("<BIIIB")
+MOVER = struct.Struct("<IBffff")
+GOAL = struct.Struct("<I")
+COUNT = struct.Struct("<I")
+COUNT_V1 = struct.Struct("<H")
+MSG = struct.Struct("<IH")
+
+HELLO = 0
+DELTA = 1
+
+# Delta flags; the winner index goes in the bits above them.
+MSGS = 0x01
+DONE = 0x02
+
+# Writes stop being queued once this much is waiting on a viewer's socket.
+HIGH_WATER = 16384
+
+WINNERS = replay.WINNERS
+KINDS = {cls: name for name, cls in scenarios.ENEMY_TYPES.items()}
+
+
+def describe(game):
+    def base(o):
+        return {
+            "x": o.x,
+            "y": o.y,
+            "heading": o.heading,
+            "radius": o.radius,
+            "color": o.color,
+            "fill": o.fill,
+        }
+
+    enemies = []
+    for e in game.enemies:
+        spec = base(e)
+        spec["type"] = KINDS[type(e)]
+        spec["sight_distance"] = e.sight_distance
+        spec["sight_angle"] = e.sight_angle
+        spec["clear"] = e.sight_cone_color_clear
+        spec["seen"] = e.sight_cone_color_obj
+        enemies.append(spec)
+    return {
+        "version": VERSION,
+        "arena": [game.win_w, game.win_h],
+        "player": base(game.player),
+        "goals": [base(g) for g in game.goals],
+        "enemies": enemies,
+        "walls": [[w.x, w.y, w.w, w.h] for w in game.walls],
+    }
+
+
+class State:
+    # What viewers are shown of one tick of a game.
+    def __init__(self, game, index):
+        player = game.player
+        self.movers = [(0, player.x, player.y, player.heading, 0.0)]
+        for e in game.enemies:
+            seen = e.sight_cone_color == e.sight_cone_color_obj
+            self.movers.append((seen, e.x, e.y, e.heading, e.sight_distance))
+        self.touched = [g.touched for g in game.goals]
+        self.msgs = tuple((index[obj], msg[0]) for msg, obj, start in game.msgs)
+
+
+class Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.wake = asyncio.Event()
+        self.game = None
+        self.movers = None
+        self.touched = None
+        self.msgs = ()
+
+
+class StreamServer:
+    # Runs games headless and streams them to every connected viewer.
+    # hz paces the simulation in ticks per second of wall time; 0 runs it
+    # flat out.
+    def __init__(
+        self,
+        controller=sim.goal_seeker,
+        scenario=None,
+        seed=None,
+        games=1,
+        dt=1 / 60,
+        hz=60,
+        max_ticks=60 * 60 * 5,
+        wait=0,
+    ):
+        self.controller = controller
+        self.scenario = scenario
+        self.seed = seed
+        self.games = games
+        self.dt = dt
+        self.hz = hz
+        self.max_ticks = max_ticks
+        self.wait = wait
+        self.viewers = set()
+        self.joined = asyncio.Event()
+        self.game = None
+        self.index = None
+        self.over = False
+        self.done = False
+        self.state = None
+        self.state_key = None
+
+    def wake(self):
+        for viewer in self.viewers:
+            viewer.wake.set()
+
+    def current(self):
+        # One State per tick, shared by all the viewers sent that tick.
+        key = (self.game, self.game.tick, self.over)
+        if key != self.state_key:
+            self.state = State(self.game, self.index)
+            self.state_key = key
+        return self.state
+
+    def encode(self, viewer):
+        game = self.game
+        out = []
+        if viewer.game is not game:
+            hello = json.dumps(describe(game)).encode()
+            out.append(LENGTH.pack(len(hello) + 1) + bytes([HELLO]) + hello)
+            viewer.game = game
+            viewer.movers = [None] * len(self.index)
+            viewer.touched = [False] * len(game.goals)
+            viewer.msgs = ()
+        state = self.current()
+
+        movers = []
+        for i, (old, new) in enumerate(zip(viewer.movers, state.movers)):
+            if old != new:
+                movers.append(MOVER.pack(i, *new))
+        viewer.movers = state.movers
+        goals = [
+            GOAL.pack(i)
+            for i, (old, new) in enumerate(zip(viewer.touched, state.touched))
+            if new and not old
+        ]
+        viewer.touched = state.touched
+
+        flags = 0
+        parts = movers + goals
+        if state.msgs != viewer.msgs:
+            flags |= MSGS
+            parts.append(COUNT.pack(len(state.msgs)))
+            for i, text in state.msgs:
+                text = text.encode()
+                parts.append(MSG.pack(i, len(text)) + text)
+            viewer.msgs = state.msgs
+        if self.over:
+            flags |= DONE | WINNERS.index(game.winner) << 2
+
+        body = HEAD.pack(DELTA, game.tick, len(movers), len(goals), flags)
+        body += b"".join(parts)
+        out.append(LENGTH.pack(len(body)) + body)
+        return b"".join(out)
+
+    async def handle(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER)
+        viewer = Viewer(writer)
+        self.viewers.add(viewer)
+        if len(self.viewers) >= self.wait:
+            self.joined.set()
+        viewer.wake.set()
+        try:
+            while True:
+                await viewer.wake.wait()
+                viewer.wake.clear()
+                if self.game is None:
+                    continue
+                last = self.done
+                writer.write(self.encode(viewer))
+                # While this waits on a slow viewer the simulation keeps
+                # going; the next delta then skips straight to the latest
+                # tick.
+                await writer.drain()
+                if last:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            writer.close()
+
+    def start_game(self, game):
+        self.game = game
+        self.index = {o: i for i, o in enumerate(game.movers())}
+        self.over = False
+
+    async def simulate(self):
+        loop = asyncio.get_running_loop()
+        for i in range(self.games):
+            seed = None if self.seed is None else self.seed + i
+            clock = sim.VirtualClock()
+            game = sim.Game(clock=clock, seed=seed, scenario=self.scenario)
+            self.start_game(game)
+            next_tick = loop.time()
+            while game.run and game.tick < self.max_ticks:
+                clock.advance(self.dt)
+                game.step(self.dt, self.controller(game, self.dt))
+                self.wake()
+                if self.hz:
+                    next_tick += 1 / self.hz
+                    await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                else:
+                    await asyncio.sleep(0)
+            self.over = True
+            self.wake()
+            print(f"The winner is the {game.winner}.")
+            # Leave the end of a paced game up for a moment before the next.
+            if self.hz and i + 1 < self.games:
+                await asyncio.sleep(1.0)
+        self.done = True
+        self.wake()
+
+    async def serve(self, host="127.0.0.1", port=0, path=None, linger=5.0):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            for sock in server.sockets:
+                print(f"Streaming on {sock.getsockname()}")
+            if self.wait:
+                await self.joined.wait()
+            await self.simulate()
+            # Give viewers a chance to get the final delta.
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + linger
+            while self.viewers and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+
+
+def color(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class Scene:
+    # Stands in for a sim.Game as far as hw1_main.draw_frame is concerned,
+    # rebuilt from a HELLO and kept current by deltas.
+    def __init__(self, hello):
+        version = hello.get("version", 1)
+        if version not in (1, VERSION):
+            raise ValueError(f"unknown stream version {version}")
+        self.count = COUNT_V1 if version == 1 else COUNT
+        self.win_w, self.win_h = hello["arena"]
+        self.player = gobjs.Player(**self.spec(hello["player"]))
+        self.goals = [gobjs.Goal(**self.spec(g)) for g in hello["goals"]]
+        self.enemies = []
+        for spec in hello["enemies"]:
+            spec = self.spec(spec)
+            cls = scenarios.ENEMY_TYPES[spec.pop("type")]
+            angle = spec.pop("sight_angle")
+            clear = color(spec.pop("clear"))
+            seen = color(spec.pop("seen"))
+            e = cls(**spec)
+            e.sight_angle = angle
+            e.sight_cone_color_clear = clear
+            e.sight_cone_color_obj = seen
+            e.sight_cone_color = clear
+            self.enemies.append(e)
+        self.movers = [self.player] + self.enemies
+        self.walls = [gobjs.Wall(*w) for w in hello.get("walls", [])]
+        self.msgs = []
+        self.tick = 0
+        self.winner = None
+
+    def spec(self, spec):
+        spec = dict(spec)
+        spec["color"] = color(spec["color"])
+        return spec
+
+    def apply(self, data):
+        _, tick, movers, goals, flags = HEAD.unpack_from(data)
+        offset = HEAD.size
+        for _ in range(movers):
+            i, seen, x, y, heading, sight = MOVER.unpack_from(data, offset)
+            offset += MOVER.size
+            o = self.movers[i]
+            o.x = x
+            o.y = y
+            o.heading = heading
+            o.sight_distance = sight
+            if i:
+                if seen:
+                    o.sight_cone_color = o.sight_cone_color_obj
+                else:
+                    o.sight_cone_color = o.sight_cone_color_clear
+        for _ in range(goals):
+            (i,) = GOAL.unpack_from(data, offset)
+            offset += GOAL.size
+            self.goals[i].touch()
+        if flags & MSGS:
+            (count,) = self.count.unpack_from(data, offset)
+            offset += self.count.size
+            self.msgs = []
+            for _ in range(count):
+                i, n = MSG.unpack_from(data, offset)
+                offset += MSG.size
+                text = data[offset : offset + n].decode()
+                offset += n
+                # Same (msg, obj, start) shape as sim.MessageQueue yields.
+                self.msgs.append(((text,), self.movers[i], 0))
+        if flags & DONE:
+            self.winner = WINNERS[flags >> 2]
+        self.tick = tick
+
+
+class Client:
+    # Reads the stream on a background thread so the window never waits on
+    # the socket. Hold lock while touching scene.
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.scene = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def recv(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return bytes(data)
+
+    def read(self):
+        try:
+            while True:
+                (n,) = LENGTH.unpack(self.recv(LENGTH.size))
+                packet = self.recv(n)
+                with self.lock:
+                    if packet[0] == HELLO:
+                        self.scene = Scene(json.loads(packet[1:]))
+                    else:
+                        self.scene.apply(packet)
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.closed = True
+
+
+def connect(host="127.0.0.1", port=7777, path=None):
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+    else:
+        sock = socket.create_connection((host, port))
+    return sock
+
+
+def view(sock, fps=60):
+    client = Client(sock)
+    while client.scene is None and not client.closed:
+        client.thread.join(0.05)
+    if client.scene is None:
+        return None
+    size = (client.scene.win_w, client.scene.win_h)
+    display = hw1_main.init_display(*size)
+    while display.run:
+        display.clock.tick(fps)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                display.run = False
+        with client.lock:
+            scene = client.scene
+            if (scene.win_w, scene.win_h) != size:
+                size = (scene.win_w, scene.win_h)
+                display.screen = pygame.display.set_mode(size)
+            hud = [f"tick {scene.tick}"]
+            if scene.winner is not None:
+                hud.append(f"The winner is the {scene.winner}.")
+            hw1_main.draw_frame(display, scene, hud)
+        if client.closed:
+            display.run = False
+    return client.scene
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream games to viewers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--games", type=int, default=1)
+    serve.add_argument("--seed", type=int, default=None)
+    serve.add_argument("--controller", choices=sim.CONTROLLERS, default="goals")
+    serve.add_argument("--scenario", default=None, help="JSON or TOML scenario")
+    serve.add_argument("--max-ticks", type=int, default=60 * 60 * 5)
+    serve.add_argument(
+        "--hz", type=float, default=60, help="ticks per second, 0 for flat out"
+    )
+    serve.add_argument(
+        "--wait", type=int, default=0, help="viewers to wait for before starting"
+    )
+    watch = sub.add_parser("view")
+    watch.add_argument("--fps", type=int, default=60)
+    for p in (serve, watch):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=7777)
+        p.add_argument("--unix", default=None, help="Unix socket path")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        scenario = scenarios.load(args.scenario) if args.scenario else None
+        server = StreamServer(
+            sim.CONTROLLERS[args.controller],
+            scenario,
+            args.seed,
+            args.games,
+            hz=args.hz,
+            max_ticks=args.max_ticks,
+            wait=args.wait,
+        )
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    else:
+        scene = view(connect(args.host, args.port, args.unix), args.fps)
+        if scene is not None and scene.winner is not None:
+            print(f"The winner is the {scene.winner}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+import fsm
+import gobjs
+import scenarios
+import sim
+
+# Parameter sweeps over guard settings.
+#
+# A parameter is "<kind>.<attribute>" for the scenario's enemies of that
+# kind, e.g. blue.tick_set, blue.lunge or red.turn_rate, and is set the way
+# a scenario override is. Its values are given as
+#
+#   lo:hi:n   n evenly spaced values from lo to hi
+#   a,b,c     just these values
+#
+# Random search draws from lo..hi (or from the listed values). Values from
+# lo..hi are rounded to ints only when the attribute is an int on a default
+# enemy of that kind. Each game's
+# outcome is cached on disk under a hash of the parameters, the seed, the
+# rest of the game setup and the simulation source, so a rerun only plays
+# the games it hasn't seen and editing the simulation starts afresh.
+
+# Modules whose source decides how a game plays out.
+CODE = (gobjs, fsm, sim, scenarios)
+CACHE_DIR = ".sweep_cache"
+
+
+def code_version():
+    digest = hashlib.sha256()
+    for module in CODE:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class Param:
+    def __init__(self, name, values, lo=None, hi=None):
+        kind, _, attr = name.partition(".")
+        if kind not in scenarios.ENEMY_TYPES or not attr:
+            raise ValueError(f"{name}: expected <yellow|blue|red>.<attribute>")
+        self.name = name
+        self.kind = kind
+        self.attr = attr
+        self.values = values
+        self.lo = lo
+        self.hi = hi
+        # A throwaway rng keeps the default enemy off the global stream.
+        default = scenarios.ENEMY_TYPES[kind](0, 0, rng=random.Random(0))
+        value = getattr(default, attr, None)
+        self.integer = isinstance(value, int) and not isinstance(value, bool)
+
+    def sample(self, rng):
+        if self.lo is None:
+            return rng.choice(self.values)
+        if self.integer:
+            return rng.randint(math.ceil(self.lo), math.floor(self.hi))
+        return rng.uniform(self.lo, self.hi)
+
+
+def number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text else value
+
+
+def parse_param(spec):
+    name, _, values = spec.partition("=")
+    if ":" in values:
+        lo, hi, n = values.split(":")
+        lo = number(lo)
+        hi = number(hi)
+        n = int(n)
+        param = Param(name, [lo], lo, hi)
+        if n >= 2:
+            grid = [lo + (hi - lo) * i / (n - 1) for i in range(n)]
+            if param.integer:
+                grid = sorted(set(round(v) for v in grid))
+            param.values = grid
+        return param
+    return Param(name, [number(v) for v in values.split(",")])
+
+
+def grid(params):
+    names = [p.name for p in params]
+    return [
+        dict(zip(names, vs)) for vs in itertools.product(*(p.values for p in params))
+    ]
+
+
+def sample(params, n, rng):
+    return [{p.name: p.sample(rng) for p in params} for _ in range(n)]
+
+
+def configure(base, config):
+    # base with config's overrides applied to its enemies, as a Scenario.
+    data = json.loads(json.dumps(base))
+    for name, value in config.items():
+        kind, _, attr = name.partition(".")
+        for spec in data["enemies"]:
+            if spec["type"] == kind:
+                spec[attr] = value
+    return scenarios.from_dict(data)
+
+
+def play(job):
+    # Runs in a worker process.
+    base, config, seed, controller, max_ticks = job
+    game = sim.run_headless(
+        sim.CONTROLLERS[controller],
+        max_ticks=max_ticks,
+        seed=seed,
+        scenario=configure(base, config),
+    )
+    return game.winner, game.tick
+
+
+class Cache:
+    # One small JSON file per game, named by the hash of what decided it.
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + ".json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+
+class Sweep:
+    # Plays games for configurations, through the cache. Scores are the AI's
+    # win rate over the games played so far, which is what guard tuning
+    # wants to push up.
+    def __init__(
+        self,
+        base=None,
+        controller="goals",
+        max_ticks=60 * 60 * 5,
+        workers=None,
+        cache=None,
+    ):
+        if base is None:
+            base = scenarios.classic()
+        self.base = base.to_dict()
+        self.controller = controller
+        self.max_ticks = max_ticks
+        self.workers = workers or os.cpu_count()
+        self.cache = cache or Cache()
+        self.code = code_version()
+        self.results = {}
+
+    def key(self, config, seed):
+        blob = json.dumps(
+            {
+                "params": config,
+                "seed": seed,
+                "scenario": self.base,
+                "controller": self.controller,
+                "max_ticks": self.max_ticks,
+                "swept": gobjs.SWEPT,
+                "code": self.code,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def run(self, configs, seeds):
+        # Makes sure every config has a result for every seed.
+        todo = []
+        for i, config in enumerate(configs):
+            results = self.results.setdefault(label(config), {})
+            for seed in seeds:
+                if seed in results:
+                    continue
+                key = self.key(config, seed)
+                result = self.cache.get(key)
+                if result is None:
+                    todo.append((i, seed, key))
+                else:
+                    results[seed] = result
+        if not todo:
+            return
+        jobs = [
+            (self.base, configs[i], seed, self.controller, self.max_ticks)
+            for i, seed, _ in todo
+        ]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            outcomes = pool.map(play, jobs, chunksize=max(1, len(jobs) // 64))
+            for (i, seed, key), (winner, ticks) in zip(todo, outcomes):
+                result = {"winner": winner, "ticks": ticks}
+                self.cache.put(key, result)
+                self.results[label(configs[i])][seed] = result
+
+    def score(self, config, seeds=None):
+        results = self.results.get(label(config), {})
+        if seeds is not None:
+            results = {s: results[s] for s in seeds if s in results}
+        if not results:
+            return 0.0, 0
+        wins = sum(r["winner"] == "AI" for r in results.values())
+        return wins / len(results), len(results)
+
+    def evaluate(self, configs, seeds):
+        self.run(configs, seeds)
+        return sorted(configs, key=lambda c: -self.score(c, seeds)[0])
+
+    def halving(self, configs, seeds, min_seeds=8, eta=3):
+        # Successive halving: every config plays min_seeds games, the best
+        # 1/eta of them go on to eta times as many, and so on until one is
+        # left or the seeds run out. Returns the survivors of each round.
+        rounds = []
+        n = min_seeds
+        while True:
+            round_seeds = seeds[:n]
+            configs = self.evaluate(configs, round_seeds)
+            rounds.append((configs, round_seeds))
+            if len(configs) <= 1 or n >= len(seeds):
+                return rounds
+            configs = configs[: max(1, len(configs) // eta)]
+            n = min(n * eta, len(seeds))
+
+
+def label(config):
+    return json.dumps(config, sort_keys=True)
+
+
+def report(sweep, configs, seeds, top):
+    for config in configs[:top]:
+        rate, games = sweep.score(config, seeds)
+        text = " ".join(f"{k}={v:g}" for k, v in config.items())
+        print(f"  AI {rate:.3f} over {games:>4} games  {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep guard parameters.")
+    parser.add_argument(
+        "params",
+        nargs="+",
+        help="kind.attribute=lo:hi:n or kind.attribute=a,b,c, e.g. blue.lunge=3:6:4",
+    )
+    parser.add_argument(
+        "--search", choices=("grid", "random", "halving"), default="grid"
+    )
+    parser.add_argument(
+        "--samples", type=int, default=20, help="configs to draw for random and halving"
+    )
+    parser.add_argument("--seeds", type=int, default=50)
+    parser.add_argument("--min-seeds", type=int, default=8, help="first halving round")
+    parser.add_argument("--eta", type=int, default=3, help="halving keep 1/eta")
+    parser.add_argument("--seed", type=int, default=0, help="random search seed")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-ticks", type=int, default=60 * 60 * 5)
+    parser.add_argument("--controller", choices=sim.CONTROLLERS, default="goals")
+    parser.add_argument("--scenario", default=None, help="JSON or TOML scenario")
+    parser.add_argument("--cache", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    params = [parse_param(p) for p in args.params]
+    base = scenarios.load(args.scenario) if args.scenario else None
+    sweep = Sweep(
+        base, args.controller, args.max_ticks, args.workers, Cache(args.cache)
+    )
+    seeds = list(range(args.seeds))
+    search = args.search
+    if search == "grid":
+        configs = grid(params)
+    else:
+        configs = sample(params, args.samples, random.Random(args.seed))
+
+    if search == "halving":
+        for i, (survivors, round_seeds) in enumerate(
+            sweep.halving(configs, seeds, args.min_seeds, args.eta)
+        ):
+            print(f"Round {i}: {len(survivors)} configs, {len(round_seeds)} seeds")
+            report(sweep, survivors, round_seeds, args.top)
+    else:
+        report(sweep, sweep.evaluate(configs, seeds), seeds, args.top)
+    cache = sweep.cache
+    print(f"{cache.misses} games played, {cache.hits} from the cache.")
+
+
+if __name__ == "__main__":
+    main()
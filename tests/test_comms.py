@@ -0,0 +1,33 @@
+import math
+import gobjs
+
+
+def agent(x, y, comms_radius=None):
+    a = gobjs.Enemy(x, y, 10, 100, 1, 0, 100, "yellow", 0, [])
+    a.comms_radius = comms_radius
+    return a
+
+
+def test_radius_follows_receivers_that_move():
+    index = gobjs.SpatialHash()
+    bus = gobjs.CommsBus(index)
+    sender = agent(0, 0, comms_radius=200)
+    receiver = agent(500, 0)
+    for a in (sender, receiver):
+        index.insert(a)
+    bus.mailbox(sender, ["Y"])
+    box = bus.mailbox(receiver, ["Y"])
+
+    bus.publish(sender, "Y", (1, 2))
+    bus.deliver()
+    assert box["Y"] is None
+
+    # The value never changes, but the receiver walks into range and out.
+    receiver.heading = math.pi
+    receiver.move(3.0)
+    bus.deliver()
+    assert box["Y"] == (1, 2)
+    receiver.heading = 0.0
+    receiver.move(3.0)
+    bus.deliver()
+    assert box["Y"] is None
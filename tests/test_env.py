@@ -0,0 +1,29 @@
+import threading
+import numpy as np
+import pytest
+import env
+
+STAY = 4
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_finished_envs_keep_their_last_observation(workers):
+    single = env.Env(max_ticks=5)
+    single.reset(seed=7)
+    with env.VecEnv(2, workers, max_ticks=5) as venv:
+        venv.reset(7)
+        for _ in range(5):
+            last = single.step(STAY)[0]
+            obs, _, terminated, truncated, info = venv.step([STAY, STAY])
+        assert truncated.all() and not terminated.any()
+        assert np.array_equal(info["final_obs"][0], last)
+        # obs already holds the next game.
+        assert obs[0, -1] == 0.0
+
+
+def test_worker_failure_breaks_the_barrier():
+    venv = env.VecEnv(1, 1)
+    venv.reset(0)
+    with pytest.raises(threading.BrokenBarrierError):
+        venv.step([np.nan])
+    venv.close()
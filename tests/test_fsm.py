@@ -0,0 +1,67 @@
+import fsm
+import scenarios
+import sim
+
+TICKS = 120
+
+
+def far_game(lod):
+    # A spinning Blue and a wandering Yellow far from a player that stays
+    # put, so with lod they only ever run every far ticks.
+    scenario = scenarios.from_dict(
+        {
+            "arena": [4000, 4000],
+            "starts": [[100, 100, 0]],
+            "goals": [[1000, 1000], [3000, 3000]],
+            "enemies": [
+                {"type": "blue", "x": 2000, "y": 2000, "heading": 0},
+                {"type": "yellow", "x": 2600, "y": 2400, "heading": 0},
+            ],
+        }
+    )
+    clock = sim.VirtualClock()
+    game = sim.Game(clock=clock, seed=0, scenario=scenario)
+    if lod:
+        game.scheduler = fsm.Scheduler(game.win_w, game.win_h)
+    for g in game.goals:
+        g.touched = True
+    for e in game.enemies:
+        e.message_active = True
+        e.message_cooldown = TICKS + 10
+    for _ in range(TICKS):
+        clock.advance(1 / 60)
+        game.step(1 / 60, (0, 0))
+    return game
+
+
+def test_skipped_agents_catch_up_per_tick_effects():
+    full = far_game(False)
+    lod = far_game(True)
+    far = lod.scheduler.far
+    assert lod.scheduler.ran < len(lod.enemies)
+    for a, b in zip(full.enemies, lod.enemies):
+        assert a.state == b.state
+        # Caught up at each run, so behind by less than one period.
+        assert 0 <= b.message_cooldown - a.message_cooldown < far
+    blue_full, blue_lod = full.enemies[0], lod.enemies[0]
+    touched = len(full.goals)
+    assert 0 <= blue_full.sight_distance - blue_lod.sight_distance < touched * far
+
+
+def test_timers_count_game_time():
+    # Classic enemies are Yellow, Blue, Red.
+    game = sim.Game(seed=0)
+    yellow, blue, _ = game.enemies
+    unseen = (False, None)
+    yellow.state = "chase"
+    yellow.ticks = 5
+    yellow.ai(unseen, game.goals, game.mailboxes[0], 4 / 60)
+    assert yellow.ticks == 1
+    blue.state = "dash"
+    blue.ticks = 60
+    blue.sight_distance = blue.sight_distance_original + 120
+    blue.sight_dec = 3.0
+    blue.ai(unseen, game.goals, game.mailboxes[1], 1.0)
+    assert blue.ticks == 0
+    # A long step stops the decay at the original sight.
+    assert blue.sight_distance == blue.sight_distance_original
@@ -0,0 +1,37 @@
+import math
+import os
+import random
+import pytest
+import scenarios
+import sim
+from conftest import ROOT
+
+
+@pytest.mark.parametrize(
+    "preset, ticks", [("stress_10k.json", 60), ("swarm_1k.toml", 600)]
+)
+def test_stress_preset_runs_without_ending(preset, ticks):
+    # The player stays at its start, so only the guards could end it.
+    scenario = scenarios.load(os.path.join(ROOT, "presets", preset))
+    game = sim.run_headless(
+        sim.idle_controller, max_ticks=ticks, seed=0, scenario=scenario
+    )
+    assert game.run, game.winner
+    assert game.tick == ticks
+
+
+def test_scatter_starts_inside_facing_in():
+    specs = scenarios.scatter("yellow", 500, 4000, 2000, random.Random(0))
+    for spec in specs:
+        assert 200 <= spec["x"] <= 3800
+        assert 200 <= spec["y"] <= 1800
+        inward = math.atan2(1000 - spec["y"], 2000 - spec["x"])
+        off = (spec["heading"] - inward + math.pi) % (2 * math.pi) - math.pi
+        assert abs(off) <= math.pi / 4 + 1e-9
+
+
+def test_offscreen_ends_round_trips():
+    scenario = scenarios.stress(30, 1000, 1000, 4, offscreen_ends=False)
+    again = scenarios.from_dict(scenario.to_dict())
+    assert again.offscreen_ends is False
+    assert scenarios.from_dict(scenarios.classic().to_dict()).offscreen_ends
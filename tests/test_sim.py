@@ -0,0 +1,55 @@
+import os
+import pytest
+import scenarios
+import sim
+from conftest import ROOT
+
+SEEDS = range(100)
+GAME_SECONDS = 5 * 60
+
+
+def endings(dt):
+    # Shares of goal_seeker games won by the AI and ended by something
+    # leaving the arena.
+    ai = 0
+    left = 0
+    for seed in SEEDS:
+        game = sim.run_headless(
+            sim.goal_seeker, dt=dt, max_ticks=round(GAME_SECONDS / dt), seed=seed
+        )
+        ai += game.winner == "AI"
+        if game.winner == "Player":
+            left += game.goal_count < len(game.goals)
+        elif game.winner == "AI":
+            left += not game.player.onscreen(game.d_rect)
+    return ai / len(SEEDS), left / len(SEEDS)
+
+
+@pytest.fixture(scope="module")
+def base():
+    return endings(1 / 60)
+
+
+@pytest.mark.parametrize("multiple", [4, 10])
+def test_outcomes_hold_across_timesteps(base, multiple):
+    ai, left = endings(multiple / 60)
+    assert abs(ai - base[0]) < 0.2
+    assert abs(left - base[1]) < 0.1
+
+
+def positions(games, ticks):
+    # Steps the games in turn and returns each one's enemy positions.
+    trace = [[] for _ in games]
+    for _ in range(ticks):
+        for game, out in zip(games, trace):
+            game.clock.advance(1 / 60)
+            game.step(1 / 60, sim.goal_seeker(game, 1 / 60))
+            out.append([(e.x, e.y) for e in game.enemies])
+    return trace
+
+
+def test_games_with_different_layouts_share_a_process():
+    walls = scenarios.load(os.path.join(ROOT, "presets", "walls.json"))
+    alone = [positions([sim.Game(seed=3, scenario=s)], 300)[0] for s in (None, walls)]
+    together = positions([sim.Game(seed=3), sim.Game(seed=3, scenario=walls)], 300)
+    assert together == alone
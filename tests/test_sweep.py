@@ -0,0 +1,15 @@
+import random
+import sweep
+
+
+def test_float_attribute_keeps_its_grid():
+    param = sweep.parse_param("blue.lunge=3:6:3")
+    assert param.values == [3.0, 4.5, 6.0]
+    assert isinstance(param.sample(random.Random(0)), float)
+
+
+def test_int_attribute_rounds_its_grid():
+    param = sweep.parse_param("blue.tick_set=30:60:4")
+    assert param.values == [30, 40, 50, 60]
+    assert all(isinstance(v, int) for v in param.values)
+    assert isinstance(param.sample(random.Random(0)), int)
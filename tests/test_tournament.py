@@ -0,0 +1,32 @@
+from concurrent.futures import Future
+import tournament
+
+
+class Recorder:
+    # Stands in for the process pool: every game is a draw, done at once.
+    submitted = 0
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, job):
+        Recorder.submitted += 1
+        future = Future()
+        future.set_result(("Draw", 0))
+        return future
+
+
+def test_in_flight_games_stay_under_the_cap(monkeypatch):
+    monkeypatch.setattr(tournament, "ProcessPoolExecutor", Recorder)
+    Recorder.submitted = 0
+    games = tournament.tournament(range(3), workers=1)
+    next(games)
+    # Eight combos, but no more than workers * 2 submitted before a result.
+    assert Recorder.submitted <= 2
+    games.close()
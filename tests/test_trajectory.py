@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+import numpy as np
+import trajectory
+
+
+class FakeGame:
+    # Just what Writer reads, with more movers than fit in 16 bits.
+    def __init__(self, enemies):
+        self.tick = 0
+        self.seed = 0
+        self.winner = "Draw"
+        self.player = SimpleNamespace(x=1.0, y=2.0, heading=0.0)
+        self.enemies = [
+            SimpleNamespace(
+                x=float(i), y=0.0, heading=0.0, state="wander", sight_distance=1.0
+            )
+            for i in range(enemies)
+        ]
+        self.percepts = [(False, None, 0.0)] * enemies
+        self.actions = [(0.0, 0.0, None)] * enemies
+        self.mailboxes = [SimpleNamespace(own={})] * enemies
+
+    def movers(self):
+        return [self.player] + self.enemies
+
+
+def test_entity_ids_past_16_bits(tmp_path):
+    game = FakeGame(70000)
+    writer = trajectory.Writer(str(tmp_path), game)
+    writer.tick((0, 0))
+    writer.close()
+
+    traj = trajectory.Trajectory(str(tmp_path))
+    entity = traj.column("entity")
+    x = traj.column("x")
+    assert traj.rows == 70001
+    assert entity.max() == 70000
+    np.testing.assert_array_equal(entity, np.arange(70001))
+    assert x[entity == 66000][0] == 65999.0
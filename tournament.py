@@ -0,0 +1,155 @@
+import argparse
+import itertools
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import gobjs
+import sim
+
+OUTCOMES = ("Player", "Draw", "AI")
+
+
+def set_enabled(enabled):
+    gobjs.YELLOW_ENABLED, gobjs.BLUE_ENABLED, gobjs.RED_ENABLED = enabled
+
+
+def play(job):
+    # Runs in a worker process. job is (enabled, start, seed, controller,
+    # max_ticks) where enabled is the (yellow, blue, red) switch tuple.
+    enabled, start, seed, controller, max_ticks = job
+    set_enabled(enabled)
+    game = sim.run_headless(
+        sim.CONTROLLERS[controller], max_ticks=max_ticks, start=start, seed=seed
+    )
+    return game.winner, game.tick
+
+
+def wilson(successes, n, z=1.96):
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return (max(0.0, center - half), min(1.0, center + half))
+
+
+class Tally:
+    def __init__(self):
+        self.counts = {o: 0 for o in OUTCOMES}
+        self.games = 0
+
+    def add(self, winner):
+        self.counts[winner] += 1
+        self.games += 1
+
+    def rates(self, z=1.96):
+        return {
+            o: (self.counts[o] / max(self.games, 1),)
+            + wilson(self.counts[o], self.games, z)
+            for o in OUTCOMES
+        }
+
+    def widest(self, z=1.96):
+        return max(hi - lo for _, lo, hi in self.rates(z).values())
+
+
+def label(enabled):
+    names = [n for n, on in zip("YBR", enabled) if on]
+    return "".join(names) if names else "-"
+
+
+def combo_jobs(enabled, seeds, n_starts, controller, max_ticks):
+    for seed in seeds:
+        for start in range(n_starts):
+            yield (enabled, start, seed, controller, max_ticks)
+
+
+def tournament(
+    seeds,
+    combos=None,
+    controller="goals",
+    max_ticks=60 * 60 * 5,
+    workers=None,
+    ci_width=0.05,
+    min_games=50,
+    z=1.96,
+):
+    # Yields (enabled, winner, tally) for every game as it finishes. A combo
+    # stops getting new games once every outcome's interval is narrower
+    # than ci_width.
+    if combos is None:
+        combos = list(itertools.product((True, False), repeat=3))
+    n_starts = len(sim.start_locations(gobjs.WIDTH, gobjs.HEIGHT))
+    tallies = {c: Tally() for c in combos}
+    jobs = {c: combo_jobs(c, seeds, n_starts, controller, max_ticks) for c in combos}
+    workers = workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        open_combos = list(combos)
+        while open_combos or pending:
+            # Round robin over the open combos so each one fills in evenly:
+            # a combo goes to the back once it has had a game submitted, and
+            # the cap is checked before every submit.
+            while open_combos and len(pending) < workers * 2:
+                c = open_combos.pop(0)
+                job = next(jobs[c], None)
+                if job is None:
+                    continue
+                pending[pool.submit(play, job)] = c
+                open_combos.append(c)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                c = pending.pop(future)
+                if future.cancelled():
+                    continue
+                winner, _ = future.result()
+                tally = tallies[c]
+                tally.add(winner)
+                yield c, winner, tally
+                if (
+                    c in open_combos
+                    and tally.games >= min_games
+                    and tally.widest(z) <= ci_width
+                ):
+                    open_combos.remove(c)
+                    for f, fc in list(pending.items()):
+                        if fc == c and f.cancel():
+                            del pending[f]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate win rates over many games.")
+    parser.add_argument("--seeds", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--ci-width", type=float, default=0.05)
+    parser.add_argument("--min-games", type=int, default=50)
+    parser.add_argument("--max-ticks", type=int, default=60 * 60 * 5)
+    parser.add_argument("--controller", choices=sim.CONTROLLERS, default="goals")
+    args = parser.parse_args()
+
+    tallies = {}
+    for enabled, winner, tally in tournament(
+        range(args.seeds),
+        controller=args.controller,
+        max_ticks=args.max_ticks,
+        workers=args.workers,
+        ci_width=args.ci_width,
+        min_games=args.min_games,
+    ):
+        tallies[enabled] = tally
+        print(f"{label(enabled):>3} game {tally.games}: {winner}", flush=True)
+
+    print()
+    for enabled, tally in tallies.items():
+        parts = []
+        for o, (p, lo, hi) in tally.rates().items():
+            parts.append(f"{o} {p:.3f} [{lo:.3f}, {hi:.3f}]")
+        print(f"{label(enabled):>3} ({tally.games} games): " + ", ".join(parts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import json
+import math
+import os
+import queue
+import threading
+from array import array
+import numpy as np
+
+# Per-tick trajectories as columnar NPY files.
+#
+# Every tick adds one row per mover, the player first and then the enemies
+# in game order. Rows are buffered per column and every chunk_rows rows
+# become one chunk directory, chunk_NNNNN/<column>.npy, written from a
+# background thread. meta.json, written by close(), lists the columns, the
+# row count of each chunk and the tables that the id columns index into.
+# Chunks load with mmap_mode="r", so a reader only pages in the columns and
+# chunks it touches.
+#
+# Positions, heading, sight and ticks are after the step; percepts and AI
+# outputs are what the enemy saw and did during it. Columns the player does
+# not have are -1, or NaN for floats.
+
+# name, array typecode, numpy dtype
+COLUMNS = (
+    ("tick", "I", "<u4"),
+    ("entity", "I", "<u4"),
+    ("x", "f", "<f4"),
+    ("y", "f", "<f4"),
+    ("heading", "f", "<f4"),
+    # Index into meta["states"].
+    ("state", "h", "<i2"),
+    ("ticks", "f", "<f4"),
+    ("sight", "f", "<f4"),
+    # Percept: whether the player was seen and how far away.
+    ("seen", "b", "<i1"),
+    ("dist", "f", "<f4"),
+    ("turn", "f", "<f4"),
+    ("move", "f", "<f4"),
+    # Message said this tick, as an index into meta["strings"].
+    ("said", "i", "<i4"),
+    # The value the enemy has published on the comms bus: a position in
+    # comms_x and comms_y or a string in comms_text.
+    ("comms_x", "f", "<f4"),
+    ("comms_y", "f", "<f4"),
+    ("comms_text", "i", "<i4"),
+)
+
+CHUNK_ROWS = 1 << 16
+
+NAN = math.nan
+
+
+class Writer:
+    # Call tick(action) after every Game.step and close() once the game is
+    # over.
+    def __init__(self, directory, game, chunk_rows=CHUNK_ROWS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.game = game
+        self.chunk_rows = chunk_rows
+        self.strings = {}
+        self.states = {}
+        self.chunks = []
+        self.rows = 0
+        self.new_buffers()
+        # A few chunks can queue up before tick() waits for the writer.
+        self.queue = queue.Queue(4)
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def new_buffers(self):
+        self.buffers = [array(code) for _, code, _ in COLUMNS]
+
+    def string(self, text):
+        if text is None:
+            return -1
+        return self.strings.setdefault(text, len(self.strings))
+
+    def state(self, name):
+        if name is None:
+            return -1
+        return self.states.setdefault(name, len(self.states))
+
+    def tick(self, action):
+        game = self.game
+        (
+            tick,
+            entity,
+            x,
+            y,
+            heading,
+            state,
+            ticks,
+            sight,
+            seen,
+            dist,
+            turn,
+            move,
+            said,
+            comms_x,
+            comms_y,
+            comms_text,
+        ) = self.buffers
+
+        p = game.player
+        tick.append(game.tick)
+        entity.append(0)
+        x.append(p.x)
+        y.append(p.y)
+        heading.append(p.heading)
+        state.append(-1)
+        ticks.append(NAN)
+        sight.append(NAN)
+        seen.append(-1)
+        dist.append(NAN)
+        turn.append(action[0])
+        move.append(action[1])
+        said.append(-1)
+        comms_x.append(NAN)
+        comms_y.append(NAN)
+        comms_text.append(-1)
+
+        rows = zip(game.enemies, game.percepts, game.actions, game.mailboxes)
+        for i, (e, percept, act, mailbox) in enumerate(rows, 1):
+            tick.append(game.tick)
+            entity.append(i)
+            x.append(e.x)
+            y.append(e.y)
+            heading.append(e.heading)
+            state.append(self.state(e.state))
+            ticks.append(getattr(e, "ticks", NAN))
+            sight.append(e.sight_distance)
+            seen.append(percept[0])
+            dist.append(percept[2] if percept[0] else NAN)
+            turn.append(act[0])
+            move.append(act[1])
+            said.append(-1 if act[2] is None else self.string(act[2][0]))
+            value = None
+            for value in mailbox.own.values():
+                break
+            if isinstance(value, str):
+                comms_x.append(NAN)
+                comms_y.append(NAN)
+                comms_text.append(self.string(value))
+            elif value is not None:
+                comms_x.append(value.x)
+                comms_y.append(value.y)
+                comms_text.append(-1)
+            else:
+                comms_x.append(NAN)
+                comms_y.append(NAN)
+                comms_text.append(-1)
+
+        if len(tick) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        rows = len(self.buffers[0])
+        if not rows:
+            return
+        if self.error is not None:
+            raise self.error
+        self.queue.put((len(self.chunks), self.buffers))
+        self.chunks.append(rows)
+        self.rows += rows
+        self.new_buffers()
+
+    def drain(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            if self.error is not None:
+                continue
+            n, buffers = job
+            try:
+                chunk = os.path.join(self.directory, f"chunk_{n:05d}")
+                os.makedirs(chunk, exist_ok=True)
+                for (name, _, dtype), buf in zip(COLUMNS, buffers):
+                    data = np.frombuffer(buf, dtype=buf.typecode).astype(dtype)
+                    np.save(os.path.join(chunk, name + ".npy"), data)
+            except Exception as exc:
+                self.error = exc
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        game = self.game
+        meta = {
+            "columns": {name: dtype for name, _, dtype in COLUMNS},
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "entities": [type(o).__name__ for o in game.movers()],
+            "states": list(self.states),
+            "strings": list(self.strings),
+            "seed": game.seed,
+            "winner": game.winner,
+            "ticks": game.tick,
+        }
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+
+
+class Trajectory:
+    # Reads what a Writer wrote, one memory mapped chunk at a time.
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.columns = list(self.meta["columns"])
+        self.rows = self.meta["rows"]
+
+    def load(self, n, name):
+        path = os.path.join(self.directory, f"chunk_{n:05d}", name + ".npy")
+        return np.load(path, mmap_mode="r")
+
+    def chunks(self, *columns):
+        # Yields {column: array} per chunk, for all columns if none are named.
+        columns = columns or self.columns
+        for n in range(len(self.meta["chunks"])):
+            yield {name: self.load(n, name) for name in columns}
+
+    def column(self, name):
+        # The whole column in memory, for when it fits.
+        parts = [self.load(n, name) for n in range(len(self.meta["chunks"]))]
+        if not parts:
+            return np.empty(0, self.meta["columns"][name])
+        return np.concatenate(parts)
+
+    def string(self, index):
+        return None if index < 0 else self.meta["strings"][index]
+
+    def state(self, index):
+        return None if index < 0 else self.meta["states"][index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize recorded trajectories.")
+    parser.add_argument("directories", nargs="+")
+    args = parser.parse_args()
+    for directory in args.directories:
+        traj = Trajectory(directory)
+        meta = traj.meta
+        said = 0
+        seen = np.zeros(len(meta["entities"]), np.int64)
+        for chunk in traj.chunks("entity", "seen", "said"):
+            said += int((chunk["said"] >= 0).sum())
+            seen += np.bincount(chunk["entity"][chunk["seen"] > 0], minlength=len(seen))
+        print(
+            f"{directory}: {meta['ticks']} ticks, {traj.rows} rows in "
+            f"{len(meta['chunks'])} chunks, winner {meta['winner']}, "
+            f"{said} messages."
+        )
+        for i, kind in enumerate(meta["entities"][1:], 1):
+            print(f"  {i} {kind}: saw the player on {seen[i]} ticks")
+
+
+if __name__ == "__main__":
+    main()